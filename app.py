@@ -1,18 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import os
 import uuid
 from pathlib import Path
 import shutil
-import librosa
-import soundfile as sf
-import numpy as np
-from scipy import signal
+import asyncio
+import threading
 import logging
 
+import metrics
+import progress
+from metrics import stage_timer, track_job
+from profiling import ProfilingMiddleware, create_profile_router, follow
+from services.warmup import configure_jit_cache
+from shared_state import get_state_backend
+
+# Must happen before anything imports librosa/numba
+configure_jit_cache(os.getenv("JIT_CACHE_DIR", "cache/numba"))
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,6 +37,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request latency for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Opt-in request profiling for admins; a no-op unless PROFILE_TOKEN is set
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+app.add_middleware(ProfilingMiddleware, token=PROFILE_TOKEN, output_dir=PROFILE_DIR)
+app.include_router(create_profile_router(PROFILE_TOKEN, PROFILE_DIR), prefix="/debug/profiles", tags=["Profiling"])
+
 # Create directories
 UPLOAD_DIR = Path("uploads")
 PROCESSED_DIR = Path("processed")
@@ -40,54 +58,110 @@ try:
 except Exception as e:
     logger.warning(f"Could not mount static files: {e}")
 
+# Job status, results and rate limits are shared by every worker process
+state = get_state_backend()
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RESULT_TTL = int(os.getenv("RESULT_TTL_SECONDS", "86400"))
+
+# "spectral" (HPSS + REPET soft masks) or "band_pass" (the original filter split)
+SEPARATION_METHOD = os.getenv("SEPARATION_METHOD", "spectral")
+
 def separate_audio_simple(input_path, output_dir):
     """
     Simple frequency-based audio separation
     Separates vocals (mid frequencies) from instruments (other frequencies)
     """
+    # librosa and scipy take seconds to import, so load them on first use
+    from services import audio_io, dsp
+
     logger.info(f"Loading audio file: {input_path}")
     
-    # Load audio
-    y, sr = librosa.load(input_path, sr=44100, mono=False)
-    
-    # Convert to mono if stereo
-    if len(y.shape) > 1:
-        y = librosa.to_mono(y)
-    
-    logger.info("Separating audio using frequency analysis...")
-    
-    # Vocals (mid frequencies: 200Hz - 3000Hz)
-    sos_vocals = signal.butter(4, [200, 3000], 'bandpass', fs=sr, output='sos')
-    vocals = signal.sosfilt(sos_vocals, y)
-    
-    # Instruments (everything else)
-    instruments = y - vocals
-    
-    # Normalize
-    vocals = vocals / np.max(np.abs(vocals) + 1e-6) * 0.9
-    instruments = instruments / np.max(np.abs(instruments) + 1e-6) * 0.9
-    
-    # Save files
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    vocals_path = output_dir / "vocals.wav"
-    instruments_path = output_dir / "accompaniment.wav"
-    
-    logger.info(f"Saving vocals to: {vocals_path}")
-    sf.write(str(vocals_path), vocals, sr)
-    
-    logger.info(f"Saving instruments to: {instruments_path}")
-    sf.write(str(instruments_path), instruments, sr)
+    with track_job("separator") as job:
+        # Load audio
+        # (channels, samples) at the native rate: every channel is filtered in
+        # the same call and the filters are designed for whatever rate arrives
+        y, sr = audio_io.load(input_path, None, "separator", mono=False)
+        job.audio_seconds = audio_io.duration(y, sr)
+
+        logger.info("Separating audio using frequency analysis...")
+
+        with stage_timer("separator", "filter_bank"):
+            # Vocals (mid frequencies: 200Hz - 3000Hz); the design is cached per rate
+            sos_vocals = dsp.butter(4, [200, 3000], 'bandpass', sr)
+            vocals = dsp.sosfilt(sos_vocals, y)
+
+            # Instruments (everything else), so the two sum back to the input
+            instruments = y - vocals
+
+        # Save files
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        vocals_path = output_dir / "vocals.wav"
+        instruments_path = output_dir / "accompaniment.wav"
+
+        # Normalize and encode both stems at once
+        logger.info(f"Saving vocals to: {vocals_path} and instruments to: {instruments_path}")
+        outputs = [("vocals", str(vocals_path), vocals), ("accompaniment", str(instruments_path), instruments)]
+        for name, path in audio_io.write_parallel(outputs, sr, "separator", target=0.9, eps=1e-6):
+            progress.output("separator", name, path)
     
     return str(vocals_path), str(instruments_path)
 
+_spectral_separator = None
+
+def separate_audio_spectral(input_path, output_dir):
+    """
+    Spectral soft-mask separation: harmonic, non-repeating content is kept as vocals
+    """
+    global _spectral_separator
+    if _spectral_separator is None:
+        from services.spectral_separator import SpectralSeparator
+        _spectral_separator = SpectralSeparator()
+    logger.info(f"Loading audio file: {input_path}")
+    return _spectral_separator.separate_file(input_path, output_dir)
+
+SEPARATORS = {
+    "spectral": separate_audio_spectral,
+    "band_pass": separate_audio_simple,
+}
+
+_ready = threading.Event()
+
+def warm_up():
+    """Import the DSP stack and run one separation to compile JIT kernels"""
+    import tempfile
+    from services import warmup
+
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+        with tempfile.TemporaryDirectory(prefix="warmup_") as workdir:
+            native = warmup.write_test_audio(workdir, sample_rate=44100, name="native.wav")
+            resampled = warmup.write_test_audio(workdir, sample_rate=48000, name="resampled.wav")
+            warmup.run_calls([
+                ("separate", lambda: separate_audio_simple(native, workdir)),
+                ("separate_48k", lambda: separate_audio_simple(resampled, workdir)),
+                ("separate_spectral", lambda: separate_audio_spectral(native, workdir)),
+            ])
+    else:
+        import librosa
+        from scipy import signal
+    _ready.set()
+    logger.info("Audio libraries loaded")
+
+def preload():
+    """Load and warm the DSP stack in the parent before prefork.py forks workers"""
+    warm_up()
+
 @app.on_event("startup")
 async def startup_event():
     """Ensure directories exist on startup"""
     UPLOAD_DIR.mkdir(exist_ok=True)
     PROCESSED_DIR.mkdir(exist_ok=True)
     logger.info("Directories created successfully")
+    if _ready.is_set():
+        return
+    # Load librosa/scipy off the event loop so /health answers straight away
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
 
 @app.get("/")
 async def root():
@@ -97,6 +171,8 @@ async def root():
         "status": "running",
         "endpoints": {
             "separate": "/api/separate",
+            "job": "/api/jobs/{job_id}",
+            "job_events": "/api/jobs/{job_id}/events",
             "health": "/health"
         }
     }
@@ -105,11 +181,100 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "audio-splitter"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Ready once the audio libraries are loaded; /health only reports liveness"""
+    if not _ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def _file_url(job_id, filename):
+    # Get base URL from environment or use default
+    base_url = os.getenv("BASE_URL", "http://localhost:8000")
+    return f"{base_url}/files/{job_id}/{filename}"
+
+def _record_event(job_id, event):
+    """Log a progress event for `/api/jobs/{job_id}/events`, with download URLs instead of paths"""
+    if event["event"] == "output":
+        event = dict(event)
+        event["url"] = _file_url(job_id, Path(event.pop("path")).name)
+    state.add_event(job_id, event, ttl=RESULT_TTL)
+
+def _run_separation(job_id, input_path, output_dir, method):
+    """Separate an uploaded file, recording progress events and the result in shared state"""
+    logger.info(f"Starting {method} separation for job {job_id}")
+    state.update_job(job_id, status="processing")
+    with progress.listen(lambda event: _record_event(job_id, event)):
+        vocals_path_str, instruments_path_str = SEPARATORS[method](str(input_path), str(output_dir))
+
+    vocals_path = Path(vocals_path_str)
+    accompaniment_path = Path(instruments_path_str)
+
+    if not vocals_path.exists() or not accompaniment_path.exists():
+        raise HTTPException(status_code=500, detail="Separation failed - output files not created")
+
+    logger.info(f"Separation completed for job {job_id}")
+
+    # Clean up input file
+    input_path.unlink()
+
+    result = {
+        "success": True,
+        "job_id": job_id,
+        "vocals_url": _file_url(job_id, "vocals.wav"),
+        "instruments_url": _file_url(job_id, "accompaniment.wav"),
+        "other_url": _file_url(job_id, "accompaniment.wav"),  # For compatibility
+        "message": "Audio separated successfully"
+    }
+    state.set_result(job_id, result, ttl=RESULT_TTL)
+    state.update_job(job_id, status="completed")
+    _record_event(job_id, {"event": "done", "result": result})
+    return result
+
+def _fail_job(job_id, error):
+    logger.error(f"Error during separation: {str(error)}")
+    if job_id is not None:
+        state.update_job(job_id, status="failed", error=str(error))
+        _record_event(job_id, {"event": "error", "detail": str(error)})
+
+def _run_separation_background(job_id, input_path, output_dir, method):
+    try:
+        _run_separation(job_id, input_path, output_dir, method)
+    except Exception as e:
+        _fail_job(job_id, e)
+
 @app.post("/api/separate")
-async def separate_audio(audio: UploadFile = File(...)):
+async def separate_audio(
+    request: Request,
+    audio: UploadFile = File(...),
+    method: str = Query(None),
+    background: bool = Query(False)
+):
     """
-    Separate audio into vocals and instruments using Spleeter AI
+    Separate audio into vocals and instruments
+
+    With `background=true` the upload is accepted with 202 straight away;
+    follow `/api/jobs/{job_id}/events` (SSE) or poll `/api/jobs/{job_id}`.
     """
+    method = method or SEPARATION_METHOD
+    if method not in SEPARATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown method. Supported: {', '.join(SEPARATORS)}")
+
+    if RATE_LIMIT_PER_MINUTE > 0:
+        client = request.client.host if request.client else "unknown"
+        allowed, retry_after = state.hit_rate_limit(f"separate:{client}", RATE_LIMIT_PER_MINUTE)
+        if not allowed:
+            raise HTTPException(
+                status_code=429, detail="Rate limit exceeded",
+                headers={"Retry-After": str(int(retry_after) + 1)}
+            )
+
+    job_id = None
     try:
         # Validate file type
         if not audio.filename.lower().endswith(('.mp3', '.wav', '.flac', '.m4a')):
@@ -117,50 +282,95 @@ async def separate_audio(audio: UploadFile = File(...)):
         
         # Generate unique ID for this separation job
         job_id = str(uuid.uuid4())
+        state.create_job(job_id, filename=audio.filename, method=method, worker_pid=os.getpid())
         
         # Save uploaded file
         file_extension = Path(audio.filename).suffix
         input_path = UPLOAD_DIR / f"{job_id}{file_extension}"
         
         logger.info(f"Saving uploaded file: {input_path}")
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(audio.file, buffer)
+        with stage_timer("api", "file_io"):
+            with open(input_path, "wb") as buffer:
+                shutil.copyfileobj(audio.file, buffer)
         
         # Create output directory for this job
         output_dir = PROCESSED_DIR / job_id
         output_dir.mkdir(exist_ok=True)
-        
-        # Separate audio using frequency-based method
-        logger.info(f"Starting separation for job {job_id}")
-        vocals_path_str, instruments_path_str = separate_audio_simple(str(input_path), str(output_dir))
-        
-        vocals_path = Path(vocals_path_str)
-        accompaniment_path = Path(instruments_path_str)
-        
-        if not vocals_path.exists() or not accompaniment_path.exists():
-            raise HTTPException(status_code=500, detail="Separation failed - output files not created")
-        
-        logger.info(f"Separation completed for job {job_id}")
-        
-        # Clean up input file
-        input_path.unlink()
-        
-        # Get base URL from environment or use default
-        base_url = os.getenv("BASE_URL", "http://localhost:8000")
-        
-        return {
-            "success": True,
-            "job_id": job_id,
-            "vocals_url": f"{base_url}/files/{job_id}/vocals.wav",
-            "instruments_url": f"{base_url}/files/{job_id}/accompaniment.wav",
-            "other_url": f"{base_url}/files/{job_id}/accompaniment.wav",  # For compatibility
-            "message": "Audio separated successfully"
-        }
+
+        if background:
+            asyncio.get_running_loop().run_in_executor(
+                None, _run_separation_background, job_id, input_path, output_dir, method
+            )
+            return JSONResponse(status_code=202, content={
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}",
+                "events_url": f"/api/jobs/{job_id}/events"
+            })
+
+        # Off the event loop: spectral separation of a long upload takes tens of seconds
+        return await run_in_threadpool(follow(_run_separation), job_id, input_path, output_dir, method)
         
     except Exception as e:
-        logger.error(f"Error during separation: {str(e)}")
+        _fail_job(job_id, e)
         raise HTTPException(status_code=500, detail=f"Separation failed: {str(e)}")
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Job status and result, answered by whichever worker receives the request
+    """
+    job = state.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job, "result": state.get_result(job_id)}
+
+# Seconds between polls of the shared event log by an open stream
+EVENT_POLL_SECONDS = 0.5
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, after: int = Query(0, ge=0)):
+    """
+    Server-Sent Events stream of a job's progress, from any worker
+
+    Stage, chunk progress and per-file `output` events (with the download URL,
+    so a finished stem can be fetched while the rest are still processing),
+    ending with `done` or `error`. Reconnecting clients resume after the
+    `Last-Event-ID` header (or `?after=`).
+    """
+    if state.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    last_id = request.headers.get("last-event-id")
+    if last_id and last_id.isdigit():
+        after = int(last_id)
+
+    async def stream():
+        nonlocal after
+        idle = 0.0
+        while True:
+            events = state.get_events(job_id, after)
+            for seq, event in events:
+                after = seq
+                yield progress.format_sse(event, event["event"], seq)
+                if event["event"] in ("done", "error"):
+                    return
+            if not events:
+                job = state.get_job(job_id)
+                if job is None or (job.get("status") in ("completed", "failed") and not state.get_events(job_id, after)):
+                    return
+                idle += EVENT_POLL_SECONDS
+                if idle >= progress.HEARTBEAT_SECONDS:
+                    idle = 0.0
+                    yield progress.heartbeat()
+            else:
+                idle = 0.0
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/api/cleanup/{job_id}")
 async def cleanup_job(job_id: str):
     """
@@ -168,6 +378,7 @@ async def cleanup_job(job_id: str):
     """
     try:
         job_dir = PROCESSED_DIR / job_id
+        state.delete_job(job_id)
         if job_dir.exists():
             shutil.rmtree(job_dir)
             return {"success": True, "message": f"Cleaned up job {job_id}"}
@@ -178,4 +389,5 @@ async def cleanup_job(job_id: str):
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False)
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False, workers=workers)
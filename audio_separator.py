@@ -7,6 +7,16 @@ pip install flask spleeter flask-cors
 
 Usage:
 python audio_separator.py
+python -m prefork audio_separator:app --workers 2 --port 5000
+
+Job status is kept in the shared state backend (STATE_BACKEND_URL), so any
+worker can answer /api/jobs/<job_id>.
+
+Concurrent requests are separated in batches: up to SEPARATION_BATCH_SIZE
+files arriving within SEPARATION_BATCH_DELAY_MS go through the model in one
+run. TF_INTRA_OP_THREADS / TF_INTER_OP_THREADS size TensorFlow's thread
+pools (0 = TensorFlow's default); with several workers, divide the cores
+between them.
 """
 
 from flask import Flask, request, jsonify, send_file
@@ -16,12 +26,30 @@ from spleeter.separator import Separator
 import tempfile
 import uuid
 
+from services.separation_batcher import SeparationBatcher
+from shared_state import get_state_backend
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
 
 # Initialize Spleeter separator
 # Options: '2stems' (vocals/accompaniment), '4stems', '5stems'
+# Under prefork.py this runs once in the parent, so TensorFlow and Spleeter
+# are shared by every worker. The TF graph itself is built lazily on each
+# worker's first request because the TF runtime does not survive fork().
 separator = Separator('spleeter:3stems')  # vocals, drums, bass
+# One model per process. Requests on other threads queue with the batcher,
+# which runs whatever arrives within the delay window through the model together
+batcher = SeparationBatcher(
+    separator,
+    batch_size=int(os.getenv('SEPARATION_BATCH_SIZE', '4')),
+    max_delay=float(os.getenv('SEPARATION_BATCH_DELAY_MS', '200')) / 1000,
+    max_batch_seconds=float(os.getenv('SEPARATION_BATCH_MAX_SECONDS', '600')),
+    intra_op_threads=int(os.getenv('TF_INTRA_OP_THREADS', '0')),
+    inter_op_threads=int(os.getenv('TF_INTER_OP_THREADS', '0'))
+)
+
+state = get_state_backend()
 
 UPLOAD_FOLDER = tempfile.gettempdir()
 OUTPUT_FOLDER = os.path.join(UPLOAD_FOLDER, 'separated')
@@ -32,6 +60,7 @@ def separate_audio():
     """
     Separate audio into vocals, instruments, and other
     """
+    job_id = None
     try:
         # Check if file was uploaded
         if 'audio' not in request.files:
@@ -44,6 +73,7 @@ def separate_audio():
         
         # Generate unique ID for this separation job
         job_id = str(uuid.uuid4())
+        state.create_job(job_id, filename=file.filename, worker_pid=os.getpid())
         
         # Save uploaded file
         input_path = os.path.join(UPLOAD_FOLDER, f'{job_id}_input.mp3')
@@ -55,7 +85,8 @@ def separate_audio():
         
         # Perform separation
         print(f'Separating audio: {input_path}')
-        separator.separate_to_file(input_path, output_dir)
+        state.update_job(job_id, status='processing')
+        batcher.separate(input_path, output_dir)
         
         # Get paths to separated files
         # Spleeter creates a subfolder with the input filename
@@ -80,13 +111,27 @@ def separate_audio():
             'other_url': f'{base_url}api/download/{job_id}/other',
             'status': 'completed'
         }
+        state.set_result(job_id, response)
+        state.update_job(job_id, status='completed')
         
         return jsonify(response), 200
         
     except Exception as e:
         print(f'Error: {str(e)}')
+        if job_id is not None:
+            state.update_job(job_id, status='failed', error=str(e))
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Job status and result, from whichever worker ran the job
+    """
+    job = state.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({**job, 'result': state.get_result(job_id)}), 200
+
 @app.route('/api/download/<job_id>/<track_type>', methods=['GET'])
 def download_track(job_id, track_type):
     """
@@ -129,4 +174,6 @@ def health_check():
 if __name__ == '__main__':
     print('Starting Audio Separation Server...')
     print('Spleeter model loaded and ready')
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # The debug reloader forks a second process and the debugger is not safe to expose
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+    app.run(host='0.0.0.0', port=5000, debug=debug, threaded=True)
@@ -0,0 +1,125 @@
+"""
+Batched Spleeter throughput benchmark
+
+Submits `--tracks` files at once to a `SeparationBatcher` for each batch
+size and reports tracks and audio seconds separated per wall-clock second,
+with the median request latency. Batch size 1 is the old one-call-per-request
+behaviour. Every batched stem is also compared with the same track
+separated on its own: packing tracks into one run must not change the
+result beyond float noise, so a large `max_diff` means the segment
+alignment is off.
+
+TensorFlow's thread pools can only be sized once per process; run the
+benchmark once per `--intra-op` setting to compare them.
+
+Usage:
+python -m benchmarks.batching_bench
+python -m benchmarks.batching_bench --batch-sizes 1,2,4,8 --tracks 8 --duration 30 --intra-op 4 --output batching.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.dsp_bench import _int_list
+from benchmarks.signals import make_signal
+
+def _write_tracks(workdir, tracks, duration, sample_rate):
+    paths = []
+    for i in range(tracks):
+        # Different content per track so a leak between neighbours would show
+        y = np.roll(make_signal(duration, sample_rate, 2), i * sample_rate // 3, axis=0)
+        paths.append(os.path.join(workdir, f"track_{i}.wav"))
+        sf.write(paths[-1], y, sample_rate, subtype="FLOAT")
+    return paths
+
+def _max_diff(stems, reference):
+    worst = 0.0
+    for name, path in stems.items():
+        a, _ = sf.read(path, dtype="float32")
+        b, _ = sf.read(reference[name], dtype="float32")
+        worst = max(worst, float(np.max(np.abs(a - b))))
+    return worst
+
+def run(batch_sizes, tracks=8, duration=30, model="spleeter:2stems", delay=0.2, intra_op=0, inter_op=0):
+    from spleeter.separator import Separator
+    from services.separation_batcher import SeparationBatcher, configure_threads
+
+    configure_threads(intra_op, inter_op)
+    separator = Separator(model)
+    workdir = tempfile.mkdtemp(prefix="batching_bench_")
+    results = []
+    try:
+        paths = _write_tracks(workdir, tracks, duration, 44100)
+
+        # Batch size 1 doubles as the reference output and warms the model up
+        reference_batcher = SeparationBatcher(separator, batch_size=1, max_delay=0)
+        reference_batcher.separate(paths[0], os.path.join(workdir, "warmup"))
+        reference = [reference_batcher.separate(p, os.path.join(workdir, "reference")) for p in paths]
+
+        for batch_size in batch_sizes:
+            batcher = SeparationBatcher(separator, batch_size=batch_size, max_delay=delay,
+                                        max_batch_seconds=float("inf"))
+            output_dir = os.path.join(workdir, f"batch_{batch_size}")
+            start = time.perf_counter()
+            futures = [batcher.submit(p, output_dir) for p in paths]
+            latencies, outputs = [], []
+            for future in futures:
+                outputs.append(future.result())
+                latencies.append(time.perf_counter() - start)
+            wall = time.perf_counter() - start
+
+            result = {
+                "batch_size": batch_size,
+                "tracks": tracks,
+                "duration": duration,
+                "wall_s": round(wall, 3),
+                "tracks_per_s": round(tracks / wall, 3),
+                "audio_s_per_s": round(tracks * duration / wall, 2),
+                "median_latency_s": round(statistics.median(latencies), 3),
+                "max_diff": max(_max_diff(o, r) for o, r in zip(outputs, reference)),
+            }
+            results.append(result)
+            print(
+                f"batch {batch_size:>3}  {result['tracks_per_s']:7.3f} tracks/s  "
+                f"{result['audio_s_per_s']:8.2f} audio s/s  median latency {result['median_latency_s']:7.3f} s  "
+                f"max diff {result['max_diff']:.1e}",
+                flush=True
+            )
+            shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"model": model, "delay": delay, "intra_op": intra_op, "inter_op": inter_op,
+                 "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Spleeter throughput at several batch sizes")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 2, 4, 8])
+    parser.add_argument("--tracks", type=int, default=8, help="Files submitted at once per batch size")
+    parser.add_argument("--duration", type=int, default=30, help="Track length in seconds")
+    parser.add_argument("--model", default="spleeter:2stems")
+    parser.add_argument("--delay-ms", type=float, default=200.0, help="Batcher collection window")
+    parser.add_argument("--intra-op", type=int, default=0, help="TensorFlow intra-op threads (0 = default)")
+    parser.add_argument("--inter-op", type=int, default=0, help="TensorFlow inter-op threads (0 = default)")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.batch_sizes, args.tracks, args.duration, args.model, args.delay_ms / 1000,
+                 args.intra_op, args.inter_op)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+DSP benchmark suite
+
+Times every service method on synthetic signals and reports wall time, CPU
+time, realtime factor (audio seconds per wall second) and peak traced memory.
+Results are written as JSON so a run can be compared against a stored
+baseline; any case slower or larger than the baseline by more than the
+tolerance fails the run.
+
+Usage:
+python -m benchmarks.dsp_bench --output bench.json
+python -m benchmarks.dsp_bench --save-baseline benchmarks/baseline.json
+python -m benchmarks.dsp_bench --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.signals import write_signal
+from services import audio_io
+
+def _service_cases():
+    """(name, callable(input_path, workdir)) for every benchmarked method"""
+    from services.audio_processor import AudioProcessor
+    from services.noise_cancellation import NoiseCanceller
+    from services.stem_separator import StemSeparator
+    from app import separate_audio_simple, separate_audio_spectral
+
+    processor = AudioProcessor()
+    canceller = NoiseCanceller()
+    separator = StemSeparator()
+
+    def out(workdir, name):
+        return os.path.join(workdir, f"{name}.wav")
+
+    def stems_dir(workdir):
+        path = os.path.join(workdir, "stems")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    return [
+        ("apply_equalizer", lambda p, w: processor.apply_equalizer(p, out(w, "eq"), [1.2, 1.0, 0.8, 1.1, 0.9])),
+        ("apply_compressor", lambda p, w: processor.apply_compressor(p, out(w, "comp"), 4.0)),
+        ("apply_reverb", lambda p, w: processor.apply_reverb(p, out(w, "reverb"), 0.5, 0.5)),
+        ("ai_enhance", lambda p, w: processor.ai_enhance(p, out(w, "enhance"))),
+        ("detect_bpm", lambda p, w: processor.detect_bpm(p)),
+        ("noise_cancel", lambda p, w: canceller.process(p, out(w, "denoise"))),
+        ("manual_separation", lambda p, w: separator._manual_separation(p, stems_dir(w))),
+        ("separate_audio_simple", lambda p, w: separate_audio_simple(p, stems_dir(w))),
+        ("separate_audio_spectral", lambda p, w: separate_audio_spectral(p, stems_dir(w))),
+    ]
+
+def _drum_case():
+    from services.drum_machine import DrumMachine
+
+    drums = DrumMachine()
+    return lambda duration, w: drums.generate("rock", os.path.join(w, "drums.wav"), 120, duration)
+
+def _measure(func, repeat):
+    """Median wall/CPU time over `repeat` runs, then one traced run for peak memory"""
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        func()
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+
+    # tracemalloc slows Python-level code, so memory gets its own run
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return statistics.median(walls), statistics.median(cpus), peak
+
+def run(durations, channels, sample_rates, repeat=3, only=None):
+    workdir = tempfile.mkdtemp(prefix="dsp_bench_")
+    results = []
+    try:
+        cases = _service_cases()
+        drum_case = _drum_case()
+        signal_dir = os.path.join(workdir, "signals")
+
+        for duration in durations:
+            for sample_rate in sample_rates:
+                for n_channels in channels:
+                    path = write_signal(signal_dir, duration, sample_rate, n_channels)
+                    for name, case in cases:
+                        if only and name not in only:
+                            continue
+                        # Warm-up call so one-off JIT and import costs don't count
+                        case(path, workdir)
+                        # Clear decoded buffers so every run pays for decode/resample
+                        wall, cpu, peak = _measure(lambda: (audio_io.clear_cache(), case(path, workdir)), repeat)
+                        results.append(_result(name, duration, n_channels, sample_rate, wall, cpu, peak))
+                        print(_format(results[-1]), flush=True)
+
+            # Drum generation has no input file; its cost depends only on duration
+            if not only or "drum_generate" in only:
+                drum_case(duration, workdir)
+                wall, cpu, peak = _measure(lambda: drum_case(duration, workdir), repeat)
+                results.append(_result("drum_generate", duration, 1, 44100, wall, cpu, peak))
+                print(_format(results[-1]), flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+def _result(name, duration, n_channels, sample_rate, wall, cpu, peak):
+    return {
+        "key": f"{name}/{duration}s/{n_channels}ch/{sample_rate}Hz",
+        "method": name,
+        "duration": duration,
+        "channels": n_channels,
+        "sample_rate": sample_rate,
+        "wall_s": round(wall, 6),
+        "cpu_s": round(cpu, 6),
+        "realtime_factor": round(duration / wall, 3) if wall > 0 else None,
+        "cpu_realtime_factor": round(duration / cpu, 3) if cpu > 0 else None,
+        "channel_seconds_per_s": round(duration * n_channels / wall, 3) if wall > 0 else None,
+        "peak_mb": round(peak / (1024 * 1024), 3)
+    }
+
+def _format(result):
+    return (
+        f"{result['key']:<48} {result['wall_s'] * 1000:>9.1f} ms  "
+        f"rtf {result['realtime_factor']:>8}  peak {result['peak_mb']:>8.1f} MB"
+    )
+
+def channel_scaling(report):
+    """Wall time of each case relative to its mono run, e.g. stereo at 1.1x mono"""
+    mono = {
+        (r["method"], r["duration"], r["sample_rate"]): r["wall_s"]
+        for r in report["results"] if r["channels"] == 1
+    }
+    rows = []
+    for r in report["results"]:
+        base = mono.get((r["method"], r["duration"], r["sample_rate"]))
+        if r["channels"] > 1 and base:
+            rows.append((r["key"], round(r["wall_s"] / base, 2)))
+    return rows
+
+def compare(report, baseline, tolerance=0.25, memory_tolerance=0.25):
+    """Return a list of human-readable regressions against `baseline`"""
+    previous = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        base = previous.get(result["key"])
+        if base is None:
+            continue
+        if result["wall_s"] > base["wall_s"] * (1 + tolerance):
+            regressions.append(
+                f"{result['key']}: wall {base['wall_s']:.4f}s -> {result['wall_s']:.4f}s"
+            )
+        if result["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance):
+            regressions.append(
+                f"{result['key']}: peak {base['peak_mb']:.1f}MB -> {result['peak_mb']:.1f}MB"
+            )
+    return regressions
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audio services")
+    parser.add_argument("--durations", type=_int_list, default=[5, 30, 120], help="Signal lengths in seconds")
+    parser.add_argument("--channels", type=_int_list, default=[1, 2, 6], help="Channel counts (6 = 5.1)")
+    parser.add_argument("--sample-rates", type=_int_list, default=[44100, 48000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", type=lambda v: v.split(","), default=None, help="Comma-separated method names")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON and fail on regressions")
+    parser.add_argument("--save-baseline", help="Write results JSON as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed wall time growth (0.25 = 25%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = run(args.durations, args.channels, args.sample_rates, args.repeat, args.only)
+
+    scaling = channel_scaling(report)
+    if scaling:
+        print("\nWall time relative to mono:")
+        for key, ratio in scaling:
+            print(f"  {key:<48} {ratio:>6}x")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.memory_tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
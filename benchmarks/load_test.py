@@ -0,0 +1,313 @@
+"""
+HTTP load generator for the audio APIs
+
+Replays a weighted mix of operations against app.py (separation) or main.py
+(uploads, effects, stems, drums) either in-process through an ASGI transport
+or against a running server. Load is closed-loop (`--concurrency` workers) or
+open-loop (`--rate` Poisson arrivals per second). The report covers
+throughput, latency percentiles per operation, error rates and the server's
+queue depth scraped from /metrics while the test runs.
+
+main.py routes are JWT-protected. The harness seeds `--users` accounts in the
+configured database and mints tokens for them with the app's own secret, so
+requests go through the real `get_current_user` path.
+
+Requirements:
+pip install httpx
+
+Usage:
+python -m benchmarks.load_test --app app --concurrency 50 --duration 60
+python -m benchmarks.load_test --app main --mix upload=1,effects=4,drums=1 --rate 20
+python -m benchmarks.load_test --url http://localhost:8000 --app app --concurrency 10
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import soundfile as sf
+
+from benchmarks.signals import make_signal
+
+DEFAULT_MIX = {
+    "app": "separate=3,download=2,health=1",
+    "main": "upload=1,effects=4,noise=1,stems=1,drums=1,bpm=1,download=1",
+}
+
+EFFECT_PAYLOADS = [
+    {"effect_type": "equalizer", "eq_bands": [1.2, 1.0, 0.9, 1.1, 1.0]},
+    {"effect_type": "compressor", "compression_ratio": 4.0},
+    {"effect_type": "reverb", "reverb_room_size": 0.4, "reverb_damping": 0.5},
+    {"effect_type": "ai_enhance"},
+]
+
+def _wav_bytes(duration, sample_rate=44100, channels=2):
+    buffer = io.BytesIO()
+    sf.write(buffer, make_signal(duration, sample_rate, channels), sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+def _parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def seed_users(count):
+    """Create `count` load-test users if missing and return JWTs for them"""
+    from database import SessionLocal, Base, engine
+    from models import User
+    from routers.auth import create_access_token
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        tokens = []
+        for i in range(count):
+            email = f"loadtest{i}@example.com"
+            user = db.query(User).filter(User.email == email).first()
+            if user is None:
+                # Tokens are minted directly, so the password hash is never checked
+                user = User(email=email, username=f"loadtest{i}", hashed_password="!")
+                db.add(user)
+                db.commit()
+                db.refresh(user)
+            tokens.append(create_access_token(data={"sub": str(user.id)}))
+        return tokens
+    finally:
+        db.close()
+
+class LoadTest:
+    def __init__(self, client, target, mix, audio, tokens=None):
+        self.client = client
+        self.target = target
+        self.mix = mix
+        self.audio = audio
+        self.tokens = tokens or []
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.recordings = []
+        self.downloads = []
+        self.queue_samples = defaultdict(list)
+
+    def _headers(self):
+        if not self.tokens:
+            return {}
+        return {"Authorization": f"Bearer {random.choice(self.tokens)}"}
+
+    async def _request(self, op, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self._headers(), **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        self.latencies[op].append(time.perf_counter() - start)
+        self.statuses[op][status] += 1
+        return response
+
+    def _files(self, field):
+        return {field: ("load.wav", self.audio, "audio/wav")}
+
+    async def op_health(self):
+        await self._request("health", "GET", "/health")
+
+    async def op_separate(self):
+        response = await self._request("separate", "POST", "/api/separate", files=self._files("audio"))
+        if response is not None and response.status_code == 200:
+            job_id = response.json()["job_id"]
+            self.downloads.append(f"/files/{job_id}/vocals.wav")
+
+    async def op_upload(self):
+        response = await self._request("upload", "POST", "/api/audio/upload", files=self._files("file"))
+        if response is not None and response.status_code == 200:
+            self.recordings.append(response.json()["recording_id"])
+
+    async def _with_recording(self, op, method, path, **kwargs):
+        if not self.recordings:
+            await self.op_upload()
+            if not self.recordings:
+                self.statuses[op]["no_recording"] += 1
+                return None
+        return await self._request(op, method, path.format(random.choice(self.recordings)), **kwargs)
+
+    async def op_effects(self):
+        await self._with_recording(
+            "effects", "POST", "/api/audio/apply-effects/{}", json=random.choice(EFFECT_PAYLOADS)
+        )
+
+    async def op_noise(self):
+        await self._with_recording("noise", "POST", "/api/audio/noise-cancel/{}")
+
+    async def op_stems(self):
+        await self._with_recording("stems", "POST", "/api/audio/split-stems/{}")
+
+    async def op_bpm(self):
+        await self._with_recording("bpm", "GET", "/api/audio/detect-bpm/{}")
+
+    async def op_drums(self):
+        payload = {"genre": random.choice(["rock", "jazz", "electronic", "hip-hop"]), "duration": 4}
+        await self._request("drums", "POST", "/api/audio/generate-drums", json=payload)
+
+    async def op_download(self):
+        if self.target == "main":
+            # main.py returns processed audio inline; the closest read is effect history
+            await self._with_recording("download", "GET", "/api/audio/history/{}")
+            return
+        if not self.downloads:
+            await self.op_separate()
+            if not self.downloads:
+                return
+        await self._request("download", "GET", random.choice(self.downloads))
+
+    def _pick(self):
+        names = list(self.mix)
+        return getattr(self, f"op_{random.choices(names, weights=[self.mix[n] for n in names])[0]}")
+
+    async def _closed_loop(self, concurrency, deadline):
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self._pick()()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def _open_loop(self, rate, deadline, max_in_flight):
+        in_flight = set()
+        while time.perf_counter() < deadline:
+            if len(in_flight) < max_in_flight:
+                task = asyncio.ensure_future(self._pick()())
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            else:
+                self.statuses["_client"]["dropped_arrival"] += 1
+            await asyncio.sleep(random.expovariate(rate))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    async def _sample_queues(self, stop, interval=1.0):
+        pattern = re.compile(r'^queue_depth\{queue="([^"]+)"\} (\S+)$', re.M)
+        while not stop.is_set():
+            try:
+                response = await self.client.get("/metrics")
+                for queue, value in pattern.findall(response.text):
+                    self.queue_samples[queue].append(float(value))
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, duration, concurrency=None, rate=None, max_in_flight=200):
+        for op in self.mix:
+            if not hasattr(self, f"op_{op}"):
+                raise ValueError(f"Unknown operation: {op}")
+
+        stop = asyncio.Event()
+        sampler = asyncio.ensure_future(self._sample_queues(stop))
+        start = time.perf_counter()
+        deadline = start + duration
+        if rate:
+            await self._open_loop(rate, deadline, max_in_flight)
+        else:
+            await self._closed_loop(concurrency or 1, deadline)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        operations = {}
+        total = errors = 0
+        for op, values in self.latencies.items():
+            values = sorted(values)
+            failed = sum(
+                count for status, count in self.statuses[op].items()
+                if not (isinstance(status, int) and status < 400)
+            )
+            total += len(values)
+            errors += failed
+            operations[op] = {
+                "requests": len(values),
+                "errors": failed,
+                "error_rate": round(failed / len(values), 4) if values else 0.0,
+                "throughput_rps": round(len(values) / elapsed, 3),
+                "p50_ms": round(_percentile(values, 50) * 1000, 2),
+                "p90_ms": round(_percentile(values, 90) * 1000, 2),
+                "p99_ms": round(_percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "statuses": {str(k): v for k, v in self.statuses[op].items()},
+            }
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "operations": operations,
+            "queue_depth": {
+                queue: {"max": max(samples), "mean": round(sum(samples) / len(samples), 2)}
+                for queue, samples in self.queue_samples.items() if samples
+            },
+            "client": dict(self.statuses.get("_client", {})),
+        }
+
+def _in_process_app(target):
+    if target == "main":
+        import main
+        return main.app
+    import app
+    return app.app
+
+async def _main(args):
+    audio = _wav_bytes(args.audio_seconds)
+    tokens = seed_users(args.users) if args.target == "main" else None
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        transport = httpx.ASGITransport(app=_in_process_app(args.target))
+        client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout)
+
+    async with client:
+        test = LoadTest(client, args.target, args.mix, audio, tokens)
+        return await test.run(args.duration, args.concurrency, args.rate, args.max_in_flight)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the audio APIs")
+    parser.add_argument("--app", dest="target", choices=["app", "main"], default="app")
+    parser.add_argument("--url", help="Base URL of a running server; in-process if omitted")
+    parser.add_argument("--mix", help="Weighted operations, e.g. separate=3,download=1")
+    parser.add_argument("--concurrency", type=int, default=10, help="Closed-loop workers")
+    parser.add_argument("--rate", type=float, help="Open-loop arrivals per second (overrides --concurrency)")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0, help="Test length in seconds")
+    parser.add_argument("--audio-seconds", type=float, default=10.0, help="Length of the uploaded clip")
+    parser.add_argument("--users", type=int, default=10, help="Mock users for JWT-protected routes")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report JSON here")
+    args = parser.parse_args(argv)
+    args.mix = _parse_mix(args.mix or DEFAULT_MIX[args.target])
+    random.seed(args.seed)
+
+    report = asyncio.run(_main(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Per-worker memory benchmark
+
+Boots an app with N workers two ways and reports RSS, PSS and USS for every
+process once all workers answer /ready (and, optionally, after some traffic):
+
+    independent   N separate uvicorn processes, each importing and warming
+                  the app itself (what `uvicorn --workers N` does)
+    prefork       `python -m prefork`, which preloads once and forks
+
+PSS splits each shared page between the processes mapping it, so the PSS
+total is the real footprint of the deployment; USS is what each worker holds
+privately. Linux only (reads /proc/<pid>/smaps_rollup).
+
+Usage:
+python -m benchmarks.memory_bench --module app --workers 4
+python -m benchmarks.memory_bench --module main --workers 2 --output memory.json
+python -m benchmarks.memory_bench --module app --workers 4 --separations 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.startup_bench import ROOT, _env, _first_separation, _wait_for
+from metrics import memory_usage
+
+MB = 1024 * 1024
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def _snapshot(pids):
+    rows = [{"pid": pid, **{k: round(v / MB, 1) for k, v in memory_usage(pid).items()}} for pid in pids]
+    totals = {
+        f"total_{kind}_mb": round(sum(row.get(kind, 0) for row in rows), 1)
+        for kind in ("rss", "pss", "uss")
+    }
+    return {"processes": rows, **totals}
+
+def _traffic(base_ports, separations):
+    for i in range(separations):
+        _first_separation(f"http://127.0.0.1:{base_ports[i % len(base_ports)]}")
+
+def _measure(processes, ports, pids, timeout, separations, settle):
+    deadline = time.perf_counter() + timeout
+    for port in ports:
+        if not _wait_for(f"http://127.0.0.1:{port}/ready", deadline):
+            raise RuntimeError(f"Port {port} did not become ready within {timeout}s")
+    time.sleep(settle)
+    result = {"ready": _snapshot(pids())}
+    if separations:
+        _traffic(ports, separations)
+        result["after_traffic"] = _snapshot(pids())
+    return result
+
+def _stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def independent(module, workers, port, timeout, separations, settle, env):
+    ports = [port + i for i in range(workers)]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(p), "--log-level", "warning"],
+            cwd=ROOT, env=_env(env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for p in ports
+    ]
+    try:
+        return _measure(processes, ports, lambda: [p.pid for p in processes], timeout, separations, settle)
+    finally:
+        _stop(processes)
+
+def prefork(module, workers, port, timeout, separations, settle, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "prefork", f"{module}:app", "--workers", str(workers),
+         "--port", str(port), "--log-level", "warning", "--report-after", "3600"],
+        cwd=ROOT, env=_env(env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        # The parent holds the preloaded pages too, so it counts towards the total
+        return _measure(
+            [process], [port], lambda: [process.pid] + _children(process.pid), timeout, separations, settle
+        )
+    finally:
+        _stop([process])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-worker memory with and without pre-fork loading")
+    parser.add_argument("--module", default="app", choices=["app", "main"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--separations", type=int, default=0, help="Requests to send before a second snapshot (app only)")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait after /ready before measuring")
+    parser.add_argument("--no-warmup", action="store_true", help="Set WARMUP_ON_STARTUP=false")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    env = {"WARMUP_ON_STARTUP": "false" if args.no_warmup else "true"}
+    report = {"meta": {"module": args.module, "workers": args.workers, "python": sys.version.split()[0]}}
+    for name, runner in (("independent", independent), ("prefork", prefork)):
+        report[name] = runner(
+            args.module, args.workers, args.port, args.timeout, args.separations, args.settle, env
+        )
+        for phase, snapshot in report[name].items():
+            print(
+                f"{name:<12} {phase:<14} total rss {snapshot['total_rss_mb']:8.1f} MB  "
+                f"pss {snapshot['total_pss_mb']:8.1f} MB  uss {snapshot['total_uss_mb']:8.1f} MB",
+                flush=True
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
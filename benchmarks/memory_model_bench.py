@@ -0,0 +1,124 @@
+"""
+Memory cost model calibration
+
+Runs each operation that declares a `CostModel` on WAV files of several
+lengths and compares the traced peak (tracemalloc, so numpy buffers count
+but the interpreter and loaded libraries don't) with the model's estimate.
+Operations with a block-streaming path are measured that way too, against
+the estimate capped at `--block` seconds. A ratio above 1.0 means the model
+underestimates; the shipped factors leave ~10% headroom over the fitted
+ones.
+
+Spleeter runs in a subprocess that tracemalloc can't see, so stem
+separation is measured on the manual fallback only.
+
+Usage:
+python -m benchmarks.memory_model_bench
+python -m benchmarks.memory_model_bench --durations 30,120,600 --channels 2 --output memory_model.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.dsp_bench import _int_list
+from benchmarks.region_bench import EFFECTS, _write_long
+from services import audio_io
+from services.memory_governor import MB
+
+def _peak(func):
+    audio_io.clear_cache()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def _cases(workdir, block):
+    from services.audio_processor import AudioProcessor
+    from services.noise_cancellation import NoiseCanceller
+    from services.stem_separator import StemSeparator
+
+    processor = AudioProcessor()
+    canceller = NoiseCanceller()
+    separator = StemSeparator()
+    out = os.path.join(workdir, "out.wav")
+    stems = os.path.join(workdir, "stems")
+    os.makedirs(stems)
+    cases = []
+    for effect, params in EFFECTS.items():
+        cases.append((processor, effect, "full",
+                      lambda path, e=effect, p=params: processor._render_file(path, out, e, **p)))
+        cases.append((processor, effect, "streaming",
+                      lambda path, e=effect, p=params: processor.apply_streaming(path, out, e, block, **p)))
+    cases.append((processor, "detect_bpm", "full", processor.detect_bpm))
+    cases.append((canceller, "noise_cancel", "full", lambda path: canceller.process(path, out)))
+    cases.append((canceller, "noise_cancel", "streaming",
+                  lambda path: canceller.process_streaming(path, out, block)))
+    cases.append((separator, "manual", "full", lambda path: separator._manual_separation(path, stems)))
+    return cases
+
+def run(durations, channels=2, sample_rate=44100, block=30.0):
+    workdir = tempfile.mkdtemp(prefix="memory_model_bench_")
+    results = []
+    try:
+        cases = _cases(workdir, block)
+        # One untraced pass on a short file so filter design caches and lazy
+        # imports don't count against the first measured duration
+        warmup = _write_long(os.path.join(workdir, "warmup.wav"), 5, sample_rate, channels, "PCM_16")
+        for _, _, _, func in cases:
+            func(warmup)
+        for duration in durations:
+            path = _write_long(os.path.join(workdir, f"long_{duration}s.wav"),
+                               duration, sample_rate, channels, "PCM_16")
+            for service, operation, mode, func in cases:
+                model = service.MEMORY_MODELS[operation]
+                estimate = model.estimate(
+                    duration, sample_rate, channels, stream_seconds=block if mode == "streaming" else None
+                )
+                peak = _peak(lambda: func(path))
+                result = {
+                    "key": f"{operation}/{mode}/{duration}s",
+                    "operation": operation,
+                    "mode": mode,
+                    "duration": duration,
+                    "peak_mb": round(peak / MB, 2),
+                    "estimate_mb": round(estimate / MB, 2),
+                    "ratio": round(peak / estimate, 3) if estimate else None,
+                }
+                results.append(result)
+                print(
+                    f"{result['key']:<32} peak {result['peak_mb']:8.1f} MB  "
+                    f"estimate {result['estimate_mb']:8.1f} MB  ratio {result['ratio']}",
+                    flush=True
+                )
+            os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"channels": channels, "sample_rate": sample_rate, "block": block},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare traced peak memory with the cost model estimates")
+    parser.add_argument("--durations", type=_int_list, default=[30, 120], help="Recording lengths in seconds")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--block", type=float, default=30.0, help="Streaming block length in seconds")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.durations, args.channels, block=args.block)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    # Any underestimate is a calibration failure
+    return 1 if any(r["ratio"] and r["ratio"] > 1.0 for r in report["results"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
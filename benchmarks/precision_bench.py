@@ -0,0 +1,148 @@
+"""
+float32 vs float64 equivalence and memory benchmark
+
+Runs every service once in each processing dtype (`services.dsp.DTYPE`) on
+the same synthetic input with the same RNG seed, then compares the written
+outputs sample by sample. A case fails when the float32 output's SNR against
+the float64 reference drops below `--min-snr` dB (outputs are 16-bit WAV, so
+anything above ~90 dB is within one LSB) or a detected value differs. Peak
+traced memory for both modes is reported alongside.
+
+Usage:
+python -m benchmarks.precision_bench
+python -m benchmarks.precision_bench --duration 60 --channels 2 --output precision.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.signals import write_signal
+from services import audio_io, dsp
+
+def _cases():
+    """(name, callable(input_path, workdir) -> output paths or a value)"""
+    from app import separate_audio_simple, separate_audio_spectral
+    from services.audio_processor import AudioProcessor
+    from services.drum_machine import DrumMachine
+    from services.noise_cancellation import NoiseCanceller
+    from services.stem_separator import StemSeparator
+
+    processor = AudioProcessor()
+    canceller = NoiseCanceller()
+    separator = StemSeparator()
+    drums = DrumMachine()
+
+    def out(workdir, name):
+        return os.path.join(workdir, f"{name}.wav")
+
+    def stems(workdir):
+        path = os.path.join(workdir, "stems")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def written(func, *paths):
+        func()
+        return list(paths)
+
+    return [
+        ("apply_equalizer", lambda p, w: written(
+            lambda: processor.apply_equalizer(p, out(w, "eq"), [1.2, 1.0, 0.8, 1.1, 0.9]), out(w, "eq"))),
+        ("apply_compressor", lambda p, w: written(
+            lambda: processor.apply_compressor(p, out(w, "comp"), 4.0), out(w, "comp"))),
+        ("apply_reverb", lambda p, w: written(
+            lambda: processor.apply_reverb(p, out(w, "reverb"), 0.5, 0.5), out(w, "reverb"))),
+        ("ai_enhance", lambda p, w: written(lambda: processor.ai_enhance(p, out(w, "enhance")), out(w, "enhance"))),
+        ("detect_bpm", lambda p, w: processor.detect_bpm(p)),
+        ("noise_cancel", lambda p, w: written(lambda: canceller.process(p, out(w, "denoise")), out(w, "denoise"))),
+        ("manual_separation", lambda p, w: list(separator._manual_separation(p, stems(w)).values())),
+        ("separate_audio_simple", lambda p, w: list(separate_audio_simple(p, stems(w)))),
+        ("separate_audio_spectral", lambda p, w: list(separate_audio_spectral(p, stems(w)))),
+        ("drum_generate", lambda p, w: written(lambda: drums.generate("rock", out(w, "drums"), 120, 8), out(w, "drums"))),
+    ]
+
+def _run(case, path, workdir, dtype, seed=0):
+    dsp.DTYPE = np.dtype(dtype)
+    audio_io.clear_cache()
+    np.random.seed(seed)
+    tracemalloc.start()
+    try:
+        result = case(path, workdir)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if isinstance(result, list):
+        result = [sf.read(p, dtype="float64", always_2d=True)[0] for p in result]
+    return result, peak
+
+def _snr(reference, estimate):
+    error = np.sum((reference - estimate) ** 2)
+    power = np.sum(reference ** 2)
+    return float("inf") if error == 0 else float(10 * np.log10(power / error))
+
+def run(duration, channels, sample_rate, min_snr):
+    workdir = tempfile.mkdtemp(prefix="precision_bench_")
+    default = dsp.DTYPE
+    results = []
+    try:
+        path = write_signal(os.path.join(workdir, "signals"), duration, sample_rate, channels)
+        for name, case in _cases():
+            # Warm-up so JIT compilation doesn't land in either traced run
+            _run(case, path, workdir, "float32")
+            reference, peak64 = _run(case, path, workdir, "float64")
+            estimate, peak32 = _run(case, path, workdir, "float32")
+
+            if isinstance(reference, list):
+                snr = min(_snr(r, e) for r, e in zip(reference, estimate))
+                max_error = max(float(np.max(np.abs(r - e))) for r, e in zip(reference, estimate))
+                passed = snr >= min_snr
+            else:
+                snr, max_error = None, abs(reference - estimate)
+                passed = np.isclose(reference, estimate, rtol=1e-3)
+
+            results.append({
+                "method": name,
+                "snr_db": None if snr is None else (round(snr, 1) if np.isfinite(snr) else "inf"),
+                "max_abs_error": max_error,
+                "peak_mb_float64": round(peak64 / (1024 * 1024), 2),
+                "peak_mb_float32": round(peak32 / (1024 * 1024), 2),
+                "passed": bool(passed),
+            })
+            r = results[-1]
+            print(
+                f"{name:<26} snr {str(r['snr_db']):>7} dB  max err {r['max_abs_error']:.2e}  "
+                f"peak {r['peak_mb_float64']:8.1f} -> {r['peak_mb_float32']:8.1f} MB  "
+                f"{'ok' if passed else 'FAIL'}",
+                flush=True
+            )
+    finally:
+        dsp.DTYPE = default
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"duration": duration, "channels": channels, "sample_rate": sample_rate, "min_snr": min_snr},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check float32 processing against float64")
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--min-snr", type=float, default=60.0, help="Minimum SNR of float32 vs float64 output")
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.duration, args.channels, args.sample_rate, args.min_snr)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if all(r["passed"] for r in report["results"]) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
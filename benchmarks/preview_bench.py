@@ -0,0 +1,126 @@
+"""
+Effect preview benchmark
+
+Times `AudioProcessor.preview` plus encoding for an `--excerpt` second
+span of one recording, against the full-quality render of the whole file
+that an `apply-effects` request runs. The preview target is well under
+200 ms regardless of the file's length. Each preview is also compared with
+the same span of the full render, resampled to the preview rate and
+gain-matched (the full render is normalised over the whole file): the SNR
+(dB) shows how closely the preview tracks the final sound. Nonlinear
+effects (compression, the enhancer's gate) alias at the lower rate and
+settle on the excerpt rather than the whole file, so they score lower. Reverb
+draws a new random impulse response per render, so its SNR is not
+reported.
+
+Usage:
+python -m benchmarks.preview_bench
+python -m benchmarks.preview_bench --duration 600 --excerpt 10 --encoding ogg --output preview.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from benchmarks.dsp_bench import _measure
+from benchmarks.region_bench import EFFECTS, _write_long
+from services import audio_io
+
+def _snr(reference, estimate):
+    """SNR of `estimate` against `reference` after the best single gain"""
+    n = min(reference.shape[-1], estimate.shape[-1])
+    reference, estimate = reference[..., :n], estimate[..., :n]
+    gain = np.sum(reference * estimate) / (np.sum(estimate ** 2) + 1e-12)
+    error = np.sum((reference - gain * estimate) ** 2)
+    return float(10 * np.log10(np.sum(reference ** 2) / (error + 1e-12)))
+
+def run(duration=300, excerpt=10.0, encoding="ogg", repeat=5, channels=2, sample_rate=44100):
+    from services.audio_processor import AudioProcessor
+
+    processor = AudioProcessor()
+    full = {
+        "equalizer": processor.apply_equalizer,
+        "compressor": processor.apply_compressor,
+        "reverb": processor.apply_reverb,
+        "ai_enhance": processor.ai_enhance,
+    }
+    workdir = tempfile.mkdtemp(prefix="preview_bench_")
+    results = []
+    try:
+        path = _write_long(os.path.join(workdir, "long.wav"), duration, sample_rate, channels, "PCM_16")
+        start = max((duration - excerpt) / 2, 0)
+        out = os.path.join(workdir, "full.wav")
+
+        for effect, params in EFFECTS.items():
+            encoded = []
+            def preview():
+                y, sr = processor.preview(path, effect, start, excerpt, **params)
+                encoded[:] = [audio_io.encode(y, sr, encoding, "preview_bench"), y, sr]
+
+            preview()
+            wall, cpu, peak = _measure(preview, repeat)
+            size, y, sr = len(encoded[0]), encoded[1], encoded[2]
+
+            def full_run():
+                audio_io.clear_cache()
+                full[effect](path, out, **params)
+
+            full_wall, _, _ = _measure(full_run, 1)
+            snr = None
+            if effect != "reverb":
+                first = int(round(start * sample_rate))
+                reference, _ = sf.read(out, start=first, frames=int(excerpt * sample_rate),
+                                       dtype="float32", always_2d=True)
+                reference = librosa.resample(reference.T, orig_sr=sample_rate, target_sr=sr)
+                snr = round(_snr(reference, y), 1)
+
+            result = {
+                "effect": effect,
+                "duration": duration,
+                "excerpt_s": excerpt,
+                "preview_sr": sr,
+                "preview_wall_s": round(wall, 4),
+                "preview_cpu_s": round(cpu, 4),
+                "preview_peak_mb": round(peak / (1024 * 1024), 2),
+                "encoded_kb": round(size / 1024, 1),
+                "full_wall_s": round(full_wall, 4),
+                "snr_db": snr,
+            }
+            results.append(result)
+            print(
+                f"{effect:<12} preview {wall * 1000:7.1f} ms {result['preview_peak_mb']:6.1f} MB "
+                f"{result['encoded_kb']:7.1f} KB  full {full_wall * 1000:8.1f} ms  "
+                f"SNR {'-' if snr is None else f'{snr:.1f} dB'}",
+                flush=True
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"encoding": encoding, "channels": channels, "sample_rate": sample_rate, "repeat": repeat},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure effect preview latency and fidelity")
+    parser.add_argument("--duration", type=int, default=300, help="Recording length in seconds")
+    parser.add_argument("--excerpt", type=float, default=10.0, help="Previewed span in seconds")
+    parser.add_argument("--encoding", choices=sorted(audio_io.ENCODINGS), default="ogg")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.duration, args.excerpt, args.encoding, args.repeat, args.channels)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
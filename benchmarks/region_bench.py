@@ -0,0 +1,146 @@
+"""
+Region vs full-file effect benchmark
+
+Applies each effect to a `--region` second span of progressively longer
+recordings with `AudioProcessor.apply_region`, and to the whole file with the
+regular `apply_*` method, for WAV (memory-mapped) and FLAC (seeked) inputs.
+Region cost should stay flat as the file grows while the full render scales
+with it. Each region output is also checked outside the edited span: a WAV
+output must match the input bit for bit there, a FLAC one to within 16-bit
+requantisation.
+
+Usage:
+python -m benchmarks.region_bench
+python -m benchmarks.region_bench --durations 60,600,3600 --full-max 600 --output region.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.dsp_bench import _int_list, _measure
+from benchmarks.signals import make_signal
+from services import audio_io
+
+EFFECTS = {
+    "equalizer": {"eq_bands": [1.2, 1.0, 0.8, 1.1, 0.9]},
+    "compressor": {"ratio": 4.0},
+    "reverb": {"room_size": 0.5, "damping": 0.5},
+    "ai_enhance": {},
+}
+
+def _write_long(path, duration, sample_rate, channels, subtype):
+    """Tile a 60 s test signal up to `duration` without holding it all in memory"""
+    block = make_signal(min(duration, 60), sample_rate, channels)
+    remaining = duration * sample_rate
+    with sf.SoundFile(path, "w", samplerate=sample_rate, channels=channels, subtype=subtype) as f:
+        while remaining > 0:
+            part = block[:remaining]
+            f.write(part)
+            remaining -= len(part)
+    return path
+
+def _outside_error(input_path, output_path, first, last):
+    """Largest absolute difference between input and output outside frames `[first, last)`"""
+    worst = 0.0
+    with sf.SoundFile(input_path) as a, sf.SoundFile(output_path) as b:
+        for lo, hi in ((0, first), (last, a.frames)):
+            a.seek(lo)
+            b.seek(lo)
+            while lo < hi:
+                n = min(1 << 18, hi - lo)
+                x = a.read(n, dtype="float32", always_2d=True)
+                y = b.read(n, dtype="float32", always_2d=True)
+                worst = max(worst, float(np.max(np.abs(x - y))) if len(x) else 0.0)
+                lo += n
+    return worst
+
+def run(durations, region=10.0, full_max=600, repeat=3, channels=2, sample_rate=44100):
+    from services.audio_processor import AudioProcessor
+
+    processor = AudioProcessor()
+    full = {
+        "equalizer": lambda i, o, p: processor.apply_equalizer(i, o, **p),
+        "compressor": lambda i, o, p: processor.apply_compressor(i, o, **p),
+        "reverb": lambda i, o, p: processor.apply_reverb(i, o, **p),
+        "ai_enhance": lambda i, o, p: processor.ai_enhance(i, o),
+    }
+    workdir = tempfile.mkdtemp(prefix="region_bench_")
+    results = []
+    try:
+        for duration in durations:
+            for fmt, subtype in (("wav", "PCM_16"), ("flac", "PCM_16")):
+                path = _write_long(os.path.join(workdir, f"long_{duration}s.{fmt}"),
+                                   duration, sample_rate, channels, subtype)
+                start = max((duration - region) / 2, 0)
+                end = min(start + region, duration)
+                out = os.path.join(workdir, "out.wav")
+
+                for effect, params in EFFECTS.items():
+                    def region_run():
+                        processor.apply_region(path, out, effect, start, end, **params)
+
+                    region_run()
+                    wall, cpu, peak = _measure(region_run, repeat)
+                    error = _outside_error(path, out, int(round(start * sample_rate)), int(round(end * sample_rate)))
+                    result = {
+                        "key": f"{effect}/{fmt}/{duration}s",
+                        "effect": effect,
+                        "format": fmt,
+                        "duration": duration,
+                        "region_s": end - start,
+                        "region_wall_s": round(wall, 4),
+                        "region_cpu_s": round(cpu, 4),
+                        "region_peak_mb": round(peak / (1024 * 1024), 2),
+                        "outside_max_error": error,
+                        "full_wall_s": None,
+                        "full_peak_mb": None,
+                    }
+                    if duration <= full_max:
+                        def full_run():
+                            audio_io.clear_cache()
+                            full[effect](path, out, params)
+
+                        wall, _, peak = _measure(full_run, 1)
+                        result["full_wall_s"] = round(wall, 4)
+                        result["full_peak_mb"] = round(peak / (1024 * 1024), 2)
+                    results.append(result)
+                    full_text = "-" if result["full_wall_s"] is None else (
+                        f"{result['full_wall_s'] * 1000:9.1f} ms {result['full_peak_mb']:7.1f} MB"
+                    )
+                    print(
+                        f"{result['key']:<28} region {result['region_wall_s'] * 1000:8.1f} ms "
+                        f"{result['region_peak_mb']:7.1f} MB  full {full_text}  outside err {error:.1e}",
+                        flush=True
+                    )
+                os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"region": region, "channels": channels, "sample_rate": sample_rate, "repeat": repeat},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare region and full-file effect rendering")
+    parser.add_argument("--durations", type=_int_list, default=[60, 600], help="Recording lengths in seconds")
+    parser.add_argument("--region", type=float, default=10.0, help="Edited span in seconds")
+    parser.add_argument("--full-max", type=int, default=600, help="Skip full renders of longer recordings")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.durations, args.region, args.full_max, args.repeat, args.channels)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
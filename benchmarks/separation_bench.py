@@ -0,0 +1,111 @@
+"""
+Vocal/instrument separation quality and speed benchmark
+
+Mixes synthetic stems with known ground truth (a repeating accompaniment loop
+and a non-repeating sung melody, see `signals.make_stems`), runs each
+separator end to end on the mixture file and scores the written outputs with
+scale-invariant SDR (SI-SDR, dB; higher is better) against the true stems.
+The mixture's own SI-SDR is reported as the do-nothing reference, so a
+method's improvement is its score minus that one.
+
+Methods:
+    band_pass   app.separate_audio_simple (200-3000 Hz Butterworth band)
+    spectral    services.spectral_separator (HPSS + REPET soft masks)
+
+Usage:
+python -m benchmarks.separation_bench
+python -m benchmarks.separation_bench --durations 10,60 --output separation.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.dsp_bench import _int_list, _measure
+from benchmarks.signals import make_stems
+
+def si_sdr(reference, estimate):
+    """Scale-invariant signal-to-distortion ratio in dB"""
+    n = min(len(reference), len(estimate))
+    reference = reference[:n].astype(np.float64)
+    estimate = estimate[:n].astype(np.float64)
+    target = np.dot(estimate, reference) / (np.dot(reference, reference) + 1e-12) * reference
+    noise = estimate - target
+    return float(10 * np.log10(np.sum(target ** 2) / (np.sum(noise ** 2) + 1e-12)))
+
+def _methods():
+    from app import separate_audio_simple
+    from services.spectral_separator import SpectralSeparator
+
+    spectral = SpectralSeparator()
+    return [
+        ("band_pass", separate_audio_simple),
+        ("spectral", spectral.separate_file),
+    ]
+
+def run(durations, repeat=3, sample_rate=44100):
+    workdir = tempfile.mkdtemp(prefix="separation_bench_")
+    results = []
+    try:
+        methods = _methods()
+        for duration in durations:
+            vocals, accompaniment = make_stems(duration, sample_rate)
+            mixture = vocals + accompaniment
+            path = os.path.join(workdir, f"mix_{duration}s.wav")
+            sf.write(path, mixture, sample_rate, subtype="FLOAT")
+            reference = {
+                "vocals_si_sdr": round(si_sdr(vocals, mixture), 2),
+                "instruments_si_sdr": round(si_sdr(accompaniment, mixture), 2),
+            }
+            print(f"mixture/{duration}s{'':<24} vocals {reference['vocals_si_sdr']:6.2f} dB  "
+                  f"instruments {reference['instruments_si_sdr']:6.2f} dB", flush=True)
+
+            for name, separate in methods:
+                out_dir = os.path.join(workdir, name)
+                separate(path, out_dir)
+                wall, cpu, peak = _measure(lambda: separate(path, out_dir), repeat)
+                est_vocals, _ = sf.read(os.path.join(out_dir, "vocals.wav"), dtype="float32")
+                est_instruments, _ = sf.read(os.path.join(out_dir, "accompaniment.wav"), dtype="float32")
+                result = {
+                    "key": f"{name}/{duration}s",
+                    "method": name,
+                    "duration": duration,
+                    "wall_s": round(wall, 4),
+                    "cpu_s": round(cpu, 4),
+                    "realtime_factor": round(duration / wall, 2) if wall > 0 else None,
+                    "peak_mb": round(peak / (1024 * 1024), 2),
+                    "vocals_si_sdr": round(si_sdr(vocals, est_vocals), 2),
+                    "instruments_si_sdr": round(si_sdr(accompaniment, est_instruments), 2),
+                    "mixture": reference,
+                }
+                results.append(result)
+                print(
+                    f"{result['key']:<32} vocals {result['vocals_si_sdr']:6.2f} dB  "
+                    f"instruments {result['instruments_si_sdr']:6.2f} dB  "
+                    f"{wall * 1000:9.1f} ms  rtf {result['realtime_factor']:>7}  peak {result['peak_mb']:7.1f} MB",
+                    flush=True
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"meta": {"sample_rate": sample_rate, "repeat": repeat}, "results": results}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare separation quality and speed")
+    parser.add_argument("--durations", type=_int_list, default=[10, 30, 120], help="Mixture lengths in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.durations, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Deterministic synthetic test signals for benchmarks
+
+Every signal is a chord, a click track at a known tempo and a little noise,
+generated from a fixed seed, so runs on different machines process
+identical audio.
+"""
+import os
+
+import numpy as np
+import soundfile as sf
+
+def make_signal(duration, sample_rate=44100, channels=1, bpm=120, seed=0):
+    """Return a float32 `(samples, channels)` test signal"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+
+    # Sustained chord spread across the vocal and bass ranges
+    tone = sum(
+        amp * np.sin(2 * np.pi * freq * t)
+        for freq, amp in ((110.0, 0.3), (440.0, 0.2), (1320.0, 0.1), (5000.0, 0.05))
+    )
+
+    # Decaying clicks on every beat so tempo detection has something to find
+    clicks = np.zeros(n)
+    click_len = int(0.05 * sample_rate)
+    click = np.exp(-np.linspace(0, 8, click_len)) * rng.standard_normal(click_len)
+    for start in range(0, n - click_len, int(sample_rate * 60.0 / bpm)):
+        clicks[start:start + click_len] += click * 0.5
+
+    mono = tone + clicks + 0.01 * rng.standard_normal(n)
+
+    # Slightly different gain and delay per channel so channels are not identical
+    out = np.empty((n, channels), dtype=np.float32)
+    for ch in range(channels):
+        out[:, ch] = np.roll(mono, ch * 7) * (1.0 - 0.1 * ch)
+    out /= np.max(np.abs(out)) / 0.8
+    return out
+
+def write_signal(directory, duration, sample_rate=44100, channels=1, bpm=120):
+    """Write a test signal to a WAV file and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"signal_{duration}s_{channels}ch_{sample_rate}.wav")
+    if not os.path.exists(path):
+        sf.write(path, make_signal(duration, sample_rate, channels, bpm), sample_rate, subtype="PCM_16")
+    return path
+
+def make_stems(duration, sample_rate=44100, bpm=120, seed=0):
+    """Return float32 mono `(vocals, accompaniment)` with known ground truth
+
+    The accompaniment is a two-bar loop of kick, hi-hat, bass and chord that
+    repeats exactly; the "vocal" is a vibrato voice singing a random,
+    non-repeating melody in syllables. Their sum is the test mixture.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    beat = int(sample_rate * 60.0 / bpm)
+    loop_len = 8 * beat
+    t = np.arange(loop_len) / sample_rate
+
+    loop = np.zeros(loop_len)
+    kick_t = np.arange(int(0.15 * sample_rate)) / sample_rate
+    kick = np.sin(2 * np.pi * (60 + 60 * np.exp(-kick_t * 30)) * kick_t) * np.exp(-kick_t * 18)
+    hat = rng.standard_normal(int(0.03 * sample_rate)) * np.exp(-np.linspace(0, 6, int(0.03 * sample_rate)))
+    for b in range(8):
+        if b % 2 == 0:
+            loop[b * beat:b * beat + len(kick)] += 0.6 * kick
+        for half in (0, beat // 2):
+            start = b * beat + half
+            loop[start:start + len(hat)] += 0.08 * hat
+    bass_notes = (55.0, 55.0, 73.42, 65.41)
+    chords = ((220.0, 277.18, 329.63), (220.0, 277.18, 329.63), (293.66, 369.99, 440.0), (261.63, 329.63, 392.0))
+    for bar in range(4):
+        segment = slice(bar * 2 * beat, (bar + 1) * 2 * beat)
+        tt = t[segment]
+        env = np.exp(-(tt - tt[0]) * 1.5)
+        loop[segment] += 0.25 * np.sin(2 * np.pi * bass_notes[bar] * tt) * env
+        loop[segment] += sum(0.06 * np.sin(2 * np.pi * f * tt) for f in chords[bar])
+    accompaniment = np.tile(loop, n // loop_len + 1)[:n]
+
+    vocals = np.zeros(n)
+    position = int(0.5 * sample_rate)
+    while position < n:
+        length = int(rng.uniform(0.25, 0.9) * sample_rate)
+        gap = int(rng.uniform(0.05, 0.4) * sample_rate)
+        f0 = 220.0 * 2 ** (rng.integers(-5, 10) / 12.0)
+        tt = np.arange(min(length, n - position)) / sample_rate
+        pitch = f0 * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * tt))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        note = sum((0.5 / k) * np.sin(k * phase) for k in range(1, 8))
+        attack = np.minimum(1.0, tt / 0.04) * np.minimum(1.0, (tt[-1] - tt) / 0.08 + 1e-3)
+        vocals[position:position + len(tt)] += 0.25 * note * attack
+        position += length + gap
+
+    return vocals.astype(np.float32), accompaniment.astype(np.float32)
@@ -0,0 +1,204 @@
+"""
+Startup benchmark
+
+Measures how long `import main` / `import app` take in a fresh interpreter,
+lists the slowest imports from `python -X importtime`, and optionally boots
+each app under uvicorn to time the first successful /health (liveness) and
+/ready (services loaded) responses. With `--jit`, app.py is booted three
+times against a fresh Numba cache directory (no warm-up with an empty cache,
+no warm-up with the cache populated, warm-up enabled) and the latency of the
+first /api/separate request is recorded for each. Results can be compared
+against a stored baseline like the DSP benchmarks.
+
+Usage:
+python -m benchmarks.startup_bench
+python -m benchmarks.startup_bench --serve --output startup.json
+python -m benchmarks.startup_bench --modules app --jit
+python -m benchmarks.startup_bench --baseline startup_baseline.json --tolerance 0.3
+"""
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+def _env(overrides=None):
+    env = dict(os.environ)
+    env.update(overrides or {})
+    # main.py creates tables at import; keep the benchmark off the real database
+    db_path = os.path.join(tempfile.gettempdir(), "startup_bench.db")
+    env.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    return env
+
+def import_time(module, repeat=5):
+    """Median wall time of importing `module` in a fresh interpreter"""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            cwd=ROOT, env=_env(), capture_output=True, text=True, check=True
+        )
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+def slowest_imports(module, limit=15):
+    """Top-level packages with the largest cumulative import time"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True, check=True
+    )
+    pattern = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s*(\S+)")
+    totals = {}
+    for match in pattern.finditer(out.stderr):
+        # A package's first import carries the cost of everything it pulls in
+        package = match.group(2).split(".")[0]
+        if package != module:
+            totals[package] = max(totals.get(package, 0.0), int(match.group(1)) / 1e6)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"module": name, "cumulative_s": round(seconds, 4)} for name, seconds in ranked]
+
+def _wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.02)
+    return False
+
+def _first_separation(base):
+    """Latency of the first /api/separate call on a short synthetic clip"""
+    import httpx
+    import soundfile as sf
+    from benchmarks.signals import make_signal
+
+    buffer = io.BytesIO()
+    sf.write(buffer, make_signal(5, 44100, 2), 44100, format="WAV", subtype="PCM_16")
+    start = time.perf_counter()
+    response = httpx.post(
+        f"{base}/api/separate", files={"audio": ("first.wav", buffer.getvalue(), "audio/wav")}, timeout=300
+    )
+    elapsed = time.perf_counter() - start
+    if response.status_code == 200:
+        httpx.delete(f"{base}/api/cleanup/{response.json()['job_id']}")
+    return round(elapsed, 3) if response.status_code == 200 else None
+
+def serve_time(module, port, timeout=120, env=None, first_request=False):
+    """Seconds from process start until /health and /ready first return 200"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=_env(env), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = start + timeout
+        base = f"http://127.0.0.1:{port}"
+        health = _wait_for(f"{base}/health", deadline) and time.perf_counter() - start
+        ready = _wait_for(f"{base}/ready", deadline) and time.perf_counter() - start
+        result = {
+            "health_s": round(health, 3) if health else None,
+            "ready_s": round(ready, 3) if ready else None,
+        }
+        if first_request and ready:
+            result["first_request_s"] = _first_separation(base)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def jit_scenarios(port):
+    """Cold vs warm first-request latency for app.py against one fresh Numba cache"""
+    cache_dir = tempfile.mkdtemp(prefix="numba_cache_")
+    try:
+        scenarios = [
+            ("no_warmup_cold_cache", "false"),
+            ("no_warmup_warm_cache", "false"),
+            ("warmup", "true"),
+        ]
+        results = {}
+        for name, warmup in scenarios:
+            env = {"NUMBA_CACHE_DIR": cache_dir, "WARMUP_ON_STARTUP": warmup}
+            results[name] = serve_time("app", port, env=env, first_request=True)
+            print(f"  {name:<22} {results[name]}", flush=True)
+        return results
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+def run(modules, repeat=5, serve=False, port=8765, jit=False):
+    results = []
+    for i, module in enumerate(modules):
+        result = {
+            "key": module,
+            "import_s": round(import_time(module, repeat), 4),
+            "slowest_imports": slowest_imports(module),
+        }
+        if serve:
+            result.update(serve_time(module, port + i))
+        results.append(result)
+        print(
+            f"{module:<8} import {result['import_s'] * 1000:8.1f} ms"
+            + (f"  /health {result['health_s']}s  /ready {result['ready_s']}s" if serve else ""),
+            flush=True
+        )
+        if jit and module == "app":
+            result["jit"] = jit_scenarios(port + len(modules) + i)
+    return {"meta": {"python": sys.version.split()[0], "repeat": repeat}, "results": results}
+
+def compare(report, baseline, tolerance=0.3):
+    previous = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        base = previous.get(result["key"])
+        if base is None:
+            continue
+        for field in ("import_s", "health_s", "ready_s"):
+            if result.get(field) is None or base.get(field) is None:
+                continue
+            if result[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{result['key']}: {field} {base[field]}s -> {result[field]}s")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark application startup")
+    parser.add_argument("--modules", default="main,app", help="Comma-separated app modules")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--serve", action="store_true", help="Also boot each app and time /health and /ready")
+    parser.add_argument("--jit", action="store_true", help="Compare cold/warm JIT cache first-request latency for app.py")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    report = run(args.modules.split(","), args.repeat, args.serve, args.port, args.jit)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
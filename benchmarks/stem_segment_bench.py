@@ -0,0 +1,132 @@
+"""
+Segment-parallel stem separation benchmark
+
+Separates one long recording with `StemSeparator.separate` at several worker
+counts and reports wall time, speed-up over one worker, the parent's traced
+peak and the largest worker's peak USS. The worker peak should follow
+`--segment`, not `--duration`. Each stitched stem is compared with the
+whole-file separation (SNR, dB) to check the seams; without Spleeter
+installed this exercises the filter-bank fallback.
+
+Usage:
+python -m benchmarks.stem_segment_bench
+python -m benchmarks.stem_segment_bench --duration 1800 --segment 120 --workers 1,2,4,8 --output stems.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.dsp_bench import _int_list
+from benchmarks.memory_bench import _children
+from benchmarks.region_bench import _write_long
+from metrics import memory_usage
+
+class _WorkerPeak:
+    """Samples the USS of this process's children until stopped; `peak` is the largest seen
+
+    USS rather than RSS, since a spawned worker's shared library pages are
+    not what grows with the segment.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            for pid in _children(os.getpid()):
+                self.peak = max(self.peak, memory_usage(pid).get("uss", 0))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def _snr(reference_path, path):
+    reference, _ = sf.read(reference_path, dtype="float32")
+    estimate, _ = sf.read(path, dtype="float32")
+    n = min(len(reference), len(estimate))
+    error = np.sum((reference[:n] - estimate[:n]) ** 2)
+    return float(10 * np.log10(np.sum(reference[:n] ** 2) / (error + 1e-12)))
+
+def run(duration, segment, worker_counts, channels=2, sample_rate=44100):
+    from services.stem_separator import StemSeparator
+
+    separator = StemSeparator()
+    workdir = tempfile.mkdtemp(prefix="stem_segment_bench_")
+    results = []
+    try:
+        path = _write_long(os.path.join(workdir, "long.wav"), duration, sample_rate, channels, "PCM_16")
+        # Whole-file reference: one segment covering everything
+        reference = separator.separate(path, os.path.join(workdir, "reference"), segment_seconds=duration)
+
+        baseline = None
+        for workers in worker_counts:
+            output_dir = os.path.join(workdir, f"workers_{workers}")
+            tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                with _WorkerPeak() as worker_peak:
+                    stems = separator.separate(path, output_dir, segment_seconds=segment, workers=workers)
+                wall = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            baseline = baseline or wall
+
+            result = {
+                "workers": workers,
+                "duration": duration,
+                "segment": segment,
+                "wall_s": round(wall, 3),
+                "speedup": round(baseline / wall, 2),
+                "parent_peak_mb": round(peak / (1024 * 1024), 1),
+                "worker_peak_uss_mb": round(worker_peak.peak / (1024 * 1024), 1),
+                "min_snr_db": round(min(_snr(reference[name], stems[name]) for name in stems), 1),
+            }
+            results.append(result)
+            print(
+                f"workers {workers:>2}  {result['wall_s']:8.2f} s  speed-up {result['speedup']:5.2f}x  "
+                f"parent {result['parent_peak_mb']:7.1f} MB  worker uss {result['worker_peak_uss_mb']:7.1f} MB  "
+                f"min SNR {result['min_snr_db']:6.1f} dB",
+                flush=True
+            )
+            shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"channels": channels, "sample_rate": sample_rate, "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure segment-parallel stem separation")
+    parser.add_argument("--duration", type=int, default=600, help="Recording length in seconds")
+    parser.add_argument("--segment", type=float, default=120.0, help="Segment length in seconds")
+    parser.add_argument("--workers", type=_int_list, default=[1, 2, 4])
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args(argv)
+
+    report = run(args.duration, args.segment, args.workers, args.channels)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,11 +16,50 @@ class Settings(BaseSettings):
     TEMP_DIR: str = "temp"
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
     
+    # Profiling (disabled unless a token is set)
+    PROFILE_TOKEN: str = ""
+    PROFILE_DIR: str = "profiles"
+    
+    # Startup warm-up; the Numba cache directory should be shared by all workers
+    WARMUP_ON_STARTUP: bool = True
+    JIT_CACHE_DIR: str = "cache/numba"
+    
+    # Job/result/rate-limit state shared by all workers, and the worker count
+    STATE_BACKEND_URL: str = "sqlite:///temp/state.db"
+    WEB_CONCURRENCY: int = 1
+    RATE_LIMIT_PER_MINUTE: int = 0
+    
+    # Per-worker LRU of decoded/resampled audio buffers
+    RESAMPLE_CACHE_MB: int = 256
+    
+    # Processing slots per worker (0 = one per CPU), per-user concurrency and
+    # the queue lengths past which requests get 429 + Retry-After
+    SCHEDULER_MAX_CONCURRENT: int = 0
+    SCHEDULER_PER_USER: int = 2
+    SCHEDULER_MAX_QUEUED: int = 64
+    SCHEDULER_MAX_QUEUED_PER_USER: int = 8
+    # Estimated processing memory per worker (0 = 60% of the container limit / workers);
+    # larger jobs take the block-streaming path or wait for memory
+    MEMORY_BUDGET_MB: int = 0
+    STREAM_BLOCK_SECONDS: float = 30.0
+    # Stem separation of longer inputs runs in overlapping segments across
+    # worker processes (0 = as many as cores and the memory budget allow)
+    STEM_SEGMENT_SECONDS: float = 120.0
+    STEM_WORKERS: int = 0
+    # Rendered spectrogram tiles, shared by all workers and evicted least recently used first
+    SPECTROGRAM_CACHE_DIR: str = "cache/spectrogram"
+    SPECTROGRAM_CACHE_MB: int = 256
+    # Cached intermediate renders of effect stacks, evicted least recently used first
+    EFFECT_STACK_CACHE_DIR: str = "cache/effect_stack"
+    EFFECT_STACK_CACHE_MB: int = 2048
+    
     # Audio Processing
     SAMPLE_RATE: int = 44100
     CHANNELS: int = 1
     
     class Config:
         env_file = ".env"
+        # .env may also hold settings of the standalone apps
+        extra = "ignore"
 
 settings = Settings()
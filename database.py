@@ -1,9 +1,15 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
+from metrics import instrument_engine
 
 engine = create_engine(settings.DATABASE_URL)
+instrument_engine(engine)
+# Workers forked by prefork.py must not reuse the parent's pooled connections
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -13,3 +19,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def add_missing_columns():
+    """Add nullable columns and indexes defined on the models but missing from existing tables
+
+    `create_all` only creates whole tables, so columns added to a model
+    later would otherwise never reach an existing database.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
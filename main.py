@@ -1,18 +1,28 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 import uvicorn
+import asyncio
 from pathlib import Path
 import shutil
 from typing import Optional
 import os
 
 from routers import audio_processing, auth, projects
-from database import engine, Base
+from database import engine, Base, add_missing_columns
 from config import settings
+import metrics
+from profiling import ProfilingMiddleware, create_profile_router
+from services.effect_history import effect_log_writer
+from services import registry
+from services.warmup import configure_jit_cache
 
-# Create database tables
+# Must happen before anything imports librosa/numba
+configure_jit_cache(settings.JIT_CACHE_DIR)
+
+# Create database tables, and columns added to existing ones since
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 app = FastAPI(title="AI Audio Studio API", version="1.0.0")
 
@@ -25,6 +35,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request latency for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Opt-in request profiling for admins; a no-op unless PROFILE_TOKEN is set
+app.add_middleware(ProfilingMiddleware, token=settings.PROFILE_TOKEN, output_dir=settings.PROFILE_DIR)
+
 # Create necessary directories
 Path("uploads").mkdir(exist_ok=True)
 Path("processed").mkdir(exist_ok=True)
@@ -34,6 +50,33 @@ Path("temp").mkdir(exist_ok=True)
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(audio_processing.router, prefix="/api/audio", tags=["Audio Processing"])
 app.include_router(projects.router, prefix="/api/projects", tags=["Projects"])
+app.include_router(
+    create_profile_router(settings.PROFILE_TOKEN, settings.PROFILE_DIR),
+    prefix="/debug/profiles",
+    tags=["Profiling"]
+)
+
+def preload():
+    """Build and warm the audio services in the parent before prefork.py forks workers"""
+    registry.warm_up(settings.WARMUP_ON_STARTUP)
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the background effect log writer and warm up the audio services"""
+    effect_log_writer.start()
+    if registry.is_ready():
+        # Preloaded by the pre-fork parent; the services are already shared
+        return
+    # Import the DSP stack and compile JIT kernels off the event loop so
+    # /health answers straight away
+    asyncio.get_running_loop().run_in_executor(
+        None, registry.warm_up, settings.WARMUP_ON_STARTUP
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued effect logs before the worker exits"""
+    effect_log_writer.stop()
 
 @app.get("/")
 async def root():
@@ -47,5 +90,17 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Ready once the audio services are loaded; /health only reports liveness"""
+    if not registry.is_ready():
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
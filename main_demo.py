@@ -6,6 +6,8 @@ from pathlib import Path
 from typing import Optional
 from pydantic import BaseModel
 
+from shared_state import get_state_backend
+
 # Create FastAPI app
 app = FastAPI(title="AI Audio Studio API - Demo Mode", version="1.0.0")
 
@@ -22,10 +24,11 @@ app.add_middleware(
 Path("uploads").mkdir(exist_ok=True)
 Path("processed").mkdir(exist_ok=True)
 
-# In-memory storage for demo
-users_db = {}
-projects_db = {}
-recordings_db = {}
+# Demo storage in the shared state backend so every worker sees the same data
+state = get_state_backend()
+users_db = state.namespace("demo_users")
+projects_db = state.namespace("demo_projects")
+recordings_db = state.namespace("demo_recordings")
 
 class UserCreate(BaseModel):
     email: str
@@ -74,7 +77,7 @@ async def register(user: UserCreate):
     users_db[user.email] = {
         "email": user.email,
         "username": user.username,
-        "id": len(users_db) + 1
+        "id": state.incr("demo_ids", "users")
     }
     
     return {
@@ -93,7 +96,7 @@ async def login(username: str, password: str):
 # Audio processing endpoints
 @app.post("/api/audio/upload")
 async def upload_audio(file: UploadFile = File(...)):
-    recording_id = len(recordings_db) + 1
+    recording_id = state.incr("demo_ids", "recordings")
     recordings_db[recording_id] = {
         "id": recording_id,
         "filename": file.filename,
@@ -174,7 +177,7 @@ async def get_projects():
 
 @app.post("/api/projects/")
 async def create_project(project: ProjectCreate):
-    project_id = len(projects_db) + 1
+    project_id = state.incr("demo_ids", "projects")
     projects_db[project_id] = {
         "id": project_id,
         "name": project.name,
@@ -0,0 +1,297 @@
+"""
+Lightweight Prometheus-compatible metrics
+
+Counters, gauges and histograms are kept in process memory and rendered in the
+Prometheus text exposition format by `render()`. Recording a sample is a dict
+lookup and a few additions under a lock, so instrumentation can stay on in
+production without a client library.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import progress
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = []
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs
+    )
+    return "{" + body + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        for suffix, label_values, extra, value in self._samples():
+            labels = _format_labels(self.label_names, label_values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("", key, None, value) for key, value in items]
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._callbacks = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func, **labels):
+        """Read the value from `func()` at scrape time, e.g. a queue length"""
+        with self._lock:
+            self._callbacks[self._key(labels)] = func
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+            callbacks = list(self._callbacks.items())
+        samples = [("", key, None, value) for key, value in items]
+        for key, func in callbacks:
+            try:
+                samples.append(("", key, None, func()))
+            except Exception:
+                continue
+        return samples
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, running sum, total count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", key, ("le", _format_value(bound)), cumulative))
+            samples.append(("_sum", key, None, total))
+            samples.append(("_count", key, None, count))
+        return samples
+
+def render():
+    """All registered metrics in Prometheus text format"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    labels=("method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "audio_stage_duration_seconds", "Time spent in each processing stage",
+    labels=("service", "stage")
+)
+AUDIO_SECONDS = Counter(
+    "audio_processed_seconds_total", "Seconds of audio processed", labels=("service",)
+)
+CPU_SECONDS = Counter(
+    "audio_cpu_seconds_total", "CPU seconds spent processing audio", labels=("service",)
+)
+REALTIME_FACTOR = Gauge(
+    "audio_realtime_factor", "Audio seconds per CPU second for the last job", labels=("service",)
+)
+QUEUE_DEPTH = Gauge("queue_depth", "Items waiting in a queue", labels=("queue",))
+SCHEDULER_WAIT = Histogram(
+    "scheduler_queue_wait_seconds", "Time a job waited for a processing slot", labels=("priority",)
+)
+SCHEDULER_RUNNING = Gauge("scheduler_running_jobs", "Jobs holding a processing slot", labels=("priority",))
+SCHEDULER_MEMORY = Gauge(
+    "scheduler_memory_bytes", "Estimated memory reserved by running jobs, and the budget", labels=("kind",)
+)
+SCHEDULER_REJECTIONS = Counter(
+    "scheduler_rejections_total", "Jobs refused because the queue was full", labels=("priority", "reason")
+)
+SEPARATION_BATCH_SIZE = Histogram(
+    "separation_batch_size", "Tracks per batched Spleeter run", buckets=(1, 2, 4, 8, 16, 32)
+)
+STEM_SEAM_MISMATCH = Histogram(
+    "stem_seam_mismatch_ratio", "Disagreement between neighbouring segments' stems across a seam",
+    labels=("stem",), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups", labels=("cache", "result"))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Fraction of cache lookups that hit", labels=("cache",))
+PROCESS_MEMORY = Gauge(
+    "process_memory_bytes",
+    "Memory of this worker: rss, pss (shared pages split between sharers) and uss (private)",
+    labels=("kind",)
+)
+
+def memory_usage(pid="self"):
+    """RSS, PSS and USS of a process in bytes, from /proc on Linux"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        usage["rss"] = fields.get("Rss", 0)
+        usage["pss"] = fields.get("Pss", 0)
+        usage["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    except OSError:
+        # No smaps_rollup (non-Linux or old kernel); fall back to peak RSS of this process
+        import resource
+        if pid == "self" or pid == os.getpid():
+            usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
+
+for _kind in ("rss", "pss", "uss"):
+    PROCESS_MEMORY.set_function(lambda kind=_kind: memory_usage().get(kind, 0), kind=_kind)
+
+@contextmanager
+def stage_timer(service, stage):
+    """Time a block of work as one stage of a service, reporting its start as progress"""
+    progress.stage(service, stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, service=service, stage=stage)
+
+class _Job:
+    def __init__(self):
+        self.audio_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+@contextmanager
+def track_job(service):
+    """Account audio seconds against the CPU time used by the calling thread
+
+    Set `job.audio_seconds` inside the block once the input length is known.
+    Work handed to other processes is invisible to the calling thread; add
+    the CPU time they report to `job.cpu_seconds`.
+    """
+    job = _Job()
+    cpu_start = time.thread_time()
+    try:
+        yield job
+    finally:
+        cpu_used = time.thread_time() - cpu_start + job.cpu_seconds
+        CPU_SECONDS.inc(cpu_used, service=service)
+        if job.audio_seconds:
+            AUDIO_SECONDS.inc(job.audio_seconds, service=service)
+            if cpu_used > 0:
+                REALTIME_FACTOR.set(job.audio_seconds / cpu_used, service=service)
+
+def record_cache(cache, hit):
+    """Count a cache lookup and keep the hit ratio gauge current"""
+    CACHE_REQUESTS.inc(result="hit" if hit else "miss", cache=cache)
+    hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+    total = hits + CACHE_REQUESTS.get(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / total, cache=cache)
+
+def instrument_engine(engine):
+    """Record every SQL statement executed on `engine` as a `db` stage"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is not None:
+            STAGE_DURATION.observe(time.perf_counter() - start, service="database", stage="db")
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"]
+            )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -16,6 +16,10 @@ class User(Base):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        # Keyset pagination of a user's projects
+        Index("ix_projects_user_id_id", "user_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -29,6 +33,10 @@ class Project(Base):
 
 class Recording(Base):
     __tablename__ = "recordings"
+    __table_args__ = (
+        # Keyset pagination and aggregates of a project's recordings
+        Index("ix_recordings_project_id_id", "project_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
@@ -45,11 +53,19 @@ class Recording(Base):
 
 class EffectLog(Base):
     __tablename__ = "effect_logs"
+    __table_args__ = (
+        # Effect history lookups per recording, newest first
+        Index("ix_effect_logs_recording_id_applied_at", "recording_id", "applied_at"),
+        # A recording's effect stack in order
+        Index("ix_effect_logs_recording_id_stack_position", "recording_id", "stack_position"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     recording_id = Column(Integer, ForeignKey("recordings.id"))
     effect_type = Column(String(50))
     parameters = Column(Text)
     applied_at = Column(DateTime, default=datetime.utcnow)
+    # Position in the recording's non-destructive effect stack; NULL for one-off applications
+    stack_position = Column(Integer, nullable=True)
     
     recording = relationship("Recording", back_populates="effects")
@@ -0,0 +1,173 @@
+"""
+Pre-fork server for the audio apps
+
+`uvicorn --workers N` and gunicorn without preloading start every worker from
+a fresh interpreter, so each one imports librosa/scipy/TensorFlow, builds its
+services and compiles Numba kernels on its own. This runner does that once in
+the parent instead: it imports the app, calls the module's `preload()` hook
+if it has one, moves everything allocated so far into the GC's permanent
+generation with `gc.freeze()` (so collections in the workers never write to,
+and therefore never copy, those pages), binds the listening socket and then
+forks the workers. Imported code, compiled kernels and lookup tables stay
+shared copy-on-write; only what a worker writes to becomes private.
+
+Per-process RSS, PSS and USS of the parent and each worker are logged a few
+seconds after start-up and again on SIGUSR1.
+
+Usage:
+python -m prefork main:app --workers 4 --port 8000
+python -m prefork app:app --workers 4 --port 8000
+python -m prefork audio_separator:app --workers 2 --port 5000
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from metrics import memory_usage
+
+logger = logging.getLogger("prefork")
+
+def load_app(target):
+    """Import `module:attr`, run the module's `preload()` hook and return the app"""
+    module_name, _, attr = target.partition(":")
+    module = importlib.import_module(module_name)
+    preload = getattr(module, "preload", None)
+    if preload is not None:
+        start = time.perf_counter()
+        preload()
+        logger.info(f"Preloaded {module_name} in {time.perf_counter() - start:.2f}s")
+    return getattr(module, attr or "app")
+
+def _serve(app, sock, log_level):
+    """Run one worker on the inherited listening socket"""
+    if hasattr(app, "wsgi_app"):
+        # Flask apps: werkzeug's threaded server accepts on the shared fd
+        from werkzeug.serving import make_server
+        host, port = sock.getsockname()[:2]
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+        return
+    import uvicorn
+    config = uvicorn.Config(app, lifespan="on", log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+class PreforkServer:
+    def __init__(self, target, host="0.0.0.0", port=8000, workers=2, log_level="info", report_after=10.0):
+        self.target = target
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.log_level = log_level
+        self.report_after = report_after
+        self.children = set()
+        self._stopping = False
+        self._report_requested = False
+
+    def _spawn(self, app, sock):
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+                signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try:
+                _serve(app, sock, self.log_level)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+        logger.info(f"Started worker {pid}")
+
+    def report_memory(self):
+        """Log and return RSS/PSS/USS for the parent and every worker"""
+        rows = {"parent": memory_usage(os.getpid())}
+        rows.update({f"worker {pid}": memory_usage(pid) for pid in sorted(self.children)})
+        mb = 1024 * 1024
+        for name, usage in rows.items():
+            logger.info(
+                f"{name:<14} rss {usage.get('rss', 0) / mb:8.1f} MB  "
+                f"pss {usage.get('pss', 0) / mb:8.1f} MB  uss {usage.get('uss', 0) / mb:8.1f} MB"
+            )
+        total_pss = sum(usage.get("pss", 0) for usage in rows.values())
+        logger.info(f"Total PSS across {len(rows)} processes: {total_pss / mb:.1f} MB")
+        return rows
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_report(self, signum, frame):
+        self._report_requested = True
+
+    def run(self):
+        before = memory_usage()
+        app = load_app(self.target)
+        # Everything allocated so far is long-lived; keep the collector off those pages
+        gc.collect()
+        gc.freeze()
+        after = memory_usage()
+        logger.info(
+            f"Parent RSS {before.get('rss', 0) / 1e6:.1f} MB before preload, "
+            f"{after.get('rss', 0) / 1e6:.1f} MB after; {gc.get_freeze_count()} objects frozen"
+        )
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        logger.info(f"Listening on http://{self.host}:{self.port} with {self.workers} workers")
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGUSR1, self._handle_report)
+
+        for _ in range(self.workers):
+            self._spawn(app, sock)
+
+        report_at = time.monotonic() + self.report_after
+        while not self._stopping:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.discard(pid)
+                logger.warning(f"Worker {pid} exited with status {status}; restarting")
+                self._spawn(app, sock)
+                continue
+            if self._report_requested or (report_at and time.monotonic() >= report_at):
+                self._report_requested = False
+                report_at = None
+                self.report_memory()
+            time.sleep(0.2)
+
+        logger.info("Shutting down workers")
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            os.waitpid(pid, 0)
+        sock.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preload an app once and fork workers that share it")
+    parser.add_argument("target", help="App to serve, e.g. main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--report-after", type=float, default=10.0, help="Seconds until the first memory report")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+    sys.path.insert(0, os.getcwd())
+    PreforkServer(args.target, args.host, args.port, args.workers, args.log_level, args.report_after).run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+"""
+Opt-in per-request profiling
+
+When a request carries the admin token in the `X-Profile-Token` header (or a
+`profile=<token>` query parameter), ProfilingMiddleware samples the stack of
+the thread serving it and of the worker threads it hands work to, traces
+allocations with tracemalloc, and stores a
+flame graph plus an allocation report under a new profile id returned in the
+`X-Profile-Id` response header. Artifacts are fetched from
+`/debug/profiles/{profile_id}/{artifact}` with the same token.
+
+Without a configured token the middleware passes requests straight through.
+With `X-Profile-Mode: cprofile` a deterministic cProfile run is recorded
+instead of sampling.
+
+Processing runs in the threadpool, not on the event loop thread the
+middleware sees. Routes wrap that work with `follow(func)` on the request's
+own thread; when the wrapped function runs, its thread is sampled (or gets
+its own cProfile, merged into the report) for as long as it runs.
+"""
+import cProfile
+import contextvars
+import functools
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from html import escape
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+
+ARTIFACTS = {
+    "flame.svg": "image/svg+xml",
+    "stacks.folded": "text/plain",
+    "allocations.txt": "text/plain",
+    "profile.txt": "text/plain",
+    "profile.pstats": "application/octet-stream",
+    "meta.json": "application/json",
+}
+
+# The profiling session of the request being served, if it is profiled
+_session = contextvars.ContextVar("profile_session", default=None)
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+class StackSampler(threading.Thread):
+    """Samples the Python stacks of a set of threads at a fixed interval
+
+    Starts with one thread; `add` and `discard` change the set while it runs.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def add(self, thread_id):
+        self.thread_ids.add(thread_id)
+
+    def discard(self, thread_id):
+        self.thread_ids.discard(thread_id)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in tuple(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+class _Session:
+    """What one profiled request records, across every thread that works on it"""
+
+    def __init__(self, sampler=None, profiler=None):
+        self.sampler = sampler
+        self.profiler = profiler
+        self.thread_profilers = []
+
+    @contextmanager
+    def attach(self):
+        """Profile the calling thread as part of this request until the block exits"""
+        if self.sampler is not None:
+            thread_id = threading.get_ident()
+            self.sampler.add(thread_id)
+            try:
+                yield
+            finally:
+                self.sampler.discard(thread_id)
+        else:
+            # cProfile only sees the thread it is enabled on
+            profiler = cProfile.Profile()
+            self.thread_profilers.append(profiler)
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+
+    def stats(self, stream):
+        return pstats.Stats(self.profiler, *self.thread_profilers, stream=stream)
+
+def follow(func):
+    """`func`, profiled with the current request when it runs on another thread
+
+    Call this on the request's own thread, where the session is visible,
+    and run the result in the threadpool or an executor. Outside a profiled
+    request `func` is returned unchanged.
+    """
+    session = _session.get()
+    if session is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with session.attach():
+            return func(*args, **kwargs)
+    return run
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            tracemalloc.start(10)
+        else:
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return snapshot, peak
+
+def _allocation_report(snapshot, peak, limit=30):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    lines = [f"Peak traced memory: {peak / (1024 * 1024):.2f} MB", ""]
+    lines.append(f"Top {limit} allocation sites still alive at the end of the request:")
+    for stat in snapshot.statistics("traceback")[:limit]:
+        lines.append(f"{stat.size / 1024:10.1f} KiB in {stat.count:6d} blocks")
+        lines.extend(f"    {line}" for line in stat.traceback.format(limit=6))
+    return "\n".join(lines) + "\n"
+
+def render_flame_graph(stacks, title="Flame graph", width=1200, row_height=16):
+    """Render folded stack counts as a self-contained SVG flame graph"""
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["value"] += count
+        node = root
+        for name in stack.split(";"):
+            child = node["children"].setdefault(name, {"name": name, "value": 0, "children": {}})
+            child["value"] += count
+            node = child
+
+    total = root["value"] or 1
+    rects = []
+
+    def layout(node, x, depth):
+        rects.append((x, depth, node["value"] / total * width, node))
+        offset = x
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            layout(child, offset, depth + 1)
+            offset += child["value"] / total * width
+
+    layout(root, 0.0, 0)
+    max_depth = max(depth for _, depth, _, _ in rects) + 1
+    height = (max_depth + 2) * row_height
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row_height - 4}">{escape(title)} ({total} samples)</text>',
+    ]
+    for x, depth, w, node in rects:
+        if w < 0.5:
+            continue
+        y = height - (depth + 1) * row_height
+        # Warm colours keyed on the name so a function keeps its colour across renders
+        hue = zlib.crc32(node["name"].encode()) % 60
+        pct = node["value"] / total * 100
+        label = escape(node["name"])
+        parts.append(
+            f'<g><title>{label} ({node["value"]} samples, {pct:.1f}%)</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{w:.2f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},80%,60%)"/>'
+        )
+        if w > 40:
+            parts.append(
+                f'<text x="{x + 3:.2f}" y="{y + row_height - 4}">{escape(node["name"][:int(w / 7)])}</text>'
+            )
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests carrying the admin token"""
+
+    def __init__(self, app, token=None, output_dir="profiles", interval=0.005,
+                 skip_prefix="/debug/profiles"):
+        self.app = app
+        self.skip_prefix = skip_prefix
+        self.token = token.encode() if token else None
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+
+    def _requested(self, scope):
+        supplied = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-profile-token":
+                supplied = value
+                break
+        if supplied is None and b"profile=" in scope.get("query_string", b""):
+            values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+            supplied = values[0].encode() if values else None
+        return supplied is not None and hmac.compare_digest(supplied, self.token)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            self.token is None
+            or scope["type"] != "http"
+            or scope["path"].startswith(self.skip_prefix)
+            or not self._requested(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", ()))
+        mode = headers.get(b"x-profile-mode", b"sampling").decode("latin-1")
+        profile_id = uuid.uuid4().hex
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        sampler = profiler = None
+        _start_tracemalloc()
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+        session = _Session(sampler, profiler)
+        token = _session.set(session)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _session.reset(token)
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+            snapshot, peak = _stop_tracemalloc()
+            self._save(profile_id, scope, mode, status["code"], elapsed, session, snapshot, peak)
+
+    def _save(self, profile_id, scope, mode, status, elapsed, session, snapshot, peak):
+        directory = self.output_dir / profile_id
+        directory.mkdir(parents=True, exist_ok=True)
+        title = f"{scope['method']} {scope['path']}"
+        sampler, profiler = session.sampler, session.profiler
+
+        if sampler is not None:
+            folded = "\n".join(f"{stack} {count}" for stack, count in sampler.stacks.most_common())
+            (directory / "stacks.folded").write_text(folded + "\n")
+            (directory / "flame.svg").write_text(render_flame_graph(sampler.stacks, title))
+
+        if profiler is not None:
+            report = io.StringIO()
+            stats = session.stats(report)
+            stats.dump_stats(str(directory / "profile.pstats"))
+            stats.sort_stats("cumulative").print_stats(60)
+            (directory / "profile.txt").write_text(report.getvalue())
+
+        (directory / "allocations.txt").write_text(_allocation_report(snapshot, peak))
+        (directory / "meta.json").write_text(json.dumps({
+            "profile_id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "mode": mode,
+            "status": status,
+            "elapsed_s": round(elapsed, 6),
+            "peak_traced_mb": round(peak / (1024 * 1024), 3),
+            "created_at": time.time(),
+        }, indent=2))
+
+def create_profile_router(token=None, output_dir="profiles"):
+    """Routes for listing and downloading stored profiles, guarded by the admin token"""
+    router = APIRouter()
+    output_dir = Path(output_dir)
+
+    def check_token(supplied):
+        if not token or not supplied or not hmac.compare_digest(supplied, token):
+            raise HTTPException(status_code=404, detail="Not found")
+
+    def profile_dir(profile_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+            raise HTTPException(status_code=404, detail="Profile not found")
+        directory = output_dir / profile_id
+        if not directory.is_dir():
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return directory
+
+    @router.get("/{profile_id}")
+    async def get_profile(profile_id: str, x_profile_token: str = Header(None)):
+        check_token(x_profile_token)
+        directory = profile_dir(profile_id)
+        meta = json.loads((directory / "meta.json").read_text())
+        meta["artifacts"] = sorted(p.name for p in directory.iterdir() if p.name in ARTIFACTS)
+        return meta
+
+    @router.get("/{profile_id}/{artifact}")
+    async def get_profile_artifact(profile_id: str, artifact: str, x_profile_token: str = Header(None)):
+        check_token(x_profile_token)
+        if artifact not in ARTIFACTS:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        path = profile_dir(profile_id) / artifact
+        if not path.exists():
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        return FileResponse(path, media_type=ARTIFACTS[artifact])
+
+    return router
@@ -0,0 +1,128 @@
+"""
+Progress events from long-running audio jobs
+
+Services report what they are doing as they go: `stage` when a stage starts
+(emitted by `metrics.stage_timer`, so decode/encode and every timed DSP step
+come for free), `advance` for chunked work, and `output` when a result file
+is complete and can be downloaded. Reporting is a no-op unless the calling
+context has installed a listener with `listen`; the listener lives in a
+context variable, so concurrent jobs in a thread pool never see each other's
+events.
+
+`stream` runs a blocking job in the default executor and turns its events
+into a Server-Sent Events response body, with a comment line as heartbeat so
+proxies don't close an idle connection while a long stage runs.
+"""
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_listener = ContextVar("progress_listener", default=None)
+
+# Seconds between SSE keep-alive comments while no event arrives
+HEARTBEAT_SECONDS = 15
+
+@contextmanager
+def listen(callback):
+    """Send every event reported inside the block to `callback(event_dict)`"""
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+def emit(event, **fields):
+    callback = _listener.get()
+    if callback is not None:
+        callback({"event": event, "time": time.time(), **fields})
+
+def stage(service, stage):
+    """A stage of `service` has started"""
+    emit("stage", service=service, stage=stage)
+
+def advance(service, stage, done, total):
+    """`done` of `total` units of a chunked stage are finished"""
+    emit("progress", service=service, stage=stage, done=done, total=total,
+         fraction=round(done / total, 4) if total else 1.0)
+
+def output(service, name, path):
+    """Result file `name` is written and complete"""
+    emit("output", service=service, name=name, path=str(path))
+
+def format_sse(data, event=None, event_id=None):
+    """One Server-Sent Events message carrying `data` as JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+def heartbeat():
+    return ": keep-alive\n\n"
+
+_DONE = object()
+
+async def stream(func, *args, prepare=None, result=None, slot=None, **kwargs):
+    """Run `func(*args, **kwargs)` in the executor and yield its progress as SSE
+
+    `prepare(event)` may rewrite each event before it is sent (e.g. turn a
+    file path into a download URL). With a scheduler ticket as `slot`, a
+    `queued` event is sent first and the job starts once the slot is granted;
+    the slot is released when the job finishes. The final message is a `done`
+    event carrying `result(return_value)` (the value itself by default), or an
+    `error` event. A client that disconnects stops the stream, not a job that
+    has started; a job still waiting for its slot is withdrawn.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        try:
+            with listen(put):
+                return func(*args, **kwargs)
+        finally:
+            put(_DONE)
+
+    task = None
+    event_id = 0
+    try:
+        if slot is not None:
+            event_id += 1
+            yield format_sse({"event": "queued", "time": time.time(), "priority": slot.priority}, "queued", event_id)
+            while not await slot.wait(HEARTBEAT_SECONDS):
+                yield heartbeat()
+
+        task = loop.run_in_executor(None, run)
+        if slot is not None:
+            task.add_done_callback(lambda _: slot.release())
+    finally:
+        if slot is not None and task is None:
+            slot.release()
+
+    while True:
+        try:
+            item = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield heartbeat()
+            continue
+        if item is _DONE:
+            break
+        event_id += 1
+        if prepare is not None:
+            item = prepare(item)
+        yield format_sse(item, item["event"], event_id)
+
+    event_id += 1
+    try:
+        value = await task
+    except Exception as e:
+        yield format_sse({"event": "error", "detail": str(e)}, "error", event_id)
+        return
+    yield format_sse({"event": "done", "result": result(value) if result else value}, "done", event_id)
@@ -1,25 +1,87 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
+import json
 import os
+import shutil
 import uuid
 from pathlib import Path
 
+import profiling
+import progress
+from config import settings
 from database import get_db
 from models import Recording, EffectLog, User
 from routers.auth import get_current_user
-from services.audio_processor import AudioProcessor
-from services.noise_cancellation import NoiseCanceller
-from services.stem_separator import StemSeparator
-from services.drum_machine import DrumMachine
+from metrics import stage_timer
+from services.effect_history import effect_log_writer, history_page, EffectHistoryPage
+from services.memory_governor import plan
+from services.registry import get_service
+from services.scheduler import QueueFull, get_scheduler
+from services import effect_stack, spectrogram, waveform
 
 router = APIRouter()
-audio_processor = AudioProcessor()
-noise_canceller = NoiseCanceller()
-stem_separator = StemSeparator()
-drum_machine = DrumMachine()
+
+PROCESSED_DIR = Path("processed")
+
+def _download_url(path):
+    return f"/api/audio/processed/{Path(os.path.relpath(path, PROCESSED_DIR)).as_posix()}"
+
+def _public_event(event):
+    """Replace an output event's server path with its download URL"""
+    if event["event"] == "output":
+        event = dict(event)
+        event["url"] = _download_url(event.pop("path"))
+    return event
+
+def _get_recording(db, recording_id):
+    recording = db.query(Recording).filter(Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return recording
+
+def _memory_plan(service_name, operation, recording, duration=None):
+    """`(estimated peak bytes, streaming)` for running `operation` on `recording`
+
+    `duration` overrides the recording's length for jobs that only touch part
+    of it. Operations that can stream switch to it when the full estimate
+    exceeds this worker's memory budget.
+    """
+    return plan(
+        get_service(service_name),
+        operation,
+        recording.duration if duration is None else duration,
+        recording.sample_rate,
+        recording.channels,
+        get_scheduler().memory.budget,
+        settings.STREAM_BLOCK_SECONDS
+    )
+
+def _admit(user, priority, cost=None, memory=0):
+    """Queue a job with the scheduler, or answer 429 with Retry-After if the queue is full"""
+    try:
+        return get_scheduler().submit(user.id, priority, cost or 1.0, memory=memory)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429, detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def _run_scheduled(ticket, func):
+    """Wait for the ticket's slot, then run `func()` in the threadpool"""
+    async with ticket:
+        return await run_in_threadpool(profiling.follow(func))
+
+def _progress_response(ticket, func, result=None):
+    """Run `func()` once the ticket's slot is granted, streaming progress as Server-Sent Events"""
+    return StreamingResponse(
+        progress.stream(profiling.follow(func), prepare=_public_event, result=result, slot=ticket),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 class EffectParams(BaseModel):
     effect_type: str
@@ -28,11 +90,40 @@ class EffectParams(BaseModel):
     reverb_room_size: Optional[float] = None
     reverb_damping: Optional[float] = None
 
+class RegionEffectParams(EffectParams):
+    start: float = Field(..., ge=0)
+    end: float = Field(..., gt=0)
+    crossfade: float = Field(0.02, ge=0, le=1)
+
+class PreviewParams(EffectParams):
+    start: float = Field(0.0, ge=0)
+    duration: float = Field(10.0, gt=0, le=30)
+    encoding: str = Field("ogg", pattern="^(ogg|wav)$")
+
+class StackStageParams(EffectParams):
+    # Default: on top of the stack
+    position: Optional[int] = Field(None, ge=0)
+
 class DrumParams(BaseModel):
     genre: str
     bpm: Optional[int] = None
     duration: int = 8
 
+def _effect_args(params):
+    """Keyword arguments for `AudioProcessor` effect methods, or 400 for an unusable effect"""
+    if params.effect_type == "equalizer" and params.eq_bands:
+        return {"eq_bands": params.eq_bands}
+    if params.effect_type == "compressor" and params.compression_ratio:
+        return {"ratio": params.compression_ratio}
+    if params.effect_type == "reverb":
+        return {
+            "room_size": params.reverb_room_size or 0.5,
+            "damping": params.reverb_damping or 0.5
+        }
+    if params.effect_type == "ai_enhance":
+        return {}
+    raise HTTPException(status_code=400, detail="Invalid effect type")
+
 @router.post("/upload")
 async def upload_audio(
     file: UploadFile = File(...),
@@ -47,12 +138,14 @@ async def upload_audio(
     file_extension = Path(file.filename).suffix
     file_path = f"uploads/{file_id}{file_extension}"
     
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    with stage_timer("api", "file_io"):
+        with open(file_path, "wb") as buffer:
+            content = await file.read()
+            buffer.write(content)
     
     # Get audio metadata
-    metadata = audio_processor.get_metadata(file_path)
+    metadata = get_service("audio_processor").get_metadata(file_path)
+    await run_in_threadpool(waveform.build, file_path)
     
     recording = Recording(
         project_id=project_id,
@@ -77,6 +170,7 @@ async def upload_audio(
 @router.post("/noise-cancel/{recording_id}")
 async def apply_noise_cancellation(
     recording_id: int,
+    stream: bool = Query(False),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -85,15 +179,21 @@ async def apply_noise_cancellation(
         raise HTTPException(status_code=404, detail="Recording not found")
     
     output_path = f"processed/{uuid.uuid4()}.wav"
-    noise_canceller.process(recording.file_path, output_path)
-    
-    effect_log = EffectLog(
-        recording_id=recording_id,
-        effect_type="noise_cancellation",
-        parameters="{}"
-    )
-    db.add(effect_log)
-    db.commit()
+    memory, streaming = _memory_plan("noise_canceller", "noise_cancel", recording)
+
+    def run():
+        noise_canceller = get_service("noise_canceller")
+        if streaming:
+            noise_canceller.process_streaming(recording.file_path, output_path, settings.STREAM_BLOCK_SECONDS)
+        else:
+            noise_canceller.process(recording.file_path, output_path)
+        waveform.build(output_path)
+        effect_log_writer.log(recording_id, "noise_cancellation", "{}")
+
+    ticket = _admit(current_user, "batch", recording.duration, memory)
+    if stream:
+        return _progress_response(ticket, run, result=lambda _: {"url": _download_url(output_path)})
+    await _run_scheduled(ticket, run)
     
     return FileResponse(output_path, media_type="audio/wav", filename="noise_cancelled.wav")
 
@@ -101,6 +201,7 @@ async def apply_noise_cancellation(
 async def apply_effects(
     recording_id: int,
     params: EffectParams,
+    stream: bool = Query(False),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -109,59 +210,427 @@ async def apply_effects(
         raise HTTPException(status_code=404, detail="Recording not found")
     
     output_path = f"processed/{uuid.uuid4()}.wav"
+    audio_processor = get_service("audio_processor")
     
     if params.effect_type == "equalizer" and params.eq_bands:
-        audio_processor.apply_equalizer(recording.file_path, output_path, params.eq_bands)
+        render = lambda: audio_processor.apply_equalizer(recording.file_path, output_path, params.eq_bands)
     elif params.effect_type == "compressor" and params.compression_ratio:
-        audio_processor.apply_compressor(recording.file_path, output_path, params.compression_ratio)
+        render = lambda: audio_processor.apply_compressor(recording.file_path, output_path, params.compression_ratio)
     elif params.effect_type == "reverb":
-        audio_processor.apply_reverb(
+        render = lambda: audio_processor.apply_reverb(
             recording.file_path, 
             output_path, 
             params.reverb_room_size or 0.5,
             params.reverb_damping or 0.5
         )
     elif params.effect_type == "ai_enhance":
-        audio_processor.ai_enhance(recording.file_path, output_path)
+        render = lambda: audio_processor.ai_enhance(recording.file_path, output_path)
     else:
         raise HTTPException(status_code=400, detail="Invalid effect type")
+
+    memory, streaming = _memory_plan("audio_processor", params.effect_type, recording)
+    if streaming:
+        # Too large to render in one piece within the memory budget
+        effect_args = _effect_args(params)
+        render = lambda: audio_processor.apply_streaming(
+            recording.file_path, output_path, params.effect_type, settings.STREAM_BLOCK_SECONDS, **effect_args
+        )
+
+    def run():
+        render()
+        waveform.build(output_path)
+        effect_log_writer.log(recording_id, params.effect_type, params.model_dump_json())
+
+    ticket = _admit(current_user, "batch", recording.duration, memory)
+    if stream:
+        return _progress_response(ticket, run, result=lambda _: {"url": _download_url(output_path)})
+    await _run_scheduled(ticket, run)
     
-    effect_log = EffectLog(
-        recording_id=recording_id,
-        effect_type=params.effect_type,
-        parameters=params.model_dump_json()
+    return FileResponse(output_path, media_type="audio/wav")
+
+@router.post("/apply-effects/{recording_id}/region")
+async def apply_effects_region(
+    recording_id: int,
+    params: RegionEffectParams,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Apply an effect to `[start, end)` seconds only; the rest of the recording is copied through"""
+    recording = db.query(Recording).filter(Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    if params.end <= params.start:
+        raise HTTPException(status_code=400, detail="Region end must be after start")
+
+    effect_args = _effect_args(params)
+    audio_processor = get_service("audio_processor")
+    # Only the region and its context are decoded and rendered
+    context = audio_processor.context_seconds(params.effect_type, effect_args)
+    memory, _ = _memory_plan(
+        "audio_processor", params.effect_type, recording, params.end - params.start + 2 * context
     )
-    db.add(effect_log)
-    db.commit()
-    
+
+    output_path = f"processed/{uuid.uuid4()}.wav"
+    def render():
+        audio_processor.apply_region(
+            recording.file_path,
+            output_path,
+            params.effect_type,
+            params.start,
+            params.end,
+            params.crossfade,
+            **effect_args
+        )
+        waveform.build(output_path)
+
+    # Region edits are short and someone is waiting on them
+    ticket = _admit(current_user, "interactive", params.end - params.start, memory)
+    try:
+        await _run_scheduled(ticket, render)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    effect_log_writer.log(recording_id, params.effect_type, params.model_dump_json())
+
     return FileResponse(output_path, media_type="audio/wav")
 
+@router.post("/apply-effects/{recording_id}/preview")
+async def preview_effects(
+    recording_id: int,
+    params: PreviewParams,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Low-resolution render of a short excerpt for auditioning effect parameters
+
+    Uses the same effect code as `apply-effects` on `duration` seconds from
+    `start`, at a reduced sample rate, and returns the encoded audio
+    directly. Nothing is stored or logged.
+    """
+    recording = db.query(Recording).filter(Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    effect_args = _effect_args(params)
+    audio_processor = get_service("audio_processor")
+    context = audio_processor.context_seconds(params.effect_type, effect_args)
+    memory, _ = _memory_plan("audio_processor", params.effect_type, recording, params.duration + 2 * context)
+
+    def render():
+        # audio_io pulls in librosa; keep it off the router's import path
+        from services import audio_io
+
+        y, sr = audio_processor.preview(
+            recording.file_path, params.effect_type, params.start, params.duration, **effect_args
+        )
+        return audio_io.encode(y, sr, params.encoding, "api")
+
+    ticket = _admit(current_user, "interactive", params.duration, memory)
+    try:
+        data = await _run_scheduled(ticket, render)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(data, media_type=f"audio/{params.encoding}")
+
+def _stack_response(rows):
+    return {
+        "stages": [
+            {
+                "id": row.id,
+                "position": row.stack_position,
+                "effect_type": row.effect_type,
+                "parameters": json.loads(row.parameters),
+            }
+            for row in rows
+        ]
+    }
+
+@router.get("/stack/{recording_id}")
+async def get_effect_stack(
+    recording_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """A recording's non-destructive effect stack, first stage first"""
+    _get_recording(db, recording_id)
+    return _stack_response(effect_stack.stages(db, recording_id))
+
+@router.post("/stack/{recording_id}")
+async def add_stack_stage(
+    recording_id: int,
+    params: StackStageParams,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Insert an effect into the stack at `position`, or on top; nothing is rendered until `/render`"""
+    _get_recording(db, recording_id)
+    _effect_args(params)
+    effect_stack.insert(
+        db, recording_id, params.effect_type, params.model_dump_json(exclude={"position"}), params.position
+    )
+    return _stack_response(effect_stack.stages(db, recording_id))
+
+@router.put("/stack/{recording_id}/{position}")
+async def update_stack_stage(
+    recording_id: int,
+    position: int,
+    params: EffectParams,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Change one stage; the next render reuses the cached output of the stages below it"""
+    _get_recording(db, recording_id)
+    _effect_args(params)
+    if effect_stack.replace(db, recording_id, position, params.effect_type, params.model_dump_json()) is None:
+        raise HTTPException(status_code=404, detail="Stage not found")
+    return _stack_response(effect_stack.stages(db, recording_id))
+
+@router.delete("/stack/{recording_id}/{position}")
+async def remove_stack_stage(
+    recording_id: int,
+    position: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    _get_recording(db, recording_id)
+    if not effect_stack.remove(db, recording_id, position):
+        raise HTTPException(status_code=404, detail="Stage not found")
+    return _stack_response(effect_stack.stages(db, recording_id))
+
+@router.post("/stack/{recording_id}/render")
+async def render_effect_stack(
+    recording_id: int,
+    stream: bool = Query(False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Render the whole stack onto a copy of the recording
+
+    Stages whose input chain is unchanged since an earlier render come from
+    the intermediate cache; only the stages from the first edited one up
+    are rendered. `X-Stack-Reused` reports how many stages were reused.
+    """
+    recording = _get_recording(db, recording_id)
+    stack = []
+    for row in effect_stack.stages(db, recording_id):
+        params = EffectParams.model_validate_json(row.parameters)
+        stack.append((params.effect_type, _effect_args(params)))
+    if not stack:
+        raise HTTPException(status_code=400, detail="Effect stack is empty")
+
+    # Stages run one after another, so the job needs the largest stage's memory
+    plans = [_memory_plan("audio_processor", effect_type, recording) for effect_type, _ in stack]
+    streaming = {effect_type for (effect_type, _), (_, streams) in zip(stack, plans) if streams}
+    reused, _ = effect_stack.cached_prefix(recording.file_path, stack)
+    memory = max((estimate for estimate, _ in plans[reused:]), default=0)
+
+    audio_processor = get_service("audio_processor")
+    def render_stage(input_path, output_path, effect_type, args):
+        if effect_type in streaming:
+            audio_processor.apply_streaming(
+                input_path, output_path, effect_type, settings.STREAM_BLOCK_SECONDS, **args
+            )
+        else:
+            audio_processor.apply(input_path, output_path, effect_type, **args)
+
+    output_path = f"processed/{uuid.uuid4()}.wav"
+    def run():
+        path, reused = effect_stack.render(recording.file_path, stack, render_stage)
+        # Cached intermediates can be evicted; the download gets its own copy
+        shutil.copyfile(path, output_path)
+        waveform.build(output_path)
+        return reused
+
+    # An unknown duration falls back to the default cost in _admit, as on the other routes
+    ticket = _admit(current_user, "batch", (recording.duration or 0) * max(len(stack) - reused, 1), memory)
+    if stream:
+        return _progress_response(
+            ticket, run, result=lambda reused: {"url": _download_url(output_path), "reused": reused}
+        )
+    reused = await _run_scheduled(ticket, run)
+
+    return FileResponse(output_path, media_type="audio/wav", headers={"X-Stack-Reused": str(reused)})
+
 @router.post("/split-stems/{recording_id}")
 async def split_stems(
     recording_id: int,
     background_tasks: BackgroundTasks,
+    stream: bool = Query(False),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Separate a recording into stems
+
+    With `stream=true` the response is a Server-Sent Events stream: stage and
+    progress events, an `output` event with a download URL as each stem is
+    written, then `done` with every stem's URL.
+    """
     recording = db.query(Recording).filter(Recording.id == recording_id).first()
     if not recording:
         raise HTTPException(status_code=404, detail="Recording not found")
     
     output_dir = f"processed/stems_{uuid.uuid4()}"
-    stems = stem_separator.separate(recording.file_path, output_dir)
+    stem_separator = get_service("stem_separator")
+    # Long recordings are split across processes; the job's memory is one segment per worker
+    workers, memory = stem_separator.segment_plan(
+        recording.duration,
+        recording.sample_rate,
+        recording.channels,
+        get_scheduler().memory.budget,
+        settings.STEM_SEGMENT_SECONDS,
+        settings.STEM_WORKERS
+    )
+    def separate():
+        stems = stem_separator.separate(
+            recording.file_path, output_dir, segment_seconds=settings.STEM_SEGMENT_SECONDS, workers=workers
+        )
+        for path in stems.values():
+            waveform.build(path)
+        return stems
+
+    ticket = _admit(current_user, "batch", recording.duration, memory)
+    if stream:
+        return _progress_response(
+            ticket,
+            separate,
+            result=lambda stems: {"stems": {name: _download_url(path) for name, path in stems.items()}}
+        )
+    stems = await _run_scheduled(ticket, separate)
     
     return {
         "message": "Stems separated successfully",
         "stems": stems
     }
 
+@router.get("/processed/{file_path:path}")
+async def download_processed(
+    file_path: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Download a file written by a processing route, e.g. a stem from a progress stream"""
+    path = (PROCESSED_DIR / file_path).resolve()
+    if PROCESSED_DIR.resolve() not in path.parents or not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path)
+
+def _waveform_response(audio_path, level, pixels, start, end, binary):
+    """Peaks of `[start, end)` seconds at `level` (or the level that fits `pixels`) as JSON or raw int8 pairs"""
+    peaks = waveform.load(audio_path)
+    end = peaks.duration if end is None else min(end, peaks.duration)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Range end must be after start")
+    if level is None:
+        level = peaks.level_for(end - start, pixels or 2000)
+    try:
+        first, pairs = peaks.slice(level, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    frames_per_peak = peaks.frames_per_peak(level)
+    meta = {
+        "sample_rate": peaks.sample_rate,
+        "level": level,
+        "levels": peaks.levels,
+        "frames_per_peak": frames_per_peak,
+        "start": first * frames_per_peak / peaks.sample_rate,
+        "count": len(pairs),
+    }
+    if binary:
+        headers = {f"X-Peaks-{key.replace('_', '-').title()}": str(value) for key, value in meta.items()}
+        return Response(pairs.tobytes(), media_type="application/octet-stream", headers=headers)
+    # Interleaved min, max per pair, scaled so 127 is full scale
+    return {**meta, "peaks": pairs.reshape(-1).tolist()}
+
+@router.get("/waveform/{recording_id}")
+async def get_waveform(
+    recording_id: int,
+    level: Optional[int] = Query(None, ge=0),
+    pixels: Optional[int] = Query(None, ge=1, le=100000),
+    start: float = Query(0.0, ge=0),
+    end: Optional[float] = Query(None, gt=0),
+    binary: bool = Query(False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Min/max waveform peaks of a recording for drawing, without downloading the audio
+
+    `level` 0 is the finest (one pair per 256 frames), each level above
+    halves the resolution; without it the finest level with at most
+    `pixels` pairs (default 2000) in the range is used.
+    """
+    recording = db.query(Recording).filter(Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return await run_in_threadpool(_waveform_response, recording.file_path, level, pixels, start, end, binary)
+
+@router.get("/waveform/processed/{file_path:path}")
+async def get_processed_waveform(
+    file_path: str,
+    level: Optional[int] = Query(None, ge=0),
+    pixels: Optional[int] = Query(None, ge=1, le=100000),
+    start: float = Query(0.0, ge=0),
+    end: Optional[float] = Query(None, gt=0),
+    binary: bool = Query(False),
+    current_user: User = Depends(get_current_user)
+):
+    """Waveform peaks of a processed output, addressed like `/processed/{file_path}`"""
+    path = (PROCESSED_DIR / file_path).resolve()
+    if PROCESSED_DIR.resolve() not in path.parents or not path.is_file() or path.suffix == waveform.SUFFIX:
+        raise HTTPException(status_code=404, detail="File not found")
+    return await run_in_threadpool(_waveform_response, str(path), level, pixels, start, end, binary)
+
+@router.get("/spectrogram/{recording_id}")
+async def get_spectrogram_geometry(
+    recording_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Zoom levels and tile counts of a recording's spectrogram"""
+    return await run_in_threadpool(spectrogram.geometry, _get_recording(db, recording_id).file_path)
+
+@router.get("/spectrogram/{recording_id}/{level}/{tile}")
+async def get_spectrogram_tile(
+    recording_id: int,
+    level: int,
+    tile: int,
+    scale: str = Query("log", pattern="^(linear|log|mel)$"),
+    format: str = Query("png", pattern="^(png|raw)$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """One spectrogram tile, rendered on first request and served from the tile cache after
+
+    `png` is an 8-bit grayscale image with the highest frequency on top;
+    `raw` is `tile_rows` x `tile_columns` uint8, lowest frequency first.
+    0 is `db_range` dB below full scale and 255 is full scale.
+    """
+    audio_path = _get_recording(db, recording_id).file_path
+    try:
+        data = await run_in_threadpool(spectrogram.tile, audio_path, level, tile, scale, format)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    headers = {
+        # Tiles are keyed by the file's identity, so a tile URL only changes if the recording does
+        "Cache-Control": "private, max-age=3600",
+        "X-Tile-Rows": str(spectrogram.TILE_ROWS),
+        "X-Tile-Columns": str(spectrogram.TILE_COLUMNS),
+    }
+    media_type = "image/png" if format == "png" else "application/octet-stream"
+    return Response(data, media_type=media_type, headers=headers)
+
 @router.post("/generate-drums")
 async def generate_drums(
     params: DrumParams,
     current_user: User = Depends(get_current_user)
 ):
     output_path = f"processed/drums_{uuid.uuid4()}.wav"
-    drum_machine.generate(params.genre, output_path, params.bpm, params.duration)
+    ticket = _admit(current_user, "interactive", params.duration)
+    def generate():
+        get_service("drum_machine").generate(params.genre, output_path, params.bpm, params.duration)
+        waveform.build(output_path)
+
+    await _run_scheduled(ticket, generate)
     
     return FileResponse(output_path, media_type="audio/wav", filename=f"drums_{params.genre}.wav")
 
@@ -175,5 +644,27 @@ async def detect_bpm(
     if not recording:
         raise HTTPException(status_code=404, detail="Recording not found")
     
-    bpm = audio_processor.detect_bpm(recording.file_path)
+    memory, _ = _memory_plan("audio_processor", "detect_bpm", recording)
+    ticket = _admit(current_user, "interactive", recording.duration, memory)
+    bpm = await _run_scheduled(ticket, lambda: get_service("audio_processor").detect_bpm(recording.file_path))
     return {"bpm": bpm}
+
+@router.get("/history/{recording_id}", response_model=EffectHistoryPage)
+async def get_effect_history(
+    recording_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Effects applied to a recording, newest first"""
+    recording = db.query(Recording).filter(Recording.id == recording_id).first()
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    # Effect stack stages are listed by the stack routes, not as history
+    query = db.query(EffectLog).filter(
+        EffectLog.recording_id == recording_id,
+        EffectLog.stack_position.is_(None)
+    )
+    return history_page(query, cursor, limit)
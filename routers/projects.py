@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 from database import get_db
-from models import Project, Recording, User
+from models import Project, Recording, EffectLog, User
 from routers.auth import get_current_user
+from services.effect_history import history_page, EffectHistoryPage
 
 router = APIRouter()
 
@@ -17,11 +20,125 @@ class ProjectResponse(BaseModel):
     id: int
     name: str
     description: Optional[str]
-    created_at: str
-    
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ProjectSummary(ProjectResponse):
+    recording_count: int = 0
+    total_duration: float = 0.0
+    last_activity: Optional[datetime] = None
+
+class ProjectPage(BaseModel):
+    items: List[ProjectSummary]
+    next_cursor: Optional[int] = None
+
+class EffectSummary(BaseModel):
+    id: int
+    effect_type: str
+    applied_at: datetime
+
     class Config:
         from_attributes = True
 
+class RecordingResponse(BaseModel):
+    id: int
+    filename: str
+    duration: Optional[float]
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    format: Optional[str]
+    created_at: datetime
+    # The latest RECENT_EFFECTS effects, newest first; page through the rest at /history
+    effects: List[EffectSummary] = []
+    effect_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+class ProjectDetail(BaseModel):
+    project: ProjectSummary
+    recordings: List[RecordingResponse]
+    next_cursor: Optional[int] = None
+
+# Effects inlined per recording in a project's detail
+RECENT_EFFECTS = 5
+
+def _recording_stats(db: Session, project_ids):
+    """Recording count, total duration and last upload per project, computed in SQL"""
+    if not project_ids:
+        return {}
+
+    rows = db.query(
+        Recording.project_id,
+        func.count(Recording.id),
+        func.coalesce(func.sum(Recording.duration), 0.0),
+        func.max(Recording.created_at)
+    ).filter(
+        Recording.project_id.in_(project_ids)
+    ).group_by(Recording.project_id).all()
+
+    return {
+        project_id: (count, float(total), last_upload)
+        for project_id, count, total, last_upload in rows
+    }
+
+def _recent_effects(db: Session, recording_ids):
+    """Effect count and the latest `RECENT_EFFECTS` effects per recording, newest first"""
+    if not recording_ids:
+        return {}
+
+    # Effect stack stages are edits in progress, not applied effects
+    applied = db.query(EffectLog).filter(
+        EffectLog.recording_id.in_(recording_ids),
+        EffectLog.stack_position.is_(None)
+    )
+    counts = applied.with_entities(
+        EffectLog.recording_id, func.count(EffectLog.id)
+    ).group_by(EffectLog.recording_id).all()
+
+    rank = func.row_number().over(
+        partition_by=EffectLog.recording_id,
+        order_by=(EffectLog.applied_at.desc(), EffectLog.id.desc())
+    ).label("rank")
+    ranked = applied.with_entities(EffectLog.id, rank).subquery()
+    recent = db.query(EffectLog).join(ranked, EffectLog.id == ranked.c.id).filter(
+        ranked.c.rank <= RECENT_EFFECTS
+    ).order_by(EffectLog.applied_at.desc(), EffectLog.id.desc()).all()
+
+    effects = {recording_id: (count, []) for recording_id, count in counts}
+    for log in recent:
+        effects[log.recording_id][1].append(EffectSummary.model_validate(log))
+    return effects
+
+def _describe(recording, effects):
+    count, recent = effects.get(recording.id, (0, []))
+    return RecordingResponse(
+        id=recording.id,
+        filename=recording.filename,
+        duration=recording.duration,
+        sample_rate=recording.sample_rate,
+        channels=recording.channels,
+        format=recording.format,
+        created_at=recording.created_at,
+        effects=recent,
+        effect_count=count
+    )
+
+def _summarize(project, stats):
+    count, total, last_upload = stats.get(project.id, (0, 0.0, None))
+    activity = [t for t in (project.updated_at, last_upload) if t is not None]
+    return ProjectSummary(
+        id=project.id,
+        name=project.name,
+        description=project.description,
+        created_at=project.created_at,
+        recording_count=count,
+        total_duration=total,
+        last_activity=max(activity) if activity else None
+    )
+
 @router.post("/", response_model=ProjectResponse)
 async def create_project(
     project: ProjectCreate,
@@ -38,34 +155,88 @@ async def create_project(
     db.refresh(new_project)
     return new_project
 
-@router.get("/", response_model=List[ProjectResponse])
+@router.get("/", response_model=ProjectPage)
 async def get_projects(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    projects = db.query(Project).filter(Project.user_id == current_user.id).all()
-    return projects
+    """List projects newest first; pass `next_cursor` back as `cursor` for the next page"""
+    query = db.query(Project).filter(Project.user_id == current_user.id)
+    if cursor is not None:
+        query = query.filter(Project.id < cursor)
+
+    # Fetch one extra row to know whether another page exists
+    projects = query.order_by(Project.id.desc()).limit(limit + 1).all()
+    has_more = len(projects) > limit
+    projects = projects[:limit]
+
+    stats = _recording_stats(db, [p.id for p in projects])
+
+    return ProjectPage(
+        items=[_summarize(p, stats) for p in projects],
+        next_cursor=projects[-1].id if has_more else None
+    )
 
-@router.get("/{project_id}")
+@router.get("/{project_id}", response_model=ProjectDetail)
 async def get_project(
     project_id: int,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    """Project with a page of its recordings, newest first
+
+    Each recording lists only its latest effects and their total count;
+    `/history` pages through the full log.
+    """
     project = db.query(Project).filter(
         Project.id == project_id,
         Project.user_id == current_user.id
     ).first()
-    
+
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    recordings = db.query(Recording).filter(Recording.project_id == project_id).all()
-    
-    return {
-        "project": project,
-        "recordings": recordings
-    }
+
+    query = db.query(Recording).filter(Recording.project_id == project_id)
+    if cursor is not None:
+        query = query.filter(Recording.id < cursor)
+
+    recordings = query.order_by(Recording.id.desc()).limit(limit + 1).all()
+    has_more = len(recordings) > limit
+    recordings = recordings[:limit]
+    effects = _recent_effects(db, [r.id for r in recordings])
+
+    return ProjectDetail(
+        project=_summarize(project, _recording_stats(db, [project.id])),
+        recordings=[_describe(r, effects) for r in recordings],
+        next_cursor=recordings[-1].id if has_more else None
+    )
+
+@router.get("/{project_id}/history", response_model=EffectHistoryPage)
+async def get_project_history(
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Effects applied to any recording in the project, newest first"""
+    project = db.query(Project).filter(
+        Project.id == project_id,
+        Project.user_id == current_user.id
+    ).first()
+
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    query = db.query(EffectLog).join(Recording).filter(
+        Recording.project_id == project_id,
+        EffectLog.stack_position.is_(None)
+    )
+    return history_page(query, cursor, limit)
 
 @router.delete("/{project_id}")
 async def delete_project(
@@ -77,10 +248,10 @@ async def delete_project(
         Project.id == project_id,
         Project.user_id == current_user.id
     ).first()
-    
+
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    
+
     db.delete(project)
     db.commit()
     return {"message": "Project deleted successfully"}
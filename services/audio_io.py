@@ -0,0 +1,157 @@
+"""
+Audio decode/encode shared by the services
+
+`load` keeps the file's native sample rate when the caller passes `sr=None`;
+every effect designs its filters and STFTs from the rate it is given, so only
+callers that genuinely need a fixed rate ask for one. When a resample is
+needed, `quality` picks the resampler: a fast one for analysis (BPM, onsets)
+and a high-quality one for anything written back out. Decoded and resampled
+buffers are kept in a small LRU so repeated effects on the same recording
+skip both steps.
+"""
+import contextvars
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from config import settings
+from metrics import record_cache, stage_timer
+from services import dsp
+
+# Resampler per task (librosa `res_type`)
+RESAMPLERS = {
+    "analysis": "soxr_qq",
+    "output": "soxr_hq",
+}
+
+# Rate for analysis-only tasks; librosa's own default
+ANALYSIS_SR = 22050
+
+class _BufferCache:
+    """LRU of decoded audio keyed by file identity, bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, y, sr):
+        if y.nbytes > self.max_bytes:
+            return
+        # Shared between requests, so nobody may modify a cached buffer in place
+        y.flags.writeable = False
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = (y, sr)
+            self.size += y.nbytes
+            while self.size > self.max_bytes:
+                _, (old, _) = self._items.popitem(last=False)
+                self.size -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+_cache = _BufferCache(settings.RESAMPLE_CACHE_MB * 1024 * 1024)
+
+def _cache_key(path, sr, mono, quality):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sr, mono, RESAMPLERS[quality], dsp.DTYPE.str)
+
+def load(path, sr, service, mono=True, quality="output"):
+    """Decode an audio file and resample it to `sr`, timing each step as its own stage
+
+    `sr=None` keeps the native rate. With `mono=False` the result is always
+    `(channels, samples)`, even for a mono file, so callers can process every
+    channel in one vectorized call. Returned arrays may be shared through the
+    cache and are read-only.
+    """
+    key = _cache_key(path, sr, mono, quality)
+    cached = _cache.get(key)
+    record_cache("audio_load", cached is not None)
+    if cached is not None:
+        return cached
+
+    with stage_timer(service, "decode"):
+        y, native_sr = librosa.load(path, sr=None, mono=mono, dtype=dsp.DTYPE)
+    if not mono:
+        y = np.atleast_2d(y)
+
+    if sr is not None and native_sr != sr:
+        with stage_timer(service, "resample"):
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type=RESAMPLERS[quality])
+        native_sr = sr
+
+    _cache.put(key, y, native_sr)
+    return y, native_sr
+
+def clear_cache():
+    _cache.clear()
+
+def duration(y, sr):
+    """Length in seconds of a `(samples,)` or `(channels, samples)` array"""
+    return y.shape[-1] / sr
+
+def write(path, y, sr, service):
+    """Encode audio to `path`, timed as the `encode` stage; accepts `(channels, samples)`"""
+    if y.ndim == 2:
+        # soundfile wants frames first; a single channel is written as mono
+        y = y[0] if y.shape[0] == 1 else y.T
+    with stage_timer(service, "encode"):
+        sf.write(path, y, sr)
+
+# Compressed encodings for responses sent straight to a client: libsndfile format, subtype
+ENCODINGS = {
+    "ogg": ("OGG", "VORBIS"),
+    "wav": ("WAV", "PCM_16"),
+}
+
+def encode(y, sr, encoding, service):
+    """`(channels, samples)` audio encoded in memory as one of `ENCODINGS`; returns bytes"""
+    container, subtype = ENCODINGS[encoding]
+    if y.ndim == 2:
+        y = y[0] if y.shape[0] == 1 else y.T
+    buffer = io.BytesIO()
+    with stage_timer(service, "encode"):
+        sf.write(buffer, y, sr, format=container, subtype=subtype)
+    return buffer.getvalue()
+
+def _normalize_and_write(path, y, sr, service, target, eps):
+    if target is not None:
+        dsp.normalize_peak(y, target, eps)
+    write(path, y, sr, service)
+
+def write_parallel(outputs, sr, service, target=None, eps=0.0):
+    """Normalise and encode several outputs at once; yields `(name, path)` as each is written
+
+    `outputs` is `(name, path, y)` tuples; each `y` is peak-normalised to
+    `target` in place first unless `target` is None. Scaling and
+    libsndfile both release the GIL, so one thread per output overlaps
+    the work. Each thread runs in a copy of the caller's context, so its
+    stage timings still reach the caller's progress listener.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(outputs), 1)) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, _normalize_and_write, path, y, sr, service, target, eps):
+                (name, path)
+            for name, path, y in outputs
+        }
+        for future in as_completed(futures):
+            future.result()
+            yield futures[future]
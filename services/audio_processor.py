@@ -5,117 +5,311 @@ from scipy import signal
 from pydub import AudioSegment
 import aubio
 
+import progress
+from metrics import stage_timer, track_job
+from services import audio_io, audio_source, dsp
+from services.memory_governor import CostModel
+
+SERVICE = "audio_processor"
+
 class AudioProcessor:
-    def __init__(self, sample_rate=44100):
+    # Effect name -> method that renders it on an in-memory buffer
+    REGION_EFFECTS = {
+        "equalizer": "equalize",
+        "compressor": "compress",
+        "reverb": "reverb",
+        "ai_enhance": "enhance",
+    }
+
+    # Seconds of audio either side of a region that an effect sees but doesn't replace
+    REGION_CONTEXT = 0.5
+
+    # Peak output level of a full render per effect
+    NORMALIZE_TARGETS = {
+        "equalizer": 1.0,
+        "compressor": 0.9,
+        "reverb": 0.9,
+        "ai_enhance": 0.9,
+    }
+
+    # Peak memory per operation (benchmarks.memory_model_bench, with ~10% headroom)
+    MEMORY_MODELS = {
+        "equalizer": CostModel(4.4),
+        "compressor": CostModel(5.5),
+        "reverb": CostModel(5.6),
+        "ai_enhance": CostModel(12.2),
+        "detect_bpm": CostModel(19.0, mono=True),
+    }
+
+    # Operations with a block-streaming path (`apply_streaming`)
+    STREAMING_OPERATIONS = ("equalizer", "compressor", "reverb", "ai_enhance")
+
+    # Preview renders: sample rate and longest excerpt
+    PREVIEW_SR = 22050
+    PREVIEW_MAX_SECONDS = 30.0
+
+    def __init__(self, sample_rate=None):
+        # None keeps each file's native rate; set a rate to force resampling
         self.sample_rate = sample_rate
-    
+
     def get_metadata(self, file_path):
         """Extract audio metadata"""
-        audio = AudioSegment.from_file(file_path)
+        with stage_timer(SERVICE, "probe"):
+            audio = AudioSegment.from_file(file_path)
         return {
             "duration": len(audio) / 1000.0,
             "sample_rate": audio.frame_rate,
             "channels": audio.channels,
             "bit_depth": audio.sample_width * 8
         }
-    
+
+    def equalize(self, y, sr, eq_bands):
+        """Equalized copy of `(channels, samples)` audio, before normalisation
+
+        Bands starting above Nyquist are skipped, and a band reaching past it
+        becomes a highpass, so low sample rates still work.
+        """
+        with stage_timer(SERVICE, "equalizer"):
+            # Define frequency bands (Hz)
+            frequencies = [60, 250, 1000, 4000, 12000]
+            nyquist = sr / 2
+
+            # Apply filters for each band, accumulating into one output buffer
+            filtered = y.copy()
+            for i, (freq, gain) in enumerate(zip(frequencies, eq_bands)):
+                if freq < nyquist:
+                    if i < len(frequencies) - 1 and frequencies[i+1] < nyquist:
+                        # Bandpass filter
+                        sos = dsp.butter(4, [freq, frequencies[i+1]], 'bandpass', sr)
+                    else:
+                        # Highpass filter for last band, or one reaching past Nyquist
+                        sos = dsp.butter(4, freq, 'highpass', sr)
+
+                    band_filtered = dsp.sosfilt(sos, y)
+                    band_filtered *= gain - 1.0
+                    filtered += band_filtered
+                progress.advance(SERVICE, "equalizer", i + 1, min(len(frequencies), len(eq_bands)))
+        return filtered
+
+    def compress(self, y, sr, ratio=4.0, threshold=-20):
+        """Compressed copy of `y`, before normalisation"""
+        with stage_timer(SERVICE, "compressor"):
+            return dsp.compress(y.copy(), threshold, ratio)
+
+    def impulse_response(self, sr, room_size=0.5, damping=0.5):
+        """Decaying-noise impulse response for `reverb`"""
+        ir_length = int(sr * room_size)
+        impulse_response = dsp.as_dtype(np.exp(-np.linspace(0, 5 * damping, ir_length)))
+        impulse_response *= dsp.noise(ir_length)
+        impulse_response *= 0.1
+        return impulse_response
+
+    def reverb(self, y, sr, room_size=0.5, damping=0.5, impulse_response=None):
+        """Dry/wet reverb mix of `y`, before normalisation
+
+        Pass `impulse_response` to reuse one response across blocks of a file.
+        """
+        with stage_timer(SERVICE, "reverb"):
+            # Simple reverb using convolution with impulse response
+            if impulse_response is None:
+                impulse_response = self.impulse_response(sr, room_size, damping)
+
+            # Convolve every channel with the same response in one call
+            impulse_response = impulse_response.reshape((1,) * (y.ndim - 1) + (-1,))
+            output = signal.fftconvolve(y, impulse_response, mode='same', axes=-1)
+
+            # Mix dry and wet into the convolution buffer
+            output *= 0.3
+            output += 0.7 * y
+        return output
+
+    def enhance(self, y, sr):
+        """Spectral gate, compression and high-frequency lift of `y`, before normalisation"""
+        # 1. Noise reduction (spectral gating)
+        with stage_timer(SERVICE, "stft"):
+            D = librosa.stft(y)
+
+        with stage_timer(SERVICE, "spectral_gate"):
+            magnitude = np.abs(D)
+
+            # Estimate noise floor
+            noise_floor = np.median(magnitude, axis=-1, keepdims=True)
+            noise_floor *= 2
+
+            # Zero the gated bins in place; the kept bins keep their phase
+            D[magnitude <= noise_floor] = 0
+            del magnitude
+
+        with stage_timer(SERVICE, "istft"):
+            y_enhanced = librosa.istft(D, length=y.shape[-1])
+
+        # 2. Gentle compression
+        with stage_timer(SERVICE, "compressor"):
+            dsp.compress(y_enhanced, threshold=-25, ratio=3.0)
+
+        # 3. Subtle high-frequency boost
+        with stage_timer(SERVICE, "sosfilt"):
+            sos = dsp.butter(2, 3000, 'highpass', sr)
+            high_freq = dsp.sosfilt(sos, y_enhanced)
+            high_freq *= 0.2
+            y_enhanced += high_freq
+        return y_enhanced
+
+    def _render_file(self, input_path, output_path, effect_type, **params):
+        render = getattr(self, self.REGION_EFFECTS[effect_type])
+        with track_job(SERVICE) as job:
+            y, sr = audio_io.load(input_path, self.sample_rate, SERVICE, mono=False)
+            job.audio_seconds = audio_io.duration(y, sr)
+            output = render(y, sr, **params)
+            # Normalize
+            dsp.normalize_peak(output, self.NORMALIZE_TARGETS[effect_type])
+            audio_io.write(output_path, output, sr, SERVICE)
+            progress.output(SERVICE, "output", output_path)
+
     def apply_equalizer(self, input_path, output_path, eq_bands):
         """Apply equalizer with frequency bands"""
-        y, sr = librosa.load(input_path, sr=self.sample_rate)
-        
-        # Define frequency bands (Hz)
-        frequencies = [60, 250, 1000, 4000, 12000]
-        
-        # Apply filters for each band
-        filtered = y.copy()
-        for i, (freq, gain) in enumerate(zip(frequencies, eq_bands)):
-            if i < len(frequencies) - 1:
-                # Bandpass filter
-                sos = signal.butter(4, [freq, frequencies[i+1]], 'bandpass', fs=sr, output='sos')
-            else:
-                # Highpass filter for last band
-                sos = signal.butter(4, freq, 'highpass', fs=sr, output='sos')
-            
-            band_filtered = signal.sosfilt(sos, y)
-            filtered += band_filtered * (gain - 1.0)
-        
-        # Normalize
-        filtered = filtered / np.max(np.abs(filtered))
-        sf.write(output_path, filtered, sr)
-    
+        self._render_file(input_path, output_path, "equalizer", eq_bands=eq_bands)
+
     def apply_compressor(self, input_path, output_path, ratio=4.0, threshold=-20):
         """Apply dynamic range compression"""
-        y, sr = librosa.load(input_path, sr=self.sample_rate)
-        
-        # Convert to dB
-        y_db = 20 * np.log10(np.abs(y) + 1e-10)
-        
-        # Apply compression
-        compressed = y.copy()
-        mask = y_db > threshold
-        compressed[mask] = np.sign(y[mask]) * (
-            10 ** ((threshold + (y_db[mask] - threshold) / ratio) / 20)
-        )
-        
-        # Normalize
-        compressed = compressed / np.max(np.abs(compressed)) * 0.9
-        sf.write(output_path, compressed, sr)
-    
+        self._render_file(input_path, output_path, "compressor", ratio=ratio, threshold=threshold)
+
     def apply_reverb(self, input_path, output_path, room_size=0.5, damping=0.5):
         """Apply reverb effect"""
-        y, sr = librosa.load(input_path, sr=self.sample_rate)
-        
-        # Simple reverb using convolution with impulse response
-        ir_length = int(sr * room_size)
-        impulse_response = np.exp(-np.linspace(0, 5 * damping, ir_length))
-        impulse_response = impulse_response * np.random.randn(ir_length) * 0.1
-        
-        # Convolve
-        reverb = signal.fftconvolve(y, impulse_response, mode='same')
-        
-        # Mix dry and wet
-        output = 0.7 * y + 0.3 * reverb
-        output = output / np.max(np.abs(output)) * 0.9
-        
-        sf.write(output_path, output, sr)
-    
+        self._render_file(input_path, output_path, "reverb", room_size=room_size, damping=damping)
+
     def ai_enhance(self, input_path, output_path):
         """AI-powered enhancement combining multiple effects"""
-        y, sr = librosa.load(input_path, sr=self.sample_rate)
-        
-        # 1. Noise reduction (spectral gating)
-        D = librosa.stft(y)
-        magnitude, phase = np.abs(D), np.angle(D)
-        
-        # Estimate noise floor
-        noise_floor = np.median(magnitude, axis=1, keepdims=True)
-        mask = magnitude > (noise_floor * 2)
-        magnitude = magnitude * mask
-        
-        # Reconstruct
-        D_enhanced = magnitude * np.exp(1j * phase)
-        y_enhanced = librosa.istft(D_enhanced)
-        
-        # 2. Gentle compression
-        y_db = 20 * np.log10(np.abs(y_enhanced) + 1e-10)
-        threshold = -25
-        ratio = 3.0
-        mask = y_db > threshold
-        y_enhanced[mask] = np.sign(y_enhanced[mask]) * (
-            10 ** ((threshold + (y_db[mask] - threshold) / ratio) / 20)
-        )
-        
-        # 3. Subtle high-frequency boost
-        sos = signal.butter(2, 3000, 'highpass', fs=sr, output='sos')
-        high_freq = signal.sosfilt(sos, y_enhanced)
-        y_enhanced = y_enhanced + high_freq * 0.2
-        
-        # Normalize
-        y_enhanced = y_enhanced / np.max(np.abs(y_enhanced)) * 0.9
-        sf.write(output_path, y_enhanced, sr)
-    
+        self._render_file(input_path, output_path, "ai_enhance")
+
+    def apply(self, input_path, output_path, effect_type, **params):
+        """Apply one of `REGION_EFFECTS` by name, as the matching `apply_*` method does"""
+        self._render_file(input_path, output_path, effect_type, **params)
+
+    def context_seconds(self, effect_type, params):
+        """Seconds of neighbouring audio an effect needs to render a span correctly"""
+        return self.REGION_CONTEXT + (params.get("room_size", 0.5) if effect_type == "reverb" else 0.0)
+
+    def apply_streaming(self, input_path, output_path, effect_type, block_seconds=30.0, **params):
+        """Render a whole file with one effect in blocks, holding only one block in memory
+
+        Same output as the matching `apply_*` method up to block-edge
+        effects: each block is rendered with `context_seconds` seconds either side,
+        and `ai_enhance` estimates its noise floor per block rather than over
+        the whole file. Used for files whose full render wouldn't fit the
+        memory budget.
+        """
+        render = getattr(self, self.REGION_EFFECTS[effect_type])
+        with track_job(SERVICE) as job, audio_source.AudioSource(input_path) as source:
+            sr = source.samplerate
+            job.audio_seconds = source.duration
+            if effect_type == "reverb":
+                # One response for the whole file, as a full render would use
+                params["impulse_response"] = self.impulse_response(
+                    sr, params.get("room_size", 0.5), params.get("damping", 0.5)
+                )
+            blocks = audio_source.render_blocks(
+                source, lambda window: render(window, sr, **params),
+                int(block_seconds * sr), int(self.context_seconds(effect_type, params) * sr), SERVICE
+            )
+            with audio_source.NormalizedWriter(
+                output_path, sr, source.channels, self.NORMALIZE_TARGETS[effect_type], SERVICE
+            ) as writer:
+                for block in blocks:
+                    writer.write(block)
+        progress.output(SERVICE, "output", output_path)
+
+    def apply_region(self, input_path, output_path, effect_type, start, end, crossfade=0.02, **params):
+        """Re-render only `[start, end)` seconds with one effect and splice it into a copy of the file
+
+        The effect sees `REGION_CONTEXT` seconds of audio either side (plus the
+        reverb length) so filters and the STFT settle before the region
+        starts, but only the region itself is replaced. Its edges are
+        crossfaded with the original over `crossfade` seconds. The region is
+        not peak-normalised like a full render, since that would change its
+        level against the untouched audio around it; it is only scaled down if
+        it would clip. Cost scales with the region length, not the file's.
+        """
+        render = getattr(self, self.REGION_EFFECTS[effect_type])
+        with track_job(SERVICE) as job, audio_source.AudioSource(input_path) as source:
+            sr = source.samplerate
+            first, last = source.frame(start), source.frame(end)
+            if last <= first:
+                raise ValueError("Region is empty")
+            job.audio_seconds = (last - first) / sr
+
+            context = self.context_seconds(effect_type, params)
+            lo = max(first - int(context * sr), 0)
+            hi = min(last + int(context * sr), source.frames)
+            with stage_timer(SERVICE, "decode"):
+                window = source.read(lo, hi)
+
+            original = window[:, first - lo:last - lo]
+            region = render(window, sr, **params)[:, first - lo:last - lo]
+            level = dsp.peak(region)
+            if level > 0.99:
+                region *= 0.99 / level
+
+            with stage_timer(SERVICE, "crossfade"):
+                n = min(int(crossfade * sr), region.shape[-1] // 2)
+                if n:
+                    fade = np.linspace(0.0, 1.0, n, dtype=region.dtype)
+                    region[:, :n] *= fade
+                    region[:, :n] += original[:, :n] * fade[::-1]
+                    region[:, -n:] *= fade[::-1]
+                    region[:, -n:] += original[:, -n:] * fade
+
+            audio_source.splice(source, output_path, first, region, SERVICE)
+            progress.output(SERVICE, "output", output_path)
+
+    def preview(self, input_path, effect_type, start, duration, sample_rate=None, **params):
+        """Quick low-resolution render of `duration` seconds from `start`, for auditioning parameters
+
+        Runs the same effect methods and settings as a full render, on only
+        the excerpt and its `context_seconds`, resampled down to
+        `sample_rate` (default `PREVIEW_SR`); filters, FFTs and the reverb
+        impulse response all shrink with the rate. The excerpt is
+        peak-normalised to the effect's target, so its level matches the
+        final render when the excerpt holds the file's loudest part.
+        Returns `(channels, samples)` audio and its rate.
+        """
+        render = getattr(self, self.REGION_EFFECTS[effect_type])
+        with track_job(SERVICE) as job, audio_source.AudioSource(input_path) as source:
+            native_sr = source.samplerate
+            first = source.frame(start)
+            last = min(first + int(min(duration, self.PREVIEW_MAX_SECONDS) * native_sr), source.frames)
+            if last <= first:
+                raise ValueError("Preview excerpt is empty")
+            job.audio_seconds = (last - first) / native_sr
+
+            context = int(self.context_seconds(effect_type, params) * native_sr)
+            lo, hi = max(first - context, 0), min(last + context, source.frames)
+            with stage_timer(SERVICE, "decode"):
+                window = source.read(lo, hi)
+
+        sr = min(sample_rate or self.PREVIEW_SR, native_sr)
+        if sr != native_sr:
+            with stage_timer(SERVICE, "resample"):
+                window = librosa.resample(
+                    window, orig_sr=native_sr, target_sr=sr, res_type=audio_io.RESAMPLERS["output"]
+                )
+        # Excerpt bounds at the preview rate
+        offset = round((first - lo) * sr / native_sr)
+        length = round((last - first) * sr / native_sr)
+
+        output = render(window, sr, **params)
+        output = np.ascontiguousarray(output[:, offset:offset + length])
+        dsp.normalize_peak(output, self.NORMALIZE_TARGETS[effect_type])
+        return output, sr
+
     def detect_bpm(self, file_path):
         """Detect BPM using aubio"""
-        y, sr = librosa.load(file_path, sr=self.sample_rate)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        return float(tempo)
+        with track_job(SERVICE) as job:
+            # Tempo is a property of the whole mix, so analyse the mono downmix
+            # at the analysis rate with the fast resampler
+            y, sr = audio_io.load(file_path, audio_io.ANALYSIS_SR, SERVICE, quality="analysis")
+            job.audio_seconds = audio_io.duration(y, sr)
+            with stage_timer(SERVICE, "beat_track"):
+                # hop 256 at 22.05 kHz keeps the ~86 frames/s onset resolution of 512 at 44.1 kHz
+                tempo, _ = librosa.beat.beat_track(y=y, sr=sr, hop_length=256)
+        return float(np.atleast_1d(tempo)[0])
@@ -0,0 +1,303 @@
+"""
+Random access to audio files for region operations
+
+`AudioSource` reads an arbitrary `[start, end)` frame window without decoding
+the rest of the file. Uncompressed PCM/float WAV is memory-mapped, so a read
+touches only the pages of that window; FLAC and the other formats libsndfile
+understands are opened with soundfile and seeked to `start`. Anything else
+(m4a, or MP3 on an old libsndfile) falls back to a full decode through
+`audio_io.load`.
+
+`splice` writes a copy of the source with one window replaced. A WAV source is
+copied at the file level and only the window is rewritten in place; other
+sources are streamed through in blocks, so memory stays bounded by the block
+size either way.
+
+`render_blocks` and `NormalizedWriter` are the block-streaming path for files
+too large to process in one piece: each block is rendered with some context
+either side, and output is peak-normalised in a second streaming pass over a
+float scratch file instead of in memory.
+"""
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+import progress
+from metrics import stage_timer
+from services import audio_io, dsp
+
+# Frames per block when streaming a non-WAV source into the output
+BLOCK_FRAMES = 1 << 18
+
+# WAV format tags that can be mapped directly: (format, bits) -> (dtype, offset, scale)
+_MAPPABLE = {
+    (1, 8): (np.dtype("u1"), 128, 1 / 128),
+    (1, 16): (np.dtype("<i2"), 0, 1 / 32768),
+    (1, 32): (np.dtype("<i4"), 0, 1 / 2147483648),
+    (3, 32): (np.dtype("<f4"), 0, 1.0),
+    (3, 64): (np.dtype("<f8"), 0, 1.0),
+}
+
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# PCM subtypes copied through as integers when streaming into a WAV: subtype -> read dtype
+_COPY_DTYPES = {
+    "PCM_16": "int16",
+    "PCM_24": "int32",
+    "PCM_32": "int32",
+}
+
+def _wav_layout(path):
+    """`(data offset, frames, channels, dtype, zero, scale)` of a mappable WAV, else None"""
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                tag, channels, _, _, block_align, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == _WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    # The real format tag is the head of the sub-format GUID
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, block_align, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                tag, channels, block_align, bits = fmt
+                layout = _MAPPABLE.get((tag, bits))
+                if layout is None or block_align != channels * bits // 8:
+                    return None
+                offset = f.tell()
+                # Tolerate truncated files and streaming writers that left size at 0/-1
+                available = os.fstat(f.fileno()).st_size - offset
+                if size in (0, 0xFFFFFFFF) or size > available:
+                    size = available
+                return (offset, size // block_align, channels) + layout
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+class AudioSource:
+    """Frame-accurate window reads from an audio file at its native rate
+
+    `mode` is `"mmap"`, `"seek"` or `"decoded"` depending on how the file
+    could be opened. Windows come back as writable `(channels, frames)`
+    arrays in the processing dtype.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._decoded = None
+        self._file = None
+
+        layout = _wav_layout(path)
+        if layout is not None:
+            offset, frames, channels, dtype, self._zero, self._scale = layout
+            info = sf.info(path)
+            self.samplerate = info.samplerate
+            self.frames = frames
+            self.channels = channels
+            self.format = "WAV"
+            self.subtype = info.subtype
+            self.mode = "mmap"
+            if frames:
+                self._map = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, channels))
+            return
+
+        try:
+            f = sf.SoundFile(path)
+        except (RuntimeError, sf.LibsndfileError):
+            f = None
+        if f is not None and f.frames > 0:
+            # Kept open for the source's lifetime: callers like spectrogram tiles read many short windows
+            self._file = f
+            self.samplerate = f.samplerate
+            self.frames = f.frames
+            self.channels = f.channels
+            self.format = f.format
+            self.subtype = f.subtype
+            self.mode = "seek"
+            return
+        if f is not None:
+            f.close()
+
+        y, sr = audio_io.load(path, None, "audio_source", mono=False)
+        self._decoded = y
+        self.samplerate = sr
+        self.channels, self.frames = y.shape
+        self.format = None
+        self.subtype = None
+        self.mode = "decoded"
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate
+
+    def frame(self, seconds):
+        """Frame index for a time in seconds, clamped to the file"""
+        return min(max(int(round(seconds * self.samplerate)), 0), self.frames)
+
+    def read(self, start, end):
+        """Frames `[start, end)` as `(channels, frames)`; the range is clamped to the file"""
+        start = min(max(start, 0), self.frames)
+        end = min(max(end, start), self.frames)
+        if self.mode == "mmap":
+            out = np.empty((self.channels, end - start), dtype=dsp.DTYPE)
+            if end > start:
+                np.multiply(self._map[start:end].T, out.dtype.type(self._scale), out=out, casting="unsafe")
+                if self._zero:
+                    # Unsigned 8-bit is offset binary
+                    out -= self._zero * self._scale
+            return out
+        if self.mode == "seek":
+            self._file.seek(start)
+            return self._file.read(end - start, dtype=dsp.DTYPE.name, always_2d=True).T.copy()
+        return self._decoded[:, start:end].copy()
+
+    def blocks(self, start, end, dtype=None, block_frames=BLOCK_FRAMES):
+        """Yield `(frames, channels)` blocks covering `[start, end)` for streaming copies
+
+        A seeked source can return raw integer PCM (`dtype="int16"`/`"int32"`),
+        which skips the float conversion on both the read and the write. It
+        streams from its own handle, so `read` can be called in between.
+        """
+        if self.mode == "seek":
+            with sf.SoundFile(self.path) as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = f.read(min(block_frames, remaining), dtype=dtype or dsp.DTYPE.name, always_2d=True)
+                    if not len(block):
+                        return
+                    remaining -= len(block)
+                    yield block
+            return
+        for offset in range(start, end, block_frames):
+            yield self.read(offset, min(offset + block_frames, end)).T
+
+    def close(self):
+        # Drop the mapping so the file can be replaced/deleted (needed on Windows)
+        self._map = None
+        self._decoded = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_region(path, start, end, service):
+    """Decode only `[start, end)` seconds of a file at its native rate; returns `(y, sr)`
+
+    `y` is `(channels, frames)` like `audio_io.load(..., mono=False)`, but
+    writable and never cached.
+    """
+    with AudioSource(path) as source:
+        with stage_timer(service, "decode"):
+            y = source.read(source.frame(start), source.frame(end))
+        return y, source.samplerate
+
+def splice(source, output_path, start, window, service):
+    """Write `source` to `output_path` with frames from `start` replaced by `window`
+
+    `window` is `(channels, frames)` at the source's rate. A mapped WAV is
+    copied as-is and patched in place. Other sources are streamed block by
+    block into the output, keeping the source's bit depth where the output
+    format supports it; the untouched frames are decoded and re-encoded but
+    never processed.
+    """
+    end = start + window.shape[-1]
+    with stage_timer(service, "encode"):
+        if source.mode == "mmap" and os.path.splitext(output_path)[1].lower() == ".wav":
+            shutil.copyfile(source.path, output_path)
+            with sf.SoundFile(output_path, "r+") as f:
+                f.seek(start)
+                f.write(window.T)
+            return
+
+        subtype = source.subtype if source.subtype in _COPY_DTYPES else None
+        with sf.SoundFile(output_path, "w", samplerate=source.samplerate, channels=source.channels,
+                          subtype=subtype) as f:
+            dtype = _COPY_DTYPES.get(subtype)
+            for block in source.blocks(0, start, dtype):
+                f.write(block)
+            f.write(window.T)
+            for block in source.blocks(end, source.frames, dtype):
+                f.write(block)
+
+def render_blocks(source, render, block_frames, context_frames, service):
+    """Yield `render(window)` for consecutive `block_frames` blocks of `source`
+
+    Each window includes up to `context_frames` either side so filters and
+    STFTs see the neighbouring audio; only the block itself is yielded, as
+    `(channels, frames)`.
+    """
+    for first in range(0, source.frames, block_frames):
+        last = min(first + block_frames, source.frames)
+        lo = max(first - context_frames, 0)
+        hi = min(last + context_frames, source.frames)
+        with stage_timer(service, "decode"):
+            window = source.read(lo, hi)
+        yield render(window)[:, first - lo:last - lo]
+        progress.advance(service, "blocks", last, source.frames)
+
+class NormalizedWriter:
+    """Write blocks to `path`, peak-normalised to `target` once all have arrived
+
+    Blocks go to a float WAV scratch file next to `path` while the peak is
+    tracked; `close()` rescales them into the real output block by block.
+    """
+
+    def __init__(self, path, samplerate, channels, target, service, eps=0.0):
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.target = target
+        self.service = service
+        self.eps = eps
+        self.peak = 0.0
+        fd, self._scratch = tempfile.mkstemp(suffix=".wav", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self._file = sf.SoundFile(self._scratch, "w", samplerate=samplerate, channels=channels, subtype="FLOAT")
+
+    def write(self, block):
+        """Append a `(channels, frames)` block"""
+        self.peak = max(self.peak, dsp.peak(block))
+        self._file.write(block.T)
+
+    def close(self):
+        self._file.close()
+        level = self.peak + self.eps
+        scale = self.target / level if level > 0 else 1.0
+        try:
+            with stage_timer(self.service, "encode"):
+                with sf.SoundFile(self._scratch) as src, \
+                        sf.SoundFile(self.path, "w", samplerate=self.samplerate, channels=self.channels) as dst:
+                    for block in src.blocks(BLOCK_FRAMES, dtype=dsp.DTYPE.name, always_2d=True):
+                        block *= scale
+                        dst.write(block)
+        finally:
+            os.remove(self._scratch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._scratch)
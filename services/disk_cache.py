@@ -0,0 +1,111 @@
+"""
+Least-recently-used file cache on disk
+
+Entries are files named by a hash of their key, so any hashable, repr-stable
+key works and several worker processes can share one directory. A hit
+refreshes the file's mtime. Once the total size passes `max_bytes`, the
+oldest files are deleted until 90% of the budget is left. The running size
+is tracked per process, so every eviction rescans the directory to pick up
+the other workers' files.
+
+Readers that find a path with `lookup` can still lose it to another
+worker's eviction before they open it; treat a missing file as a miss. A
+file that is already open stays readable after eviction on POSIX.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+class DiskCache:
+    def __init__(self, directory, max_bytes, suffix=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}{self.suffix}")
+
+    def lookup(self, key):
+        """Path of a cached entry (marked as just used), or None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, key):
+        """Contents of a cached entry, or None"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def scratch(self):
+        """Path of a new empty file in the cache directory, for `add` to move into place
+
+        Hidden from eviction until it is added.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=".", suffix=self.suffix, dir=self.directory)
+        os.close(fd)
+        return path
+
+    def put(self, key, data):
+        """Store `data` under `key`"""
+        if len(data) > self.max_bytes:
+            return
+        path = self.scratch()
+        with open(path, "wb") as f:
+            f.write(data)
+        self.add(key, path)
+
+    def add(self, key, source_path):
+        """Move a file written with `scratch` into the cache under `key`; returns its cached path"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(source_path)
+        os.replace(source_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._files())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self, keep=None):
+        """Delete the least recently used entries, except `keep`, until 90% of the budget is left"""
+        files = sorted(self._files(), key=lambda item: item[2])
+        self._size = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self._size <= 0.9 * self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
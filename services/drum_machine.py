@@ -1,6 +1,10 @@
 import numpy as np
 import soundfile as sf
-from scipy import signal
+
+from metrics import stage_timer, track_job
+from services import audio_io, dsp
+
+SERVICE = "drum_machine"
 
 class DrumMachine:
     def __init__(self, sample_rate=44100):
@@ -11,18 +15,21 @@ class DrumMachine:
         if bpm is None:
             bpm = self._get_default_bpm(genre)
         
-        # Calculate beat timing
-        beat_duration = 60.0 / bpm
-        num_beats = int(duration / beat_duration)
-        
-        # Generate pattern based on genre
-        pattern = self._get_pattern(genre)
-        
-        # Create audio
-        audio = self._create_drum_audio(pattern, beat_duration, num_beats)
-        
-        # Save
-        sf.write(output_path, audio, self.sample_rate)
+        with track_job(SERVICE) as job:
+            # Calculate beat timing
+            beat_duration = 60.0 / bpm
+            num_beats = int(duration / beat_duration)
+
+            # Generate pattern based on genre
+            pattern = self._get_pattern(genre)
+
+            # Create audio
+            with stage_timer(SERVICE, "synthesis"):
+                audio = self._create_drum_audio(pattern, beat_duration, num_beats)
+            job.audio_seconds = len(audio) / self.sample_rate
+
+            # Save
+            audio_io.write(output_path, audio, self.sample_rate, SERVICE)
         return output_path
     
     def _get_default_bpm(self, genre):
@@ -72,7 +79,7 @@ class DrumMachine:
     def _create_drum_audio(self, pattern, beat_duration, num_beats):
         """Create drum audio from pattern"""
         total_samples = int(beat_duration * num_beats * self.sample_rate)
-        audio = np.zeros(total_samples)
+        audio = np.zeros(total_samples, dtype=dsp.DTYPE)
         
         # Generate drum sounds
         kick_sound = self._generate_kick()
@@ -101,8 +108,7 @@ class DrumMachine:
                         audio[step_sample:end_sample] += sound[:end_sample - step_sample]
         
         # Normalize
-        audio = audio / np.max(np.abs(audio)) * 0.9
-        return audio
+        return dsp.normalize_peak(audio, 0.9)
     
     def _generate_kick(self):
         """Generate kick drum sound"""
@@ -118,7 +124,7 @@ class DrumMachine:
         envelope = np.exp(-8 * t)
         kick = kick * envelope
         
-        return kick
+        return dsp.as_dtype(kick)
     
     def _generate_snare(self):
         """Generate snare drum sound"""
@@ -130,7 +136,7 @@ class DrumMachine:
         tone = np.sin(2 * np.pi * 200 * t)
         
         # Noise component
-        noise = np.random.randn(samples)
+        noise = dsp.noise(samples)
         
         # Mix
         snare = 0.3 * tone + 0.7 * noise
@@ -139,7 +145,7 @@ class DrumMachine:
         envelope = np.exp(-15 * t)
         snare = snare * envelope
         
-        return snare
+        return dsp.as_dtype(snare)
     
     def _generate_hihat(self):
         """Generate hi-hat sound"""
@@ -148,14 +154,13 @@ class DrumMachine:
         t = np.linspace(0, duration, samples)
         
         # High-frequency noise
-        hihat = np.random.randn(samples)
+        hihat = dsp.noise(samples)
         
         # High-pass filter
-        sos = signal.butter(4, 5000, 'highpass', fs=self.sample_rate, output='sos')
-        hihat = signal.sosfilt(sos, hihat)
+        sos = dsp.butter(4, 5000, 'highpass', self.sample_rate)
+        hihat = dsp.sosfilt(sos, hihat)
         
         # Envelope
-        envelope = np.exp(-40 * t)
-        hihat = hihat * envelope
+        hihat *= dsp.as_dtype(np.exp(-40 * t))
         
         return hihat
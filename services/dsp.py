@@ -0,0 +1,112 @@
+"""
+Numeric helpers shared by the services
+
+Audio is processed in float32 end to end: librosa decodes to float32, and
+filters, impulse responses and noise are created in the same dtype so
+`sosfilt`, `fftconvolve` and the STFT never promote a full-length buffer to
+float64/complex128. Normalisation scales buffers in place instead of
+building `x / np.max(np.abs(x))` temporaries. `DSP_DTYPE=float64` restores
+double precision, e.g. to compare outputs with `benchmarks.precision_bench`.
+
+Read `dsp.DTYPE` at call time rather than importing the name, so the
+precision benchmark can switch modes within one process.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+DTYPE = np.dtype(os.getenv("DSP_DTYPE", "float32"))
+
+def as_dtype(x):
+    """`x` in the processing dtype, without copying if it already is"""
+    return np.asarray(x, dtype=DTYPE)
+
+@lru_cache(maxsize=128)
+def _butter(order, cutoff, btype, fs, dtype):
+    return signal.butter(order, cutoff if len(cutoff) > 1 else cutoff[0], btype, fs=fs, output='sos').astype(dtype)
+
+def butter(order, cutoff, btype, fs):
+    """Butterworth second-order sections in the processing dtype
+
+    Designs are cached per order, cutoff, type, rate and dtype, so the
+    result is shared between callers and must not be modified.
+    """
+    return _butter(order, tuple(np.atleast_1d(cutoff).tolist()), btype, fs, DTYPE.name)
+
+def sosfilt(sos, x, initial=None):
+    """Filter along the last axis without promoting `x`
+
+    With `initial`, the filter starts settled on that constant input
+    instead of at rest.
+    """
+    sos = sos.astype(x.dtype, copy=False)
+    if initial is None:
+        return signal.sosfilt(sos, x, axis=-1)
+    zi = signal.sosfilt_zi(sos).reshape((len(sos),) + (1,) * (x.ndim - 1) + (2,)) * initial
+    zi = np.broadcast_to(zi, (len(sos),) + x.shape[:-1] + (2,)).astype(x.dtype)
+    return signal.sosfilt(sos, x, axis=-1, zi=zi)[0]
+
+def split_bands(x, fs, cutoffs, order=4):
+    """Complementary bands of `x` split at ascending `cutoffs`, lowest band first
+
+    A tree of low-pass splits: each pass filters the band below the next
+    cutoff down and the band above is what the filter removed, so the bands
+    sum back to `x` exactly (up to float rounding) with one filter pass per
+    cutoff. Filter designs are cached per rate.
+    """
+    bands = []
+    rest = x
+    for cutoff in sorted(cutoffs, reverse=True):
+        low = sosfilt(_butter(order, (cutoff,), 'lowpass', fs, rest.dtype.name), rest)
+        # What the low-pass removed, subtracted in place when `rest` is our own buffer
+        if rest is x:
+            rest = x - low
+        else:
+            rest -= low
+        bands.append(rest)
+        rest = low
+    bands.append(rest)
+    return bands[::-1]
+
+def noise(n):
+    """White noise from the global RNG, cast to the processing dtype"""
+    return np.random.randn(n).astype(DTYPE, copy=False)
+
+def peak(x):
+    """Largest absolute sample, without an `np.abs(x)` temporary"""
+    return max(float(x.max()), -float(x.min())) if x.size else 0.0
+
+def normalize_peak(x, target=0.9, eps=0.0):
+    """Scale `x` in place so its peak is `target`; returns `x`"""
+    level = peak(x) + eps
+    if level > 0:
+        x *= target / level
+    return x
+
+def normalize_loudness(x, target_db=-16.0, ceiling=0.99):
+    """Scale `x` in place to an RMS of `target_db` dBFS, limited so the peak stays below `ceiling`"""
+    flat = x.reshape(-1)
+    rms = np.sqrt(float(np.dot(flat, flat)) / max(flat.size, 1))
+    if rms == 0:
+        return x
+    gain = min(10 ** (target_db / 20) / rms, ceiling / max(peak(x), 1e-12))
+    x *= gain
+    return x
+
+def compress(x, threshold, ratio):
+    """Hard-knee compression of every sample above `threshold` dBFS, in place"""
+    level = np.abs(x)
+    level += 1e-10
+    np.log10(level, out=level)
+    level *= 20
+    mask = level > threshold
+    above = level[mask]
+    above -= threshold
+    above /= ratio
+    above += threshold
+    above /= 20
+    np.power(above.dtype.type(10), above, out=above)
+    x[mask] = np.copysign(above, x[mask])
+    return x
@@ -0,0 +1,155 @@
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Any, List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from database import SessionLocal
+from metrics import QUEUE_DEPTH
+from models import EffectLog
+
+logger = logging.getLogger(__name__)
+
+class EffectHistoryEntry(BaseModel):
+    id: int
+    recording_id: int
+    effect_type: str
+    parameters: Any
+    applied_at: datetime
+
+class EffectHistoryPage(BaseModel):
+    items: List[EffectHistoryEntry]
+    next_cursor: Optional[str] = None
+
+class EffectLogWriter:
+    """Buffers EffectLog rows and bulk-inserts them from a background thread"""
+
+    def __init__(self, session_factory=SessionLocal, batch_size=200, flush_interval=0.5):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def log(self, recording_id, effect_type, parameters="{}"):
+        """Queue an effect log row; returns immediately"""
+        self._queue.put({
+            "recording_id": recording_id,
+            "effect_type": effect_type,
+            "parameters": parameters,
+            "applied_at": datetime.utcnow()
+        })
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="effect-log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread and flush anything still queued"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Write everything currently queued in batches"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def _drain(self, block):
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        db = self.session_factory()
+        try:
+            db.bulk_insert_mappings(EffectLog, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to write {len(batch)} effect log rows: {str(e)}")
+        finally:
+            db.close()
+
+effect_log_writer = EffectLogWriter()
+QUEUE_DEPTH.set_function(lambda: effect_log_writer.pending, queue="effect_log")
+
+def _decode_cursor(cursor):
+    try:
+        applied_at, log_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(applied_at), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_parameters(parameters):
+    try:
+        return json.loads(parameters) if parameters else {}
+    except ValueError:
+        return parameters
+
+def history_page(query, cursor=None, limit=50):
+    """Keyset page over (applied_at, id), newest first"""
+    if cursor:
+        applied_at, log_id = _decode_cursor(cursor)
+        query = query.filter(
+            (EffectLog.applied_at < applied_at) |
+            ((EffectLog.applied_at == applied_at) & (EffectLog.id < log_id))
+        )
+
+    logs = query.order_by(
+        EffectLog.applied_at.desc(), EffectLog.id.desc()
+    ).limit(limit + 1).all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = logs[-1]
+        next_cursor = f"{last.applied_at.isoformat()}_{last.id}"
+
+    return EffectHistoryPage(
+        items=[
+            EffectHistoryEntry(
+                id=log.id,
+                recording_id=log.recording_id,
+                effect_type=log.effect_type,
+                parameters=_parse_parameters(log.parameters),
+                applied_at=log.applied_at
+            )
+            for log in logs
+        ],
+        next_cursor=next_cursor
+    )
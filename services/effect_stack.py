@@ -0,0 +1,133 @@
+"""
+Non-destructive effect stacks with cached intermediate renders
+
+A recording's stack is its `EffectLog` rows that have a `stack_position`,
+in order; the recording's own file is never modified. Rendering runs each
+stage on the previous stage's output. Every stage's output is cached on
+disk under a hash of the recording's identity and the chain of stages up
+to it. Editing stage k therefore leaves the keys of stages 0..k-1
+unchanged, and only k..n are rendered again. Intermediates are evicted
+least recently used first once `EFFECT_STACK_CACHE_MB` is in use.
+"""
+import hashlib
+import json
+import os
+
+import progress
+from config import settings
+from metrics import record_cache
+from models import EffectLog
+from services.disk_cache import DiskCache
+from services.memory_governor import MB
+
+SERVICE = "effect_stack"
+
+_cache = DiskCache(
+    settings.EFFECT_STACK_CACHE_DIR,
+    settings.EFFECT_STACK_CACHE_MB * MB,
+    suffix=".wav"
+)
+
+def _stack_query(db, recording_id):
+    return db.query(EffectLog).filter(
+        EffectLog.recording_id == recording_id,
+        EffectLog.stack_position.isnot(None)
+    )
+
+def stages(db, recording_id):
+    """A recording's stack rows, first stage first"""
+    return _stack_query(db, recording_id).order_by(EffectLog.stack_position).all()
+
+def insert(db, recording_id, effect_type, parameters, position=None):
+    """Insert a stage at `position` (default: on top), moving later stages up; returns the row"""
+    count = _stack_query(db, recording_id).count()
+    position = count if position is None else min(position, count)
+    _stack_query(db, recording_id).filter(EffectLog.stack_position >= position).update(
+        {EffectLog.stack_position: EffectLog.stack_position + 1}, synchronize_session=False
+    )
+    row = EffectLog(recording_id=recording_id, effect_type=effect_type, parameters=parameters,
+                    stack_position=position)
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+def replace(db, recording_id, position, effect_type, parameters):
+    """Change the stage at `position`; returns the row, or None if there is no such stage"""
+    row = _stack_query(db, recording_id).filter(EffectLog.stack_position == position).first()
+    if row is None:
+        return None
+    row.effect_type = effect_type
+    row.parameters = parameters
+    db.commit()
+    db.refresh(row)
+    return row
+
+def remove(db, recording_id, position):
+    """Delete the stage at `position`, moving later stages down; returns False if there is no such stage"""
+    row = _stack_query(db, recording_id).filter(EffectLog.stack_position == position).first()
+    if row is None:
+        return False
+    db.delete(row)
+    _stack_query(db, recording_id).filter(EffectLog.stack_position > position).update(
+        {EffectLog.stack_position: EffectLog.stack_position - 1}, synchronize_session=False
+    )
+    db.commit()
+    return True
+
+def chain_keys(source_path, stack):
+    """Cache key of every stage's output: the source's identity with each stage folded in
+
+    `stack` is `(effect_type, args)` pairs, where `args` are the keyword
+    arguments the effect is rendered with.
+    """
+    stat = os.stat(source_path)
+    digest = hashlib.sha256(repr((os.path.abspath(source_path), stat.st_size, stat.st_mtime_ns)).encode())
+    keys = []
+    for effect_type, args in stack:
+        digest.update(json.dumps([effect_type, args], sort_keys=True).encode())
+        keys.append(digest.hexdigest())
+    return keys
+
+def cached_prefix(source_path, stack):
+    """`(stages, path)`: how many leading stages have a cached output, and the last one's path"""
+    keys = chain_keys(source_path, stack)
+    for count in range(len(keys), 0, -1):
+        path = _cache.lookup(keys[count - 1])
+        if path is not None:
+            return count, path
+    return 0, source_path
+
+def _render(source_path, stack, render_stage):
+    keys = chain_keys(source_path, stack)
+    reused, current = cached_prefix(source_path, stack)
+    for k in range(len(stack)):
+        record_cache(SERVICE, k < reused)
+        if k < reused - 1:
+            # Keep the whole chain recently used: an edit to any stage needs the one below it
+            _cache.lookup(keys[k])
+    for k in range(reused, len(stack)):
+        scratch = _cache.scratch()
+        try:
+            render_stage(current, scratch, *stack[k])
+        except BaseException:
+            os.remove(scratch)
+            raise
+        current = _cache.add(keys[k], scratch)
+        progress.advance(SERVICE, "stages", k + 1, len(stack))
+    return current, reused
+
+def render(source_path, stack, render_stage):
+    """`(path, reused)`: the stack's final output and how many stages came from the cache
+
+    Stages after the longest cached prefix are rendered in order with
+    `render_stage(input_path, output_path, effect_type, args)`, and each
+    output is cached. The returned path belongs to the cache and may be
+    evicted later, so copy it before handing it out.
+    """
+    try:
+        return _render(source_path, stack, render_stage)
+    except FileNotFoundError:
+        # Another worker evicted the cached prefix between lookup and read;
+        # the retry finds a shorter prefix (or the source itself)
+        return _render(source_path, stack, render_stage)
@@ -0,0 +1,106 @@
+"""
+Memory cost models and the per-worker memory budget
+
+Decoding and processing a file uses several times its decoded size: the
+decoded buffer, STFTs, filter outputs and normalisation copies all live at
+once. Each service declares a `CostModel` per operation, peak bytes as a
+multiple of the decoded size plus a fixed overhead, calibrated with
+`benchmarks.memory_model_bench`. The scheduler asks the worker's
+`MemoryGovernor` whether a job's estimate fits next to the jobs already
+running before it hands out a slot.
+
+The budget comes from `MEMORY_BUDGET_MB`, or by default from 60% of the
+container's memory limit (cgroup) or the host's RAM, split between
+`WEB_CONCURRENCY` workers. Buffers held by the `audio_io` cache are not
+counted; size the budget with `RESAMPLE_CACHE_MB` in mind.
+"""
+import os
+
+MB = 1024 * 1024
+
+# A streamed block is rendered with context either side and passes through
+# the writer's buffers, so it costs a bit more than its own length
+STREAM_HEADROOM = 1.25
+
+def decoded_bytes(duration, sample_rate, channels):
+    """Size of `duration` seconds decoded to `(channels, samples)` in the processing dtype"""
+    # Imported here so loading the app does not pull in numpy and scipy
+    from services import dsp
+
+    return int((duration or 0) * (sample_rate or 44100) * (channels or 1) * dsp.DTYPE.itemsize)
+
+class CostModel:
+    """Peak memory of one operation: `factor` x decoded size + `overhead_mb`
+
+    `mono` models operations that work on the downmix. A block-streaming
+    variant only ever holds `stream_seconds` of audio, so its estimate is
+    capped at that length regardless of the file's duration.
+    """
+
+    def __init__(self, factor, overhead_mb=0, mono=False):
+        self.factor = factor
+        self.overhead = overhead_mb * MB
+        self.mono = mono
+
+    def estimate(self, duration, sample_rate, channels, stream_seconds=None):
+        if stream_seconds is not None:
+            duration = min(duration or 0, stream_seconds * STREAM_HEADROOM)
+        channels = 1 if self.mono else channels
+        return int(self.factor * decoded_bytes(duration, sample_rate, channels) + self.overhead)
+
+def _memory_limit():
+    """Container memory limit in bytes (cgroup v2 or v1), else physical RAM, else None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max", or v1's page-counter ceiling, mean no limit
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def default_budget(fraction=0.6):
+    """This worker's share of the machine's memory for processing"""
+    from config import settings
+
+    limit = _memory_limit() or 2048 * MB
+    workers = max(settings.WEB_CONCURRENCY, 1)
+    return int(limit * fraction / workers)
+
+class MemoryGovernor:
+    """Tracks estimated bytes in use by running jobs against a budget"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.reserved = 0
+
+    def fits(self, estimate):
+        return self.reserved + estimate <= self.budget
+
+    def oversized(self, estimate):
+        """Larger than the whole budget; can only run with nothing else reserved"""
+        return estimate > self.budget
+
+    def reserve(self, estimate):
+        self.reserved += estimate
+
+    def release(self, estimate):
+        self.reserved = max(self.reserved - estimate, 0)
+
+def plan(service, operation, duration, sample_rate, channels, budget, stream_seconds):
+    """`(estimated bytes, streaming)` for running `operation` of `service`
+
+    Picks the block-streaming path when the full estimate exceeds `budget`
+    and the service has one for this operation; otherwise the full estimate
+    stands and the scheduler decides when the job can run.
+    """
+    model = service.MEMORY_MODELS[operation]
+    estimate = model.estimate(duration, sample_rate, channels)
+    if estimate > budget and operation in getattr(service, "STREAMING_OPERATIONS", ()):
+        return model.estimate(duration, sample_rate, channels, stream_seconds=stream_seconds), True
+    return estimate, False
@@ -3,36 +3,73 @@ import librosa
 import soundfile as sf
 import numpy as np
 
+import progress
+from metrics import stage_timer, track_job
+from services import audio_io, audio_source, dsp
+from services.memory_governor import CostModel
+
+SERVICE = "noise_canceller"
+
 class NoiseCanceller:
-    def __init__(self, sample_rate=44100):
+    # noisereduce works in fixed-size chunks, hence the large constant term
+    MEMORY_MODELS = {"noise_cancel": CostModel(4.5, overhead_mb=160)}
+    STREAMING_OPERATIONS = ("noise_cancel",)
+
+    # Seconds either side of a streamed block that its STFT sees
+    STREAM_CONTEXT = 0.5
+
+    def __init__(self, sample_rate=None):
         self.sample_rate = sample_rate
+
+    def reduce(self, y, sr):
+        """Noise-reduced copy of `(channels, samples)` audio, before normalisation"""
+        with stage_timer(SERVICE, "reduce_noise"):
+            return dsp.as_dtype(nr.reduce_noise(y=y, sr=sr, stationary=True, prop_decrease=0.8))
     
     def process(self, input_path, output_path):
         """Apply noise cancellation using noisereduce library"""
-        # Load audio
-        y, sr = librosa.load(input_path, sr=self.sample_rate)
-        
-        # Apply noise reduction
-        # Use first 0.5 seconds as noise profile
-        noise_sample_length = int(0.5 * sr)
-        noise_sample = y[:noise_sample_length]
-        
-        # Reduce noise
-        reduced_noise = nr.reduce_noise(
-            y=y,
-            sr=sr,
-            stationary=True,
-            prop_decrease=0.8
-        )
-        
-        # Normalize
-        reduced_noise = reduced_noise / np.max(np.abs(reduced_noise)) * 0.9
-        
-        # Save
-        sf.write(output_path, reduced_noise, sr)
+        with track_job(SERVICE) as job:
+            # Load audio
+            y, sr = audio_io.load(input_path, self.sample_rate, SERVICE, mono=False)
+            job.audio_seconds = audio_io.duration(y, sr)
+
+            # Apply noise reduction
+            # Use first 0.5 seconds as noise profile
+            noise_sample_length = int(0.5 * sr)
+            noise_sample = y[..., :noise_sample_length]
+
+            # Reduce noise; noisereduce handles (channels, samples) in one call
+            reduced_noise = self.reduce(y, sr)
+
+            # Normalize
+            reduced_noise = dsp.normalize_peak(reduced_noise, 0.9)
+
+            # Save
+            audio_io.write(output_path, reduced_noise, sr, SERVICE)
+            progress.output(SERVICE, "output", output_path)
         
         return output_path
     
+    def process_streaming(self, input_path, output_path, block_seconds=30.0):
+        """`process` in blocks, for files too large to hold in memory
+
+        Noise statistics are estimated per block rather than over the whole
+        file, which also lets the reduction follow slowly changing noise.
+        """
+        with track_job(SERVICE) as job, audio_source.AudioSource(input_path) as source:
+            sr = source.samplerate
+            job.audio_seconds = source.duration
+            blocks = audio_source.render_blocks(
+                source, lambda window: self.reduce(window, sr),
+                int(block_seconds * sr), int(self.STREAM_CONTEXT * sr), SERVICE
+            )
+            with audio_source.NormalizedWriter(output_path, sr, source.channels, 0.9, SERVICE) as writer:
+                for block in blocks:
+                    writer.write(block)
+            progress.output(SERVICE, "output", output_path)
+
+        return output_path
+
     def process_realtime_chunk(self, audio_chunk, sr):
         """Process audio chunk for real-time noise cancellation"""
         reduced = nr.reduce_noise(
@@ -0,0 +1,53 @@
+"""
+Lazily constructed service singletons
+
+Service modules pull in librosa, scipy, pydub, aubio and noisereduce, which
+take seconds to import. Routers ask for services by name here instead of
+importing them, so the app can answer /health immediately and build the
+services on first use or from a background warm-up.
+"""
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICES = {
+    "audio_processor": ("services.audio_processor", "AudioProcessor"),
+    "noise_canceller": ("services.noise_cancellation", "NoiseCanceller"),
+    "stem_separator": ("services.stem_separator", "StemSeparator"),
+    "drum_machine": ("services.drum_machine", "DrumMachine"),
+}
+
+_instances = {}
+_lock = threading.Lock()
+_ready = threading.Event()
+
+def get_service(name):
+    """Return the shared instance of a service, importing it on first use"""
+    service = _instances.get(name)
+    if service is not None:
+        return service
+
+    with _lock:
+        if name not in _instances:
+            module_name, class_name = SERVICES[name]
+            start = time.perf_counter()
+            module = importlib.import_module(module_name)
+            _instances[name] = getattr(module, class_name)()
+            logger.info(f"Loaded {class_name} in {time.perf_counter() - start:.2f}s")
+    return _instances[name]
+
+def warm_up(exercise=False):
+    """Construct every service, optionally running each once to trigger JIT
+    compilation; marks the process ready when done"""
+    for name in SERVICES:
+        get_service(name)
+    if exercise:
+        from services.warmup import exercise_services
+        exercise_services(get_service)
+    _ready.set()
+
+def is_ready():
+    return _ready.is_set()
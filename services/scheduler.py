@@ -0,0 +1,238 @@
+"""
+Fair-share scheduling of heavy processing jobs
+
+Every processing route asks the worker's `FairScheduler` for a slot before
+it touches audio. At most `max_concurrent` jobs run at once and at most
+`per_user` of them for any one user, so a single client looping
+`/split-stems` can't take every core.
+
+Waiting jobs are picked in strict priority order (`interactive` before
+`batch`), and within a priority by start-time fair queuing: each user has a
+virtual clock that advances by the job's cost (seconds of audio) divided by
+the user's weight, and the user with the earliest clock goes next. A user
+who has been idle starts at the current virtual time rather than with
+banked credit.
+
+Each job also carries a memory estimate (see `services.memory_governor`).
+A job is only started while its estimate fits in the worker's memory budget
+next to the jobs already running; if the next job in fair order doesn't
+fit, dispatch waits for memory rather than letting smaller jobs overtake it
+indefinitely. A job larger than the whole budget runs alone.
+
+Admission is decided up front. When the total queue or the user's own
+queue is full, `submit` raises `QueueFull` with a Retry-After estimate based
+on recent job durations, and the route answers 429 instead of letting the
+request time out. State is per process and lives on the event loop, so no
+locking is needed; with several workers the limits apply to each one.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+from metrics import QUEUE_DEPTH, SCHEDULER_MEMORY, SCHEDULER_REJECTIONS, SCHEDULER_RUNNING, SCHEDULER_WAIT
+from services.memory_governor import MemoryGovernor
+
+# Highest priority first
+PRIORITIES = ("interactive", "batch")
+
+class QueueFull(Exception):
+    """The job was not admitted; retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Processing queue is full ({reason})")
+        self.retry_after = retry_after
+        self.reason = reason
+
+class Ticket:
+    """A submitted job's place in the queue, then its processing slot
+
+    `async with ticket:` waits for the slot and releases it afterwards.
+    Callers that must do something while waiting (e.g. send heartbeats) can
+    use `wait(timeout)` and `release()` directly; `release()` also withdraws
+    a ticket that is still queued.
+    """
+
+    def __init__(self, scheduler, user_id, priority, cost, weight, memory):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.cost = cost
+        self.weight = weight
+        self.memory = memory
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self._granted = asyncio.get_running_loop().create_future()
+        self._released = False
+
+    @property
+    def granted(self):
+        return self._granted.done()
+
+    async def wait(self, timeout=None):
+        """True once the slot is held; False if `timeout` passes first"""
+        if not self._granted.done():
+            try:
+                # Shielded so a cancelled waiter doesn't cancel the grant itself
+                await asyncio.wait_for(asyncio.shield(self._granted), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self)
+
+    async def __aenter__(self):
+        try:
+            await self.wait()
+        except BaseException:
+            self.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+class FairScheduler:
+    def __init__(self, max_concurrent, per_user=2, max_queued=64, max_queued_per_user=8, memory_budget=None):
+        self.max_concurrent = max_concurrent
+        self.memory = MemoryGovernor(memory_budget if memory_budget is not None else float("inf"))
+        self.per_user = per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        # priority -> user -> waiting tickets, users in arrival order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._running = {}
+        self._running_by_priority = {priority: 0 for priority in PRIORITIES}
+        self._active = 0
+        # Start-time fair queuing clocks
+        self._user_clock = {}
+        self._clock = 0.0
+        # Smoothed job duration per priority, for Retry-After
+        self._duration = {priority: 10.0 for priority in PRIORITIES}
+
+    @property
+    def queued(self):
+        return sum(len(tickets) for queue in self._queues.values() for tickets in queue.values())
+
+    def _queued_for(self, user_id):
+        return sum(len(queue.get(user_id, ())) for queue in self._queues.values())
+
+    def submit(self, user_id, priority="batch", cost=1.0, weight=1.0, memory=0):
+        """Queue a job for `user_id` with an estimated peak of `memory` bytes
+
+        Raises `QueueFull` if it can't be admitted.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        if self.queued >= self.max_queued:
+            self._reject(priority, "total")
+        if self._queued_for(user_id) >= self.max_queued_per_user:
+            self._reject(priority, "user")
+
+        ticket = Ticket(self, user_id, priority, max(cost, 1e-3), weight, memory)
+        self._queues[priority].setdefault(user_id, deque()).append(ticket)
+        self._update_gauges()
+        self._dispatch()
+        return ticket
+
+    def _reject(self, priority, reason):
+        SCHEDULER_REJECTIONS.inc(priority=priority, reason=reason)
+        # Time for the jobs ahead to drain through the available slots
+        ahead = self.queued + self._active
+        retry_after = ahead * self._duration[priority] / max(self.max_concurrent, 1)
+        raise QueueFull(max(1, math.ceil(retry_after)), reason)
+
+    def _pick(self):
+        """`(priority, user_id, start tag)` of the job that should run next, or None"""
+        for priority in PRIORITIES:
+            best, best_start = None, None
+            for user_id, tickets in self._queues[priority].items():
+                if self._running.get(user_id, 0) >= self.per_user:
+                    continue
+                start = max(self._user_clock.get(user_id, 0.0), self._clock)
+                if best_start is None or start < best_start:
+                    best, best_start = user_id, start
+            if best is not None:
+                return priority, best, best_start
+        return None
+
+    def _dispatch(self):
+        while self._active < self.max_concurrent:
+            pick = self._pick()
+            if pick is None:
+                break
+            priority, user_id, start = pick
+            tickets = self._queues[priority][user_id]
+            ticket = tickets[0]
+            if not self.memory.fits(ticket.memory) and self._active:
+                # Hold the line until enough running jobs finish
+                break
+
+            tickets.popleft()
+            if not tickets:
+                del self._queues[priority][user_id]
+            self._clock = start
+            self._user_clock[user_id] = start + ticket.cost / ticket.weight
+
+            self.memory.reserve(ticket.memory)
+            self._active += 1
+            self._running[ticket.user_id] = self._running.get(ticket.user_id, 0) + 1
+            self._running_by_priority[ticket.priority] += 1
+            ticket.started_at = time.perf_counter()
+            SCHEDULER_WAIT.observe(ticket.started_at - ticket.submitted_at, priority=ticket.priority)
+            ticket._granted.set_result(None)
+        self._update_gauges()
+
+    def _release(self, ticket):
+        if ticket.started_at is None:
+            # Withdrawn while still queued
+            tickets = self._queues[ticket.priority].get(ticket.user_id)
+            if tickets is not None and ticket in tickets:
+                tickets.remove(ticket)
+                if not tickets:
+                    del self._queues[ticket.priority][ticket.user_id]
+            if not ticket._granted.done():
+                ticket._granted.cancel()
+            self._update_gauges()
+            return
+
+        self._active -= 1
+        self.memory.release(ticket.memory)
+        self._running_by_priority[ticket.priority] -= 1
+        self._running[ticket.user_id] -= 1
+        if not self._running[ticket.user_id]:
+            del self._running[ticket.user_id]
+            if not self._queued_for(ticket.user_id) and self._user_clock.get(ticket.user_id, 0.0) <= self._clock:
+                # Idle and owed nothing; forget the user
+                self._user_clock.pop(ticket.user_id, None)
+        duration = time.perf_counter() - ticket.started_at
+        self._duration[ticket.priority] += 0.2 * (duration - self._duration[ticket.priority])
+        self._dispatch()
+
+    def _update_gauges(self):
+        for priority, queue in self._queues.items():
+            QUEUE_DEPTH.set(sum(len(tickets) for tickets in queue.values()), queue=f"scheduler_{priority}")
+            SCHEDULER_RUNNING.set(self._running_by_priority[priority], priority=priority)
+        SCHEDULER_MEMORY.set(self.memory.reserved, kind="reserved")
+        SCHEDULER_MEMORY.set(self.memory.budget if self.memory.budget != float("inf") else 0, kind="budget")
+
+_scheduler = None
+
+def get_scheduler():
+    """This worker's scheduler, sized from settings on first use"""
+    global _scheduler
+    if _scheduler is None:
+        from config import settings
+        from services.memory_governor import MB, default_budget
+        _scheduler = FairScheduler(
+            settings.SCHEDULER_MAX_CONCURRENT or os.cpu_count() or 1,
+            per_user=settings.SCHEDULER_PER_USER,
+            max_queued=settings.SCHEDULER_MAX_QUEUED,
+            max_queued_per_user=settings.SCHEDULER_MAX_QUEUED_PER_USER,
+            memory_budget=settings.MEMORY_BUDGET_MB * MB if settings.MEMORY_BUDGET_MB else default_budget()
+        )
+    return _scheduler
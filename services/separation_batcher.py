@@ -0,0 +1,214 @@
+"""
+Batched Spleeter inference
+
+Spleeter cuts a track's spectrogram into `T`-frame segments and runs them
+through its U-Net as one batch, so the model's batch dimension is really
+"segments". `spleeter_batch` exploits that: it packs several tracks end to
+end into one waveform, each padded with silence up to a segment boundary,
+runs a single `Separator.separate` call and cuts every stem back into
+per-track pieces. One session run then fills the CPU's vector units and
+TensorFlow's thread pool with segments from all the tracks instead of
+paying the per-call setup once per request.
+
+`SeparationBatcher` is the front-end. Request threads call `separate`,
+which queues the job and blocks; one worker thread takes the first waiting
+job, keeps collecting for up to `max_delay` seconds or until `batch_size`
+jobs (or `max_batch_seconds` of audio) are in hand, runs them together and
+hands each request its own result or exception.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import QUEUE_DEPTH, SEPARATION_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+def configure_threads(intra_op=0, inter_op=0):
+    """Size TensorFlow's thread pools (0 keeps its default, one thread per core)
+
+    Must run before TensorFlow executes anything in this process; later calls
+    are ignored with a warning.
+    """
+    if not intra_op and not inter_op:
+        return
+    import tensorflow as tf
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        logger.warning("TensorFlow thread settings not applied: %s", e)
+
+def _segment_samples(separator):
+    params = separator._params
+    return params["T"] * params["frame_step"]
+
+def spleeter_batch(separator, waveforms):
+    """Separate `(samples, channels)` waveforms in one model run
+
+    Returns one `{instrument: waveform}` dict per input, each the same length
+    as its input. Tracks are separated by at least one STFT frame of silence
+    and start on a segment boundary, so no segment or frame mixes two tracks.
+    """
+    if len(waveforms) == 1:
+        return [separator.separate(waveforms[0])]
+
+    segment = _segment_samples(separator)
+    gap = separator._params["frame_length"]
+    offsets, parts, position = [], [], 0
+    for waveform in waveforms:
+        padded = -(-(len(waveform) + gap) // segment) * segment
+        offsets.append(position)
+        parts.append(waveform)
+        parts.append(np.zeros((padded - len(waveform), waveform.shape[1]), dtype=waveform.dtype))
+        position += padded
+
+    stems = separator.separate(np.concatenate(parts))
+    return [
+        {name: stem[offset:offset + len(waveform)] for name, stem in stems.items()}
+        for offset, waveform in zip(offsets, waveforms)
+    ]
+
+class _Job:
+    def __init__(self, input_path, output_dir):
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.future = Future()
+        self.waveform = None
+
+class SeparationBatcher:
+    """Collect `separate_to_file` requests and run them through Spleeter in batches"""
+
+    def __init__(self, separator, batch_size=4, max_delay=0.2, max_batch_seconds=600.0,
+                 intra_op_threads=0, inter_op_threads=0):
+        self.separator = separator
+        self.batch_size = max(batch_size, 1)
+        self.max_delay = max_delay
+        self.max_batch_seconds = max_batch_seconds
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self._queue = queue.Queue()
+        # A loaded job that didn't fit the last batch; it heads the next one
+        self._carry = None
+        # The worker thread is started lazily so a pre-forked parent never owns it
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def sample_rate(self):
+        return self.separator._params["sample_rate"]
+
+    def separate(self, input_path, output_dir):
+        """Separate `input_path` into `output_dir/<name>/<instrument>.wav` and return the stem paths
+
+        Blocks until the batch containing this file has run; same layout as
+        `Separator.separate_to_file`.
+        """
+        return self.submit(input_path, output_dir).result()
+
+    def submit(self, input_path, output_dir):
+        """Queue a file for separation; returns a `Future` of its stem paths"""
+        self._ensure_worker()
+        job = _Job(input_path, output_dir)
+        self._queue.put(job)
+        QUEUE_DEPTH.set(self._queue.qsize(), queue="separation_batch")
+        return job.future
+
+    def _ensure_worker(self):
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="separation-batcher", daemon=True)
+                self._thread.start()
+
+    def _audio_adapter(self):
+        from spleeter.audio.adapter import AudioAdapter
+        return AudioAdapter.default()
+
+    def _load(self, job):
+        """Decode a job's input; a file that fails here fails alone"""
+        try:
+            # Same 600 s cap as `separate_to_file`
+            waveform, _ = self._audio_adapter().load(
+                job.input_path, duration=600.0, sample_rate=self.sample_rate, dtype=np.float32
+            )
+        except Exception as e:
+            job.future.set_exception(e)
+            return False
+        job.waveform = waveform
+        return True
+
+    def _collect(self, first):
+        """`first` plus whatever else arrives within `max_delay`, up to the batch limits"""
+        batch = [first]
+        seconds = len(first.waveform) / self.sample_rate
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if not self._load(job):
+                continue
+            length = len(job.waveform) / self.sample_rate
+            if seconds + length > self.max_batch_seconds:
+                self._carry = job
+                break
+            batch.append(job)
+            seconds += length
+        return batch
+
+    def _run(self):
+        configure_threads(self.intra_op_threads, self.inter_op_threads)
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = self._queue.get()
+                if not self._load(first):
+                    continue
+            batch = self._collect(first)
+            QUEUE_DEPTH.set(self._queue.qsize(), queue="separation_batch")
+            SEPARATION_BATCH_SIZE.observe(len(batch))
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            results = spleeter_batch(self.separator, [job.waveform for job in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Don't let one track's failure fail the others
+                logger.warning("Batched separation failed, retrying %d tracks one by one: %s", len(batch), e)
+                for job in batch:
+                    self._run_batch([job])
+                return
+            batch[0].future.set_exception(e)
+            return
+        for job, stems in zip(batch, results):
+            job.waveform = None
+            try:
+                job.future.set_result(self._save(job, stems))
+            except Exception as e:
+                job.future.set_exception(e)
+
+    def _save(self, job, stems):
+        base_name = os.path.splitext(os.path.basename(job.input_path))[0]
+        directory = os.path.join(job.output_dir, base_name)
+        os.makedirs(directory, exist_ok=True)
+        adapter = self._audio_adapter()
+        paths = {}
+        for instrument, data in stems.items():
+            paths[instrument] = os.path.join(directory, f"{instrument}.wav")
+            adapter.save(paths[instrument], data, self.sample_rate, "wav", "128k")
+        return paths
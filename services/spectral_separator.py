@@ -0,0 +1,143 @@
+"""
+Model-free vocal/instrument separation with STFT soft masks
+
+Each chunk of the track is transformed once; harmonic/percussive separation
+(median filters across time and frequency) splits off drums and transients,
+then a REPET model of the harmonic part finds the repeating accompaniment by
+taking the median of the spectrogram at multiples of the detected repetition
+period. What is harmonic but not repeating is kept as vocals; instruments are
+the complement, so vocals + instruments reconstructs the input.
+
+All masking is vectorized over frames and channels: a `(channels, samples)`
+input gets one STFT of shape `(channels, bins, frames)` and per-channel masks
+from the same calls, so the stereo image is kept. The track is processed in overlapping
+chunks that are crossfaded back together, so memory is bounded by the chunk
+length rather than the track length.
+"""
+import os
+from pathlib import Path
+
+import librosa
+import numpy as np
+from scipy import ndimage
+
+import progress
+from metrics import stage_timer, track_job
+from services import audio_io, dsp
+
+SERVICE = "spectral_separator"
+
+EPS = 1e-10
+
+class SpectralSeparator:
+    def __init__(self, sample_rate=None, n_fft=2048, hop_length=512, chunk_seconds=30.0,
+                 overlap_seconds=1.0, hpss_kernel=17, margin=2.0, min_period=1.0, max_period=8.0):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self.hpss_kernel = hpss_kernel
+        self.margin = margin
+        self.min_period = min_period
+        self.max_period = max_period
+
+    def _repeating_period(self, power, sr):
+        """Repetition period in frames from the beat spectrum, or None if too short"""
+        n_frames = power.shape[-1]
+        frames_per_second = sr / self.hop_length
+        lo = int(self.min_period * frames_per_second)
+        hi = min(int(self.max_period * frames_per_second), n_frames // 3)
+        if hi <= lo:
+            return None
+        # Autocorrelation of every frequency row of every channel at once via the FFT
+        spectrum = np.fft.rfft(power, n=2 * n_frames, axis=-1)
+        acf = np.fft.irfft(np.abs(spectrum) ** 2, axis=-1)[..., :n_frames]
+        beat_spectrum = acf.reshape(-1, n_frames).mean(axis=0)
+        beat_spectrum /= beat_spectrum[0] + EPS
+        return lo + int(np.argmax(beat_spectrum[lo:hi]))
+
+    def _repeating_model(self, magnitude, period):
+        """Median of the spectrogram across repetitions, tiled back to full length"""
+        *lead, n_frames = magnitude.shape
+        n_segments = -(-n_frames // period)
+        padded = np.full((*lead, n_segments * period), np.nan, dtype=magnitude.dtype)
+        padded[..., :n_frames] = magnitude
+        segments = padded.reshape(*lead, n_segments, period)
+        model = np.nanmedian(segments, axis=-2)
+        tiled = np.tile(model, (1,) * len(lead) + (n_segments,))[..., :n_frames]
+        return np.minimum(tiled, magnitude)
+
+    def _median(self, magnitude, axis):
+        # 1-D median along one axis; about twice as fast as a (1, k) 2-D window
+        return ndimage.median_filter(magnitude, size=self.hpss_kernel, axes=(axis,), mode="reflect")
+
+    def vocal_mask(self, magnitude, sr):
+        """Soft vocal mask in [0, 1] for a magnitude spectrogram"""
+        with stage_timer(SERVICE, "hpss"):
+            mask_h = librosa.util.softmask(
+                self._median(magnitude, axis=-1), self._median(magnitude, axis=-2), power=2
+            )
+            harmonic = magnitude * mask_h
+
+        with stage_timer(SERVICE, "repet"):
+            period = self._repeating_period(harmonic ** 2, sr)
+            if period is None:
+                # Too short to see a repetition; median-filter the harmonic part over time instead
+                repeating = np.minimum(harmonic, self._median(harmonic, axis=-1))
+            else:
+                repeating = self._repeating_model(harmonic, period)
+            mask_v = librosa.util.softmask(harmonic - repeating, self.margin * repeating, power=2)
+
+        return mask_h * mask_v
+
+    def separate(self, y, sr):
+        """Return `(vocals, instruments)` for `(samples,)` or `(channels, samples)`; their sum is `y`"""
+        n_samples = y.shape[-1]
+        chunk = int(self.chunk_seconds * sr)
+        overlap = int(self.overlap_seconds * sr)
+        vocals = np.zeros_like(y)
+        fade_in = np.linspace(0.0, 1.0, overlap, dtype=y.dtype)
+
+        start = 0
+        while start < n_samples:
+            end = min(start + chunk, n_samples)
+            segment = y[..., start:end]
+            with stage_timer(SERVICE, "stft"):
+                spec = librosa.stft(segment, n_fft=self.n_fft, hop_length=self.hop_length)
+            mask = self.vocal_mask(np.abs(spec), sr)
+            with stage_timer(SERVICE, "istft"):
+                part = librosa.istft(spec * mask, hop_length=self.hop_length, length=segment.shape[-1])
+
+            # Linear crossfade with the previous chunk's tail
+            if start > 0 and overlap:
+                n = min(overlap, part.shape[-1])
+                part[..., :n] *= fade_in[:n]
+                vocals[..., start:start + n] *= 1.0 - fade_in[:n]
+            vocals[..., start:end] += part
+            progress.advance(SERVICE, "separate", end, n_samples)
+
+            if end == n_samples:
+                break
+            start = end - overlap
+
+        return vocals, y - vocals
+
+    def separate_file(self, input_path, output_dir):
+        """Separate a file into vocals.wav and accompaniment.wav in `output_dir`"""
+        with track_job(SERVICE) as job:
+            y, sr = audio_io.load(input_path, self.sample_rate, SERVICE, mono=False)
+            job.audio_seconds = audio_io.duration(y, sr)
+
+            vocals, instruments = self.separate(y, sr)
+
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            vocals_path = os.path.join(output_dir, "vocals.wav")
+            instruments_path = os.path.join(output_dir, "accompaniment.wav")
+            audio_io.write(vocals_path, dsp.normalize_peak(vocals, 0.9, eps=1e-6), sr, SERVICE)
+            progress.output(SERVICE, "vocals", vocals_path)
+            audio_io.write(instruments_path, dsp.normalize_peak(instruments, 0.9, eps=1e-6), sr, SERVICE)
+            progress.output(SERVICE, "accompaniment", instruments_path)
+
+        return vocals_path, instruments_path
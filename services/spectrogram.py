@@ -0,0 +1,198 @@
+"""
+Spectrogram tiles, addressed like map tiles
+
+A tile is `TILE_COLUMNS` STFT columns by `TILE_ROWS` frequency rows of one
+recording at one zoom level and frequency scale. Level 0 advances
+`BASE_HOP` frames per column and each level above doubles the hop, so tile
+`t` of level `z` starts at frame `t * TILE_COLUMNS * (BASE_HOP << z)`.
+Scrolling asks for the next tile index; zooming out asks for a higher
+level.
+
+A tile only decodes the samples its own columns need, through
+`AudioSource`. While the hop is shorter than the FFT window that is one
+contiguous read; at coarser levels the columns are further apart than a
+window, so each column's window is read on its own and the audio in
+between is never touched. Power is mixed across channels and mapped to
+rows on a linear, log or mel frequency scale. dB values are taken against
+full scale over a fixed `DB_RANGE`, not normalised per tile, so
+neighbouring tiles join up. Each tile is then quantised to uint8.
+
+Rendered tiles go to a disk cache shared by the workers
+(`SPECTROGRAM_CACHE_DIR`, bounded by `SPECTROGRAM_CACHE_MB`) and are
+evicted least recently used first.
+"""
+import os
+import struct
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from config import settings
+from metrics import record_cache, stage_timer
+from services.disk_cache import DiskCache
+
+SERVICE = "spectrogram"
+
+TILE_COLUMNS = 256
+TILE_ROWS = 256
+BASE_HOP = 128
+N_FFT = 2048
+# dB below full scale mapped to 0; full scale maps to 255
+DB_RANGE = 100.0
+MIN_FREQ = 20.0
+SCALES = ("linear", "log", "mel")
+FORMATS = ("png", "raw")
+
+# Bump when the rendering changes so stale cached tiles are never served
+_VERSION = 1
+
+def levels(frames):
+    """Number of zoom levels for a recording; the last one fits it in one tile"""
+    level = 0
+    while TILE_COLUMNS * (BASE_HOP << level) < frames:
+        level += 1
+    return level + 1
+
+def hop(level):
+    return BASE_HOP << level
+
+def tiles(frames, level):
+    """Number of tiles across a recording at `level`"""
+    return max(-(-frames // (TILE_COLUMNS * hop(level))), 1)
+
+def geometry(audio_path):
+    """Tile layout of a recording, for a client to address tiles from"""
+    from services import audio_source
+
+    with audio_source.AudioSource(audio_path) as source:
+        frames, sample_rate = source.frames, source.samplerate
+    count = levels(frames)
+    return {
+        "sample_rate": sample_rate,
+        "frames": frames,
+        "tile_columns": TILE_COLUMNS,
+        "tile_rows": TILE_ROWS,
+        "n_fft": N_FFT,
+        "db_range": DB_RANGE,
+        "levels": [
+            {"level": level, "hop": hop(level), "tiles": tiles(frames, level),
+             "seconds_per_tile": TILE_COLUMNS * hop(level) / sample_rate}
+            for level in range(count)
+        ],
+    }
+
+def _mel(f):
+    return 2595.0 * np.log10(1.0 + f / 700.0)
+
+def _mel_to_hz(m):
+    return 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+
+@lru_cache(maxsize=16)
+def _projection(sample_rate, scale):
+    """`(TILE_ROWS, bins)` matrix averaging FFT bins into rows, lowest frequency first"""
+    nyquist = sample_rate / 2
+    if scale == "linear":
+        edges = np.linspace(0.0, nyquist, TILE_ROWS + 1)
+    elif scale == "log":
+        edges = np.geomspace(MIN_FREQ, nyquist, TILE_ROWS + 1)
+    else:
+        edges = _mel_to_hz(np.linspace(_mel(MIN_FREQ), _mel(nyquist), TILE_ROWS + 1))
+    freqs = np.linspace(0.0, nyquist, N_FFT // 2 + 1)
+    matrix = np.zeros((TILE_ROWS, len(freqs)), dtype=np.float32)
+    for row in range(TILE_ROWS):
+        inside = (freqs >= edges[row]) & (freqs < edges[row + 1])
+        if inside.any():
+            matrix[row, inside] = 1.0 / inside.sum()
+        else:
+            # Narrower than one bin at the bottom of log/mel scales: use the nearest bin
+            matrix[row, np.argmin(np.abs(freqs - (edges[row] + edges[row + 1]) / 2))] = 1.0
+    return matrix
+
+@lru_cache(maxsize=1)
+def _window():
+    return np.hanning(N_FFT).astype(np.float32)
+
+def _windows(source, start, step):
+    """`(channels, TILE_COLUMNS, N_FFT)` centred analysis windows of one tile
+
+    Frames outside the file read as silence.
+    """
+    half = N_FFT // 2
+    if step < N_FFT:
+        lo = start - half
+        hi = start + (TILE_COLUMNS - 1) * step + half
+        span = np.zeros((source.channels, hi - lo), dtype=np.float32)
+        a, b = max(lo, 0), min(hi, source.frames)
+        if b > a:
+            span[:, a - lo:b - lo] = source.read(a, b)
+        return np.lib.stride_tricks.sliding_window_view(span, N_FFT, axis=-1)[:, ::step][:, :TILE_COLUMNS]
+
+    windows = np.zeros((source.channels, TILE_COLUMNS, N_FFT), dtype=np.float32)
+    for column in range(TILE_COLUMNS):
+        lo = start + column * step - half
+        a, b = max(lo, 0), min(lo + N_FFT, source.frames)
+        if b <= a:
+            if lo >= source.frames:
+                break
+            continue
+        windows[:, column, a - lo:b - lo] = source.read(a, b)
+    return windows
+
+def render(audio_path, level, tile, scale="log"):
+    """`(TILE_ROWS, TILE_COLUMNS)` uint8 tile, lowest frequency in row 0"""
+    from services import audio_source
+
+    with audio_source.AudioSource(audio_path) as source:
+        if not 0 <= level < levels(source.frames) or not 0 <= tile < tiles(source.frames, level):
+            raise IndexError("Tile out of range")
+        step = hop(level)
+        with stage_timer(SERVICE, "decode"):
+            windows = _windows(source, tile * TILE_COLUMNS * step, step)
+        with stage_timer(SERVICE, "stft"):
+            spectrum = np.fft.rfft(windows * _window(), axis=-1)
+            power = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=0)
+            # Full-scale sine -> 0 dB
+            power *= (2.0 / _window().sum()) ** 2
+            rows = _projection(source.samplerate, scale) @ power.T.astype(np.float32)
+            db = 10.0 * np.log10(rows + 1e-12)
+            return np.clip((db + DB_RANGE) * (255.0 / DB_RANGE), 0, 255).astype(np.uint8)
+
+def encode_png(pixels):
+    """8-bit grayscale PNG of a `(rows, columns)` uint8 array, top row first"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows, columns = pixels.shape
+    # Filter type 0 (none) at the start of every scanline
+    raw = np.hstack([np.zeros((rows, 1), dtype=np.uint8), pixels]).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+_cache = DiskCache(
+    settings.SPECTROGRAM_CACHE_DIR,
+    settings.SPECTROGRAM_CACHE_MB * 1024 * 1024,
+    suffix=".tile"
+)
+
+def tile(audio_path, level, index, scale="log", fmt="png"):
+    """Encoded tile bytes, from the disk cache or rendered and cached
+
+    Keyed by the file's identity (path, size, mtime) so an overwritten
+    recording never serves old tiles.
+    """
+    stat = os.stat(audio_path)
+    key = (_VERSION, os.path.abspath(audio_path), stat.st_size, stat.st_mtime_ns, level, index, scale, fmt)
+    data = _cache.get(key)
+    record_cache(SERVICE, data is not None)
+    if data is None:
+        pixels = render(audio_path, level, index, scale)
+        if fmt == "png":
+            # Image rows run top-down, so the highest frequency goes first
+            data = encode_png(pixels[::-1])
+        else:
+            data = pixels.tobytes()
+        _cache.put(key, data)
+    return data
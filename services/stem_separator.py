@@ -1,70 +1,290 @@
+"""
+Stem separation with Spleeter, or a filter-bank fallback
+
+Long inputs are cut into overlapping segments that are separated in
+parallel worker processes (each Spleeter run is its own process anyway).
+Every stem is stitched back in order with a linear crossfade across each
+overlap, so memory depends on the segment length and the number of
+workers, not on the track. Both segments separate the overlap on their
+own, so each seam is also checked: the two renderings should agree, and a
+large mismatch means the segments are too short for the model to settle.
+"""
+import logging
+import multiprocessing
 import os
-from pathlib import Path
+import resource
+import shutil
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+import progress
+from metrics import STEM_SEAM_MISMATCH, stage_timer, track_job
+from services.memory_governor import MB, CostModel
+
+SERVICE = "stem_separator"
+
+logger = logging.getLogger(__name__)
+
+STEM_NAMES = ['vocals', 'drums', 'bass', 'other']
+
+def _spleeter(input_path, output_dir, model):
+    """Run the Spleeter CLI; stems land in `output_dir/<input stem>/`"""
+    cmd = [
+        'spleeter',
+        'separate',
+        '-p', f'spleeter:{model}',
+        '-o', output_dir,
+        input_path
+    ]
+    subprocess.run(cmd, check=True, capture_output=True)
+    stems = {}
+    for stem_name in STEM_NAMES:
+        stem_path = os.path.join(output_dir, Path(input_path).stem, f"{stem_name}.wav")
+        if os.path.exists(stem_path):
+            stems[stem_name] = stem_path
+    return stems
+
+def _filter_bank(y, sr):
+    """Frequency-band stems of `(channels, samples)` audio, before normalisation
+
+    The bands come from one complementary crossover (bass < 200 Hz, vocals
+    200-3000 Hz, other above), so they sum back to the input. Drums are the
+    input's transients on top of that: the input is gated by how far a fast
+    envelope of everything above the bass rises over a slow one, which
+    passes onsets and shuts on sustained notes.
+    """
+    from services import dsp
+
+    with stage_timer(SERVICE, "filter_bank"):
+        bass, vocals, other = dsp.split_bands(y, sr, (200, 3000))
+        progress.advance(SERVICE, "filter_bank", 1, 2)
+
+        # Mono detector; the bass band is left out so its cycles don't ripple the fast envelope
+        level = vocals.mean(axis=0)
+        level += other.mean(axis=0)
+        np.abs(level, out=level)
+        # Both envelopes start settled, so a segment cut mid-note doesn't open the gate
+        initial = float(level[:int(0.2 * sr)].mean()) if level.size else 0.0
+        fast = dsp.sosfilt(dsp.butter(1, 50, 'lowpass', sr), level, initial)
+        slow = dsp.sosfilt(dsp.butter(1, 5, 'lowpass', sr), level, initial)
+        fast += 1e-6
+        gain = np.divide(slow, fast, out=slow)
+        np.subtract(1.0, gain, out=gain)
+        np.clip(gain, 0.0, 1.0, out=gain)
+        drums = y * gain
+        progress.advance(SERVICE, "filter_bank", 2, 2)
+    return {'vocals': vocals, 'bass': bass, 'drums': drums, 'other': other}
+
+def _cpu_time():
+    """CPU time of this thread plus the child processes it has waited for (the Spleeter CLI)"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.thread_time() + children.ru_utime + children.ru_stime
+
+def _separate_segment(input_path, output_dir, model, method):
+    """Separate one segment file in a worker process; returns `({stem: path}, CPU seconds)`
+
+    Manual stems are written as float and unnormalised so the stitched
+    stem can be normalised as a whole.
+    """
+    cpu_start = _cpu_time()
+    if method == "spleeter":
+        return _spleeter(input_path, output_dir, model), _cpu_time() - cpu_start
+    from services import audio_io
+
+    y, sr = audio_io.load(input_path, None, SERVICE, mono=False)
+    stems = {}
+    for name, audio in _filter_bank(y, sr).items():
+        stems[name] = os.path.join(output_dir, f"{name}.wav")
+        sf.write(stems[name], audio.T, sr, subtype="FLOAT")
+    return stems, _cpu_time() - cpu_start
 
 class StemSeparator:
+    MEMORY_MODELS = {
+        # Spleeter runs in a subprocess with TensorFlow and the model loaded;
+        # not calibrated here, sized from its documented footprint
+        "separate": CostModel(12.0, overhead_mb=1500),
+        "manual": CostModel(8.8),
+    }
+    # No block-streaming path; long inputs are separated in segments instead
+    STREAMING_OPERATIONS = ()
+
+    # Seconds shared by neighbouring segments, crossfaded when stitching
+    SEGMENT_OVERLAP = 2.0
+    # Seam mismatch (difference energy over signal energy) worth a warning
+    SEAM_TOLERANCE = 0.25
+    # Private memory of a spawned worker before it touches audio (its own imports)
+    WORKER_OVERHEAD = 300 * MB
+
     def __init__(self):
         self.models = ['2stems', '4stems', '5stems']
-    
-    def separate(self, input_path, output_dir, model='4stems'):
-        """Separate audio into stems using Spleeter"""
+
+    def segment_plan(self, duration, sample_rate, channels, budget, segment_seconds=120.0, max_workers=0):
+        """`(workers, estimated peak bytes)` for separating a recording
+
+        Inputs no longer than 1.5 segments are separated whole by one
+        process. Longer ones use as many workers as there are cores and
+        segments, capped so that one segment's estimate per worker fits in
+        `budget` (at least one worker always runs).
+        """
+        model = self.MEMORY_MODELS["separate" if shutil.which("spleeter") else "manual"]
+        if duration <= 1.5 * segment_seconds:
+            return 1, model.estimate(duration, sample_rate, channels)
+        per_segment = self.WORKER_OVERHEAD + model.estimate(
+            duration, sample_rate, channels, stream_seconds=segment_seconds + self.SEGMENT_OVERLAP
+        )
+        step = segment_seconds - self.SEGMENT_OVERLAP
+        segments = int(np.ceil((duration - self.SEGMENT_OVERLAP) / step))
+        workers = min(max_workers or os.cpu_count() or 1, segments, max(int(budget // per_segment), 1))
+        return workers, workers * per_segment
+
+    def separate(self, input_path, output_dir, model='4stems', segment_seconds=120.0, workers=1):
+        """Separate audio into stems using Spleeter
+
+        Inputs longer than 1.5 segments are split and separated by `workers`
+        processes; see the module docstring.
+        """
+        from services import audio_source
+
         Path(output_dir).mkdir(parents=True, exist_ok=True)
-        
-        # Use spleeter command line
-        cmd = [
-            'spleeter',
-            'separate',
-            '-p', f'spleeter:{model}',
-            '-o', output_dir,
-            input_path
-        ]
-        
+        method = "spleeter" if shutil.which("spleeter") else "manual"
+        with audio_source.AudioSource(input_path) as source:
+            if source.duration > 1.5 * segment_seconds:
+                try:
+                    return self._separate_segments(source, output_dir, model, method, segment_seconds, workers)
+                except subprocess.CalledProcessError:
+                    return self._separate_segments(source, output_dir, model, "manual", segment_seconds, workers)
+
+        if method == "manual":
+            # Fallback: manual implementation when spleeter is not installed
+            return self._manual_separation(input_path, output_dir)
         try:
-            subprocess.run(cmd, check=True, capture_output=True)
-        except subprocess.CalledProcessError as e:
-            # Fallback: manual implementation
+            with stage_timer(SERVICE, "spleeter"):
+                stems = _spleeter(input_path, output_dir, model)
+        except (subprocess.CalledProcessError, FileNotFoundError):
             return self._manual_separation(input_path, output_dir)
-        
-        # Return paths to separated stems
-        stems = {}
-        stem_names = ['vocals', 'drums', 'bass', 'other']
-        
-        for stem_name in stem_names:
-            stem_path = os.path.join(output_dir, Path(input_path).stem, f"{stem_name}.wav")
-            if os.path.exists(stem_path):
-                stems[stem_name] = stem_path
-        
+
+        for stem_name, stem_path in stems.items():
+            progress.output(SERVICE, stem_name, stem_path)
+        return stems
+
+    def _segments(self, frames, sr, segment_seconds):
+        """`(start, end)` frames of overlapping segments covering `frames`"""
+        segment = int(segment_seconds * sr)
+        overlap = int(self.SEGMENT_OVERLAP * sr)
+        step = segment - overlap
+        # The last segment always extends past the previous one's overlap
+        count = max(-(-(frames - overlap) // step), 1)
+        return [(k * step, min(k * step + segment, frames)) for k in range(count)]
+
+    def _separate_segments(self, source, output_dir, model, method, segment_seconds, workers):
+        with track_job(SERVICE) as job:
+            sr = source.samplerate
+            job.audio_seconds = source.duration
+            segments = self._segments(source.frames, sr, segment_seconds)
+            workdir = tempfile.mkdtemp(prefix=".segments_", dir=output_dir)
+            try:
+                # Spawned, not forked: the server process has threads and open sockets
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    # Workers start on the first segments while the rest are still being cut
+                    futures = []
+                    for k, (start, end) in enumerate(segments):
+                        path = os.path.join(workdir, f"segment_{k:04d}.wav")
+                        segment_dir = os.path.join(workdir, f"stems_{k:04d}")
+                        os.makedirs(segment_dir)
+                        with stage_timer(SERVICE, "segment"):
+                            sf.write(path, source.read(start, end).T, sr, subtype="FLOAT")
+                        futures.append(pool.submit(_separate_segment, path, segment_dir, model, method))
+                    with stage_timer(SERVICE, method):
+                        results = []
+                        for k, future in enumerate(futures):
+                            # The workers' CPU time is not the calling thread's; report it to the job
+                            segment_stems, cpu_seconds = future.result()
+                            results.append(segment_stems)
+                            job.cpu_seconds += cpu_seconds
+                            progress.advance(SERVICE, "segments", k + 1, len(futures))
+
+                if method == "spleeter":
+                    final_dir = os.path.join(output_dir, Path(source.path).stem)
+                    os.makedirs(final_dir, exist_ok=True)
+                else:
+                    final_dir = output_dir
+                stems = {}
+                for name in results[0]:
+                    stems[name] = os.path.join(final_dir, f"{name}.wav")
+                    with stage_timer(SERVICE, "stitch"):
+                        # Manual stems are normalised like the single-process fallback
+                        self._stitch(name, [r[name] for r in results], stems[name], source.duration,
+                                     0.9 if method == "manual" else None)
+                    progress.output(SERVICE, name, stems[name])
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
         return stems
-    
+
+    def _stitch(self, name, paths, output_path, duration, normalize=None):
+        """Crossfade one stem's segment files into `output_path`, checking every seam
+
+        Segments come back at the separator's rate, which for Spleeter may
+        differ from the input's. With `normalize`, the stitched stem is
+        peak-normalised to that level.
+        """
+        from services import audio_source
+
+        info = sf.info(paths[0])
+        sr, channels = info.samplerate, info.channels
+        overlap = int(self.SEGMENT_OVERLAP * sr)
+        fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+        if normalize is None:
+            out = sf.SoundFile(output_path, "w", samplerate=sr, channels=channels)
+            write = out.write
+        else:
+            out = audio_source.NormalizedWriter(output_path, sr, channels, normalize, SERVICE, eps=1e-8)
+            write = lambda block: out.write(block.T)
+
+        written = 0
+        tail = None
+        with out:
+            for k, path in enumerate(paths):
+                part, _ = sf.read(path, dtype="float32", always_2d=True)
+                if tail is not None:
+                    head = part[:overlap]
+                    mismatch = float(np.sum((head - tail) ** 2) / (np.sum(head ** 2) + np.sum(tail ** 2) + 1e-12))
+                    STEM_SEAM_MISMATCH.observe(mismatch, stem=name)
+                    if mismatch > self.SEAM_TOLERANCE:
+                        logger.warning(f"Seam {k} of {name} mismatches by {mismatch:.3f}; "
+                                       f"segments may be too short for the model")
+                    head *= fade_in
+                    head += tail * (1.0 - fade_in)
+                last = k == len(paths) - 1
+                body = part if last else part[:-overlap]
+                write(body)
+                written += len(body)
+                tail = None if last else part[-overlap:].copy()
+
+        # Resampled segments may each round by a frame
+        expected = duration * sr
+        if abs(written - expected) > len(paths):
+            raise RuntimeError(f"Stitched {name} has {written} frames, expected {expected:.0f}")
+
     def _manual_separation(self, input_path, output_dir):
         """Fallback: Simple frequency-based separation"""
-        import librosa
-        import soundfile as sf
-        import numpy as np
-        from scipy import signal
-        
-        y, sr = librosa.load(input_path, sr=44100)
-        
-        # Vocals (mid frequencies)
-        sos_vocals = signal.butter(4, [200, 3000], 'bandpass', fs=sr, output='sos')
-        vocals = signal.sosfilt(sos_vocals, y)
-        
-        # Bass (low frequencies)
-        sos_bass = signal.butter(4, 200, 'lowpass', fs=sr, output='sos')
-        bass = signal.sosfilt(sos_bass, y)
-        
-        # Drums (transients)
-        drums = y - vocals - bass
-        
-        # Other (high frequencies)
-        sos_other = signal.butter(4, 3000, 'highpass', fs=sr, output='sos')
-        other = signal.sosfilt(sos_other, y)
-        
-        # Save stems
-        stems = {}
-        for name, audio in [('vocals', vocals), ('bass', bass), ('drums', drums), ('other', other)]:
-            path = os.path.join(output_dir, f"{name}.wav")
-            sf.write(path, audio / np.max(np.abs(audio)) * 0.9, sr)
-            stems[name] = path
-        
+        from services import audio_io
+
+        with track_job(SERVICE) as job:
+            y, sr = audio_io.load(input_path, None, SERVICE, mono=False)
+            job.audio_seconds = audio_io.duration(y, sr)
+            bands = _filter_bank(y, sr)
+
+            # Save stems
+            stems = {name: os.path.join(output_dir, f"{name}.wav") for name in bands}
+            outputs = [(name, stems[name], audio) for name, audio in bands.items()]
+            for name, path in audio_io.write_parallel(outputs, sr, SERVICE, target=0.9):
+                progress.output(SERVICE, name, path)
+
         return stems
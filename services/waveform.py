@@ -0,0 +1,154 @@
+"""
+Waveform peak pyramids for drawing
+
+Every stored recording and processed output gets a `<audio file>.peaks`
+file next to it: min/max pairs of the channel-mixed envelope at
+power-of-two zoom levels. Level 0 has one pair per `BASE_FRAMES` frames,
+level `k` one per `BASE_FRAMES * 2**k`, down to a single pair for the whole
+file. Values are 8-bit (sample x 127, rounded outwards so the drawn
+envelope never shrinks), so level 0 of an hour of audio is about 1.2 MB
+and the whole pyramid about twice that.
+
+`build` makes one streaming pass over the audio for level 0 and derives the
+coarser levels from it in memory. `Peaks.slice` reads only the bytes of the
+requested range, so a client drawing a view costs a few kilobytes and no
+decode.
+
+File layout (little-endian): a header (`_HEADER`: magic, version, sample
+rate, channels, frames, base frames, level count), one uint64 pair count
+per level, then each level's `int8` pairs, finest first.
+"""
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from metrics import stage_timer
+
+SERVICE = "waveform"
+
+MAGIC = b"WPKS"
+VERSION = 1
+BASE_FRAMES = 256
+SUFFIX = ".peaks"
+
+_HEADER = struct.Struct("<4sHIHQIH")
+
+def peaks_path(audio_path):
+    return f"{audio_path}{SUFFIX}"
+
+def _quantize(low, high):
+    """`(n, 2)` int8 min/max pairs, rounded away from zero"""
+    pairs = np.empty((len(low), 2), dtype=np.int8)
+    pairs[:, 0] = np.clip(np.floor(low * 127), -128, 127)
+    pairs[:, 1] = np.clip(np.ceil(high * 127), -128, 127)
+    return pairs
+
+def _level0(source):
+    """Min/max of every `BASE_FRAMES` frames over all channels, in one pass"""
+    parts = []
+    # Block size is a multiple of BASE_FRAMES, so only the last block has a partial bucket
+    for block in source.blocks(0, source.frames):
+        n = len(block)
+        full = n - n % BASE_FRAMES
+        if full:
+            buckets = block[:full].reshape(full // BASE_FRAMES, -1)
+            parts.append(_quantize(buckets.min(axis=1), buckets.max(axis=1)))
+        if full < n:
+            rest = block[full:]
+            parts.append(_quantize(np.atleast_1d(rest.min()), np.atleast_1d(rest.max())))
+    return np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.int8)
+
+def _reduce(pairs):
+    """The next coarser level: each pair covers two of `pairs`"""
+    if len(pairs) % 2:
+        pairs = np.concatenate([pairs, pairs[-1:]])
+    pairs = pairs.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+
+def build(audio_path):
+    """Write the peak pyramid for `audio_path` and return its path"""
+    # audio_source pulls in librosa; keep it off the router's import path
+    from services import audio_source
+
+    path = peaks_path(audio_path)
+    with stage_timer(SERVICE, "peaks"), audio_source.AudioSource(audio_path) as source:
+        levels = [_level0(source)]
+        while len(levels[-1]) > 1:
+            levels.append(_reduce(levels[-1]))
+
+        # Written to a temporary file first so readers never see half a pyramid
+        fd, tmp = tempfile.mkstemp(suffix=SUFFIX, dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, VERSION, source.samplerate, source.channels,
+                                     source.frames, BASE_FRAMES, len(levels)))
+                f.write(struct.pack(f"<{len(levels)}Q", *(len(level) for level in levels)))
+                for level in levels:
+                    f.write(level.tobytes())
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    return path
+
+class Peaks:
+    """Header of a `.peaks` file, with range reads of its levels"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, self.sample_rate, self.channels, self.frames, self.base, count = \
+                _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a version {VERSION} peaks file: {path}")
+            self.counts = struct.unpack(f"<{count}Q", f.read(8 * count))
+        self._offsets = []
+        offset = _HEADER.size + 8 * count
+        for n in self.counts:
+            self._offsets.append(offset)
+            offset += 2 * n
+
+    @property
+    def levels(self):
+        return len(self.counts)
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def frames_per_peak(self, level):
+        return self.base << level
+
+    def level_for(self, seconds, pixels):
+        """Finest level with at most `pixels` pairs across `seconds` of audio"""
+        frames = seconds * self.sample_rate
+        for level in range(self.levels):
+            if frames / self.frames_per_peak(level) <= pixels:
+                return level
+        return self.levels - 1
+
+    def slice(self, level, start=0.0, end=None):
+        """`(first pair index, (n, 2) int8 pairs)` covering `[start, end)` seconds at `level`"""
+        if not 0 <= level < self.levels:
+            raise ValueError(f"Level must be between 0 and {self.levels - 1}")
+        step = self.frames_per_peak(level)
+        count = self.counts[level]
+        first = min(max(int(start * self.sample_rate) // step, 0), count)
+        last = count if end is None else min(max(-(-int(end * self.sample_rate) // step), first), count)
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[level] + 2 * first)
+            pairs = np.fromfile(f, dtype=np.int8, count=2 * (last - first)).reshape(-1, 2)
+        return first, pairs
+
+def load(audio_path):
+    """`Peaks` for an audio file, building the pyramid first if it is missing or stale"""
+    path = peaks_path(audio_path)
+    try:
+        stale = os.path.getmtime(path) < os.path.getmtime(audio_path)
+    except OSError:
+        stale = True
+    if stale:
+        build(audio_path)
+    return Peaks(path)
@@ -0,0 +1,285 @@
+"""
+Shared state for multi-worker deployments
+
+Job status, results, rate-limit counters and the demo app's records live
+behind a small key-value interface so any uvicorn/gunicorn worker in a
+container can answer for work started by another. `STATE_BACKEND_URL`
+selects the implementation:
+
+    sqlite:///temp/state.db   shared by every worker on the host (default)
+    memory://                 single process only, for tests and local runs
+
+Values are JSON-serialisable; each entry lives in a namespace and may carry a
+TTL in seconds.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+class StateBackend:
+    """Namespaced key-value store with counters; subclasses implement the primitives"""
+
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def keys(self, namespace):
+        raise NotImplementedError
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        """Atomically add `amount` to a counter and return the new value"""
+        raise NotImplementedError
+
+    # Jobs and results
+
+    def create_job(self, job_id, **fields):
+        job = {"job_id": job_id, "status": "queued", "created_at": time.time(), **fields}
+        self.set("jobs", job_id, job)
+        return job
+
+    def update_job(self, job_id, **fields):
+        job = self.get("jobs", job_id) or {"job_id": job_id}
+        job.update(fields, updated_at=time.time())
+        self.set("jobs", job_id, job)
+        return job
+
+    def get_job(self, job_id):
+        return self.get("jobs", job_id)
+
+    def set_result(self, job_id, result, ttl=None):
+        self.set("results", job_id, result, ttl)
+
+    def get_result(self, job_id):
+        return self.get("results", job_id)
+
+    def delete_job(self, job_id):
+        for seq in range(1, (self.get("event_seq", job_id) or 0) + 1):
+            self.delete("events", f"{job_id}:{seq}")
+        self.delete("event_seq", job_id)
+        self.delete("jobs", job_id)
+        self.delete("results", job_id)
+
+    # Progress events
+
+    def add_event(self, job_id, event, ttl=None):
+        """Append a progress event to a job's log; returns its sequence number (from 1)"""
+        seq = self.incr("event_seq", job_id, ttl=ttl)
+        self.set("events", f"{job_id}:{seq}", event, ttl)
+        return seq
+
+    def get_events(self, job_id, after=0):
+        """`(seq, event)` pairs logged after sequence number `after`, in order"""
+        events = []
+        for seq in range(after + 1, (self.get("event_seq", job_id) or 0) + 1):
+            event = self.get("events", f"{job_id}:{seq}")
+            if event is None:
+                # Numbered but not written yet; the next poll picks it up in order
+                break
+            events.append((seq, event))
+        return events
+
+    # Rate limits
+
+    def hit_rate_limit(self, key, limit, window=60):
+        """Count one hit against a fixed window; returns (allowed, retry_after_seconds)"""
+        now = time.time()
+        window_start = int(now // window) * window
+        count = self.incr("rate_limits", f"{key}:{window_start}", ttl=window * 2)
+        if count <= limit:
+            return True, 0.0
+        return False, window_start + window - now
+
+    def namespace(self, namespace):
+        return Namespace(self, namespace)
+
+class Namespace(MutableMapping):
+    """Dict-like view of one namespace; keys are stored as strings"""
+
+    def __init__(self, backend, namespace):
+        self.backend = backend
+        self.name = namespace
+
+    def __getitem__(self, key):
+        value = self.backend.get(self.name, str(key), _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.set(self.name, str(key), value)
+
+    def __delitem__(self, key):
+        if str(key) not in self:
+            raise KeyError(key)
+        self.backend.delete(self.name, str(key))
+
+    def __contains__(self, key):
+        return self.backend.get(self.name, str(key), _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return iter(self.backend.keys(self.name))
+
+    def __len__(self):
+        return len(self.backend.keys(self.name))
+
+_MISSING = object()
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend; state is not visible to other workers"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, namespace, key):
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < time.time():
+            del self._data[(namespace, key)]
+            return None
+        return entry
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._live(namespace, key)
+        # Round-trip through JSON so callers can't mutate stored state in place
+        return json.loads(entry[0]) if entry else default
+
+    def set(self, namespace, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[(namespace, key)] = (json.dumps(value), expires)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def keys(self, namespace):
+        with self._lock:
+            return [k for (ns, k) in list(self._data) if ns == namespace and self._live(ns, k)]
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        with self._lock:
+            entry = self._live(namespace, key)
+            value = (json.loads(entry[0]) if entry else 0) + amount
+            expires = entry[1] if entry else (time.time() + ttl if ttl else None)
+            self._data[(namespace, key)] = (json.dumps(value), expires)
+            return value
+
+class SQLiteStateBackend(StateBackend):
+    """Backend in a SQLite file shared by all worker processes on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        # A forked worker opens its own connection rather than sharing the parent's
+        os.register_at_fork(after_in_child=self._reset_connections)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_state_expires_at ON state (expires_at)")
+
+    def _reset_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL lets readers in other workers proceed while one worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        """Write transaction; reads run as single autocommit SELECTs and take no write lock"""
+        return _Transaction(self._connection())
+
+    def get(self, namespace, key, default=None):
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?"
+            " AND (expires_at IS NULL OR expires_at >= ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires)
+            )
+
+    def delete(self, namespace, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def keys(self, namespace):
+        rows = self._connection().execute(
+            "SELECT key FROM state WHERE namespace = ?"
+            " AND (expires_at IS NULL OR expires_at >= ?) ORDER BY rowid",
+            (namespace, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET value = value + excluded.value",
+                (namespace, key, json.dumps(amount), now + ttl if ttl else None)
+            )
+            row = conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0])
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT around a block on an autocommit connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def create_state_backend(url):
+    if url.startswith("memory://"):
+        return MemoryStateBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported state backend: {url}")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_state_backend():
+    """Process-wide backend configured by STATE_BACKEND_URL"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_state_backend(os.getenv("STATE_BACKEND_URL", "sqlite:///temp/state.db"))
+    return _backend